@@ -5,6 +5,7 @@ The main modules contain models to handle transducers and transducer arrays, in
 algorithms to calculate physical properties in the `~levitate.fields` module, and some numerical optimization functions in the `~levitate.optimization` module.
 There is also a `~levitate.visualizers` module with some convenience function to show various fields, and some analysis tools in `~levitate.analysis`.
 It is possible to use different materials or material properties from the `~levitate.materials` module.
+Accelerated evaluation of sound fields from large arrays is available in the `~levitate.propagation` module.
 
 The `~levitate.hardware` module includes definitions with array geometries corresponding to some physical prototypes,
 and python-c++ combined setup to control Ultrahaptics physical hardware directly from python.
@@ -16,7 +17,7 @@ import numpy as np
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['transducers', 'arrays', 'hardware', 'materials', 'optimization', 'fields', 'analysis']
+__all__ = ['transducers', 'arrays', 'propagation', 'hardware', 'materials', 'optimization', 'fields', 'analysis']
 
 from . import _version
 __version_info__ = _version.version_info
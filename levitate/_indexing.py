@@ -1,4 +1,7 @@
 """Tools for indexing of spatial derivatives and spherical harmonics."""
+import functools
+import itertools
+import math
 import numpy as np
 
 pressure_derivs_order = ['', 'x', 'y', 'z', 'xx', 'yy', 'zz', 'xy', 'xz', 'yz', 'xxx', 'yyy', 'zzz', 'xxy', 'xxz', 'yyx', 'yyz', 'zzx', 'zzy', 'xyz']
@@ -7,6 +10,31 @@ num_pressure_derivs = [1, 4, 10, 20]
 """Quick access to the number of spatial derivatives up to and including a certain order."""
 
 
+def _product_rule_terms():
+    # Leibniz rule: d^a(fg) = sum_b binom(a, b) d^b(f) d^(a-b)(g), for each axis separately.
+    counts = [tuple(derivative.count(axis) for axis in 'xyz') for derivative in pressure_derivs_order]
+    index = {count: idx for idx, count in enumerate(counts)}
+    terms = []
+    for count in counts:
+        derivative_terms = []
+        for sub_count in itertools.product(*(range(c + 1) for c in count)):
+            coefficient = 1
+            for c, s in zip(count, sub_count):
+                coefficient *= math.factorial(c) // (math.factorial(s) * math.factorial(c - s))
+            rest = tuple(c - s for c, s in zip(count, sub_count))
+            derivative_terms.append((coefficient, index[sub_count], index[rest]))
+        terms.append(derivative_terms)
+    return terms
+
+
+pressure_derivs_product_rule = _product_rule_terms()
+"""Terms in the product rule for each of the spatial derivatives.
+
+For each derivative, a list of `(coefficient, first, second)` tuples, such that
+the derivative of a product `f * g` is the sum of `coefficient * f[first] * g[second]`.
+"""
+
+
 class SphericalHarmonicsIndexer:
     """
     Helper class to index spherical harmonics.
@@ -202,3 +230,69 @@ class SphericalHarmonicsIndexer:
         for idx, order in enumerate(self.orders):
             output[idx] = np.sum(values[self(order, -order):self(order, order) + 1], axis=0)
         return np.moveaxis(output, 0, axis)
+
+
+@functools.lru_cache(maxsize=None)
+def spherical_harmonics_gradient_ladders(max_order):
+    r"""Index and coefficient tables for gradients of spherical harmonics expansions.
+
+    The gradient of an expansion up to `max_order` is calculated from the
+    coefficients one order above and one order below, for each of the
+    ladder directions `'xpiy'`, `'xmiy'`, and `'z'`, i.e. the derivatives
+    :math:`\partial_x + i\partial_y`, :math:`\partial_x - i\partial_y`, and :math:`\partial_z`.
+    Since the modes of each order are stored contiguously, the tables are
+    stored for each order as slices and coefficient arrays.
+    For order `n`, each direction has a tuple
+    `(upper, upper_coefficients, lower_target, lower, lower_coefficients)`
+    such that the derivatives of the coefficients `S` for all modes of the order are::
+
+        dS = upper_coefficients * S[upper]
+        dS[lower_target] += lower_coefficients * S[lower]
+
+    The expansion `S` should be up to order `max_order + 1`.
+
+    Parameters
+    ----------
+    max_order : int
+        The maximum order of the gradient.
+
+    Returns
+    -------
+    ladders : list of dict
+        The tables for each order, with the three directions as keys.
+        The coefficient arrays are read-only.
+
+    """
+    def A(n, m):
+        return ((n + m + 1) * (n + m + 2) / (2 * n + 1) / (2 * n + 3)) ** 0.5
+
+    def B(n, m):
+        return -((n + m + 1) * (n - m + 1) / (2 * n + 1) / (2 * n + 3)) ** 0.5
+
+    terms = {
+        # direction: (mode shift, upper coefficient, lower coefficient)
+        'xpiy': (-1, lambda n, m: A(n, -m), lambda n, m: A(n - 1, m - 1)),
+        'xmiy': (1, lambda n, m: -A(n, m), lambda n, m: -A(n - 1, -m - 1)),
+        'z': (0, lambda n, m: -B(n, m), lambda n, m: B(n - 1, m)),
+    }
+    sph_idx = SphericalHarmonicsIndexer(max_order + 1)
+    ladders = []
+    for n in range(max_order + 1):
+        modes = np.arange(-n, n + 1)
+        order_ladders = {}
+        for direction, (shift, upper_coefficient, lower_coefficient) in terms.items():
+            upper = slice(sph_idx(n + 1, -n + shift), sph_idx(n + 1, n + shift) + 1)
+            upper_coefficients = np.array([upper_coefficient(n, m) for m in modes])
+            # The modes m for which m + shift exists in order n - 1.
+            lower_modes = modes[np.abs(modes + shift) <= n - 1]
+            if len(lower_modes) > 0:
+                lower_target = slice(lower_modes[0] + n, lower_modes[-1] + n + 1)
+                lower = slice(sph_idx(n - 1, lower_modes[0] + shift), sph_idx(n - 1, lower_modes[-1] + shift) + 1)
+            else:
+                lower_target = lower = slice(0, 0)
+            lower_coefficients = np.array([lower_coefficient(n, m) for m in lower_modes])
+            upper_coefficients.flags.writeable = False
+            lower_coefficients.flags.writeable = False
+            order_ladders[direction] = (upper, upper_coefficients, lower_target, lower, lower_coefficients)
+        ladders.append(order_ladders)
+    return ladders
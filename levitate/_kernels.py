@@ -0,0 +1,262 @@
+"""Compiled kernels for the transducer models.
+
+The kernels are compiled with numba if it is installed, otherwise `available`
+is `False` and the transducer models use the vectorized NumPy implementations.
+Each kernel calculates all derivatives for one source-receiver pair at a time,
+so the intermediate values stay in registers instead of being written to
+full size temporary arrays.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+_prange = numba.prange if available else range
+
+_block_size = 512
+_parallel_threshold = 2**16
+
+# Three part representation of pi / 2 for the argument reduction in `_sincos`.
+_pio2_1 = 1.57079632673412561417e+00
+_pio2_2 = 6.07710050630396597660e-11
+_pio2_3 = 2.02226624879595063154e-21
+
+
+def _sincos(x):
+    """Calculate the sine and cosine of a non-negative value.
+
+    Uses Cody-Waite argument reduction to [-pi / 4, pi / 4] and the polynomial
+    kernels from fdlibm. This is several times faster than the libm functions
+    in the compiled kernels, and accurate to a few ulp. Large values, where the
+    reduction is inexact, use the libm functions.
+    """
+    if x > 1e6:
+        return np.sin(x), np.cos(x)
+    # Truncation is rounding down for non-negative values.
+    quadrant = np.int64(x * 0.6366197723675814 + 0.5)
+    n = np.float64(quadrant)
+    y = ((x - n * _pio2_1) - n * _pio2_2) - n * _pio2_3
+    y2 = y * y
+    sin = y + y * y2 * (-1.66666666666666324348e-01 + y2 * (8.33333333332248946124e-03 + y2 * (
+        -1.98412698298579493134e-04 + y2 * (2.75573137070700676789e-06 + y2 * (-2.50507602534068634195e-08 + y2 * 1.58969099521155010221e-10)))))
+    cos = 1 - 0.5 * y2 + y2 * y2 * (4.16666666666666019037e-02 + y2 * (-1.38888888888741095749e-03 + y2 * (
+        2.48015872894767294178e-05 + y2 * (-2.75573143513906633035e-07 + y2 * (2.08757232129817482790e-09 + y2 * -1.13596475577881948265e-11)))))
+    # Branchless selection of the quadrant.
+    odd = quadrant & 1
+    sin_sign = 1 - 2 * ((quadrant >> 1) & 1)
+    cos_sign = 1 - 2 * (((quadrant + 1) >> 1) & 1)
+    return sin_sign * (cos if odd else sin), cos_sign * (sin if odd else cos)
+
+
+def _pressure_derivs(source_positions, source_normals, receiver_positions, cosine_derivatives, k, p0, out):
+    # The output is indexed with the flattened source-receiver pairs, and split in blocks of pairs.
+    num_pairs = out.shape[1]
+    for block in _prange((num_pairs + _block_size - 1) // _block_size):
+        first_pair = block * _block_size
+        _pressure_derivs_block(source_positions, source_normals, receiver_positions, cosine_derivatives, k, p0, out,
+                               first_pair, min(first_pair + _block_size, num_pairs))
+
+
+def _pressure_derivs_block(source_positions, source_normals, receiver_positions, cosine_derivatives, k, p0, out, first_pair, last_pair):
+    # Separate function for the work in each parallel iteration, which is not transformed by the parallel compiler.
+    num_derivs = out.shape[0]
+    directional = cosine_derivatives.shape[0] > 0
+    num_receivers = receiver_positions.shape[1]
+    # The results are collected for the block, since writing to many components at once is slow.
+    results = np.empty((num_derivs, last_pair - first_pair), dtype=np.complex128)
+    w = np.zeros(20, dtype=np.complex128)
+    d = np.zeros(20)
+    source = first_pair // num_receivers
+    receiver = first_pair % num_receivers - 1
+    for local in range(last_pair - first_pair):
+        receiver += 1
+        if receiver == num_receivers:
+            receiver = 0
+            source += 1
+        x = receiver_positions[0, receiver] - source_positions[0, source]
+        y = receiver_positions[1, receiver] - source_positions[1, source]
+        z = receiver_positions[2, receiver] - source_positions[2, source]
+        r2 = x * x + y * y + z * z
+        r2_inv = 1 / r2
+        r = np.sqrt(r2)
+        kr = k * r
+
+        # The derivatives of G = exp(jkr) / r are polynomials in jkr, times G / r^(2n).
+        sin, cos = _sincos(kr)
+        green = complex(cos, sin) * (p0 / r)
+        w[0] = green
+        if num_derivs > 1:
+            base = green * r2_inv
+            coeff_1 = complex(-1, kr) * base
+            w[1] = coeff_1 * x
+            w[2] = coeff_1 * y
+            w[3] = coeff_1 * z
+        if num_derivs > 4:
+            base = base * r2_inv
+            coeff_2 = complex(3 - kr * kr, -3 * kr) * base
+            w[4] = coeff_2 * (x * x) + coeff_1
+            w[5] = coeff_2 * (y * y) + coeff_1
+            w[6] = coeff_2 * (z * z) + coeff_1
+            w[7] = coeff_2 * (x * y)
+            w[8] = coeff_2 * (x * z)
+            w[9] = coeff_2 * (y * z)
+        if num_derivs > 10:
+            base = base * r2_inv
+            coeff_3 = complex(6 * kr * kr - 15, (15 - kr * kr) * kr) * base
+            w[10] = (coeff_3 * (x * x) + 3 * coeff_2) * x
+            w[11] = (coeff_3 * (y * y) + 3 * coeff_2) * y
+            w[12] = (coeff_3 * (z * z) + 3 * coeff_2) * z
+            w[13] = (coeff_3 * (x * x) + coeff_2) * y
+            w[14] = (coeff_3 * (x * x) + coeff_2) * z
+            w[15] = (coeff_3 * (y * y) + coeff_2) * x
+            w[16] = (coeff_3 * (y * y) + coeff_2) * z
+            w[17] = (coeff_3 * (z * z) + coeff_2) * x
+            w[18] = (coeff_3 * (z * z) + coeff_2) * y
+            w[19] = coeff_3 * (x * y * z)
+        if not directional:
+            for idx in range(num_derivs):
+                results[idx, local] = w[idx]
+            continue
+
+        # Chain rule for directivities depending on the cosine of the angle to the normal,
+        # with the same expressions as `~levitate.transducers._axisymmetric_directivity_derivatives`.
+        nx, ny, nz = source_normals[0, source], source_normals[1, source], source_normals[2, source]
+        dot = x * nx + y * ny + z * nz
+        r_inv = 1 / r
+        d[0] = cosine_derivatives[0, source, receiver]
+        if num_derivs > 1:
+            d_1 = cosine_derivatives[1, source, receiver]
+            r3_inv = r2_inv * r_inv
+            cx = (r2 * nx - x * dot) * r3_inv
+            cy = (r2 * ny - y * dot) * r3_inv
+            cz = (r2 * nz - z * dot) * r3_inv
+            d[1] = d_1 * cx
+            d[2] = d_1 * cy
+            d[3] = d_1 * cz
+        if num_derivs > 4:
+            d_2 = cosine_derivatives[2, source, receiver]
+            r5_inv = r3_inv * r2_inv
+            cxx = (3 * x * x * dot - 2 * x * nx * r2 - dot * r2) * r5_inv
+            cyy = (3 * y * y * dot - 2 * y * ny * r2 - dot * r2) * r5_inv
+            czz = (3 * z * z * dot - 2 * z * nz * r2 - dot * r2) * r5_inv
+            cxy = (3 * x * y * dot - r2 * (nx * y + ny * x)) * r5_inv
+            cxz = (3 * x * z * dot - r2 * (nx * z + nz * x)) * r5_inv
+            cyz = (3 * y * z * dot - r2 * (ny * z + nz * y)) * r5_inv
+            d[4] = d_2 * cx * cx + d_1 * cxx
+            d[5] = d_2 * cy * cy + d_1 * cyy
+            d[6] = d_2 * cz * cz + d_1 * czz
+            d[7] = d_2 * cx * cy + d_1 * cxy
+            d[8] = d_2 * cx * cz + d_1 * cxz
+            d[9] = d_2 * cy * cz + d_1 * cyz
+        if num_derivs > 10:
+            d_3 = cosine_derivatives[3, source, receiver]
+            r4 = r2 * r2
+            r7_inv = r5_inv * r2_inv
+            cxxx = (-15 * x**3 * dot + 9 * r2 * (x * x * nx + x * dot) - 3 * r4 * nx) * r7_inv
+            cyyy = (-15 * y**3 * dot + 9 * r2 * (y * y * ny + y * dot) - 3 * r4 * ny) * r7_inv
+            czzz = (-15 * z**3 * dot + 9 * r2 * (z * z * nz + z * dot) - 3 * r4 * nz) * r7_inv
+            cxxy = (-15 * x * x * y * dot + 3 * r2 * (x * x * ny + 2 * x * y * nx + y * dot) - r4 * ny) * r7_inv
+            cxxz = (-15 * x * x * z * dot + 3 * r2 * (x * x * nz + 2 * x * z * nx + z * dot) - r4 * nz) * r7_inv
+            cyyx = (-15 * y * y * x * dot + 3 * r2 * (y * y * nx + 2 * y * x * ny + x * dot) - r4 * nx) * r7_inv
+            cyyz = (-15 * y * y * z * dot + 3 * r2 * (y * y * nz + 2 * y * z * ny + z * dot) - r4 * nz) * r7_inv
+            czzx = (-15 * z * z * x * dot + 3 * r2 * (z * z * nx + 2 * z * x * nz + x * dot) - r4 * nx) * r7_inv
+            czzy = (-15 * z * z * y * dot + 3 * r2 * (z * z * ny + 2 * z * y * nz + y * dot) - r4 * ny) * r7_inv
+            cxyz = (-15 * x * y * z * dot + 3 * r2 * (nx * y * z + ny * x * z + nz * x * y)) * r7_inv
+            d[10] = d_3 * cx**3 + 3 * d_2 * cxx * cx + d_1 * cxxx
+            d[11] = d_3 * cy**3 + 3 * d_2 * cyy * cy + d_1 * cyyy
+            d[12] = d_3 * cz**3 + 3 * d_2 * czz * cz + d_1 * czzz
+            d[13] = d_3 * cx * cx * cy + d_2 * (cxx * cy + 2 * cxy * cx) + d_1 * cxxy
+            d[14] = d_3 * cx * cx * cz + d_2 * (cxx * cz + 2 * cxz * cx) + d_1 * cxxz
+            d[15] = d_3 * cy * cy * cx + d_2 * (cyy * cx + 2 * cxy * cy) + d_1 * cyyx
+            d[16] = d_3 * cy * cy * cz + d_2 * (cyy * cz + 2 * cyz * cy) + d_1 * cyyz
+            d[17] = d_3 * cz * cz * cx + d_2 * (czz * cx + 2 * cxz * cz) + d_1 * czzx
+            d[18] = d_3 * cz * cz * cy + d_2 * (czz * cy + 2 * cyz * cz) + d_1 * czzy
+            d[19] = d_3 * cx * cy * cz + d_2 * (cx * cyz + cy * cxz + cz * cxy) + d_1 * cxyz
+
+        # Product rule, see `~levitate._indexing.pressure_derivs_product_rule`.
+        results[0, local] = w[0] * d[0]
+        if num_derivs > 1:
+            results[1, local] = w[1] * d[0] + w[0] * d[1]
+            results[2, local] = w[2] * d[0] + w[0] * d[2]
+            results[3, local] = w[3] * d[0] + w[0] * d[3]
+        if num_derivs > 4:
+            results[4, local] = w[4] * d[0] + 2 * w[1] * d[1] + w[0] * d[4]
+            results[5, local] = w[5] * d[0] + 2 * w[2] * d[2] + w[0] * d[5]
+            results[6, local] = w[6] * d[0] + 2 * w[3] * d[3] + w[0] * d[6]
+            results[7, local] = w[7] * d[0] + w[1] * d[2] + w[2] * d[1] + w[0] * d[7]
+            results[8, local] = w[8] * d[0] + w[1] * d[3] + w[3] * d[1] + w[0] * d[8]
+            results[9, local] = w[9] * d[0] + w[2] * d[3] + w[3] * d[2] + w[0] * d[9]
+        if num_derivs > 10:
+            results[10, local] = w[10] * d[0] + 3 * (w[4] * d[1] + w[1] * d[4]) + w[0] * d[10]
+            results[11, local] = w[11] * d[0] + 3 * (w[5] * d[2] + w[2] * d[5]) + w[0] * d[11]
+            results[12, local] = w[12] * d[0] + 3 * (w[6] * d[3] + w[3] * d[6]) + w[0] * d[12]
+            results[13, local] = w[13] * d[0] + w[4] * d[2] + 2 * (w[7] * d[1] + w[1] * d[7]) + w[2] * d[4] + w[0] * d[13]
+            results[14, local] = w[14] * d[0] + w[4] * d[3] + 2 * (w[8] * d[1] + w[1] * d[8]) + w[3] * d[4] + w[0] * d[14]
+            results[15, local] = w[15] * d[0] + w[5] * d[1] + 2 * (w[7] * d[2] + w[2] * d[7]) + w[1] * d[5] + w[0] * d[15]
+            results[16, local] = w[16] * d[0] + w[5] * d[3] + 2 * (w[9] * d[2] + w[2] * d[9]) + w[3] * d[5] + w[0] * d[16]
+            results[17, local] = w[17] * d[0] + w[6] * d[1] + 2 * (w[8] * d[3] + w[3] * d[8]) + w[1] * d[6] + w[0] * d[17]
+            results[18, local] = w[18] * d[0] + w[6] * d[2] + 2 * (w[9] * d[3] + w[3] * d[9]) + w[2] * d[6] + w[0] * d[18]
+            results[19, local] = (w[19] * d[0] + w[7] * d[3] + w[8] * d[2] + w[9] * d[1]
+                                  + w[1] * d[9] + w[2] * d[8] + w[3] * d[7] + w[0] * d[19])
+    for idx in range(num_derivs):
+        for local in range(last_pair - first_pair):
+            out[idx, first_pair + local] = results[idx, local]
+
+
+if available:
+    _sincos = numba.njit(cache=True, error_model='numpy')(_sincos)
+    _pressure_derivs_block = numba.njit(cache=True, error_model='numpy')(_pressure_derivs_block)
+    # Starting the threads has a noticeable overhead, so small problems use a serial version.
+    _pressure_derivs_serial = numba.njit(cache=True, error_model='numpy')(_pressure_derivs)
+    _pressure_derivs = numba.njit(parallel=True, cache=True, error_model='numpy')(_pressure_derivs)
+
+
+def pressure_derivs(source_positions, source_normals, receiver_positions, cosine_derivatives, k, p0, out):
+    """Calculate the spatial derivatives of the pressure from point sources with axisymmetric directivities.
+
+    Parameters
+    ----------
+    source_positions : numpy.ndarray
+        The location of the transducers, shape (3, N).
+    source_normals : numpy.ndarray
+        The normalized look direction of the transducers, shape (3, N).
+    receiver_positions : numpy.ndarray
+        The location(s) at which to evaluate the radiation, shape (3, M).
+    cosine_derivatives : numpy.ndarray or None
+        The directivity and its derivatives with respect to the cosine of the
+        angle to the normal, shape (orders + 1, N, M). `None` for omnidirectional sources.
+    k : float
+        The wavenumber.
+    p0 : float
+        The source strength.
+    out : numpy.ndarray
+        Array to store the derivatives in, shape (`num_pressure_derivs[orders]`, N, M).
+        The number of derivatives decides the orders which are calculated.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The calculated derivatives.
+
+    """
+    source_positions = np.ascontiguousarray(source_positions, dtype=np.float64)
+    receiver_positions = np.ascontiguousarray(receiver_positions, dtype=np.float64)
+    if cosine_derivatives is None:
+        source_normals = np.zeros((3, 1))
+        cosine_derivatives = np.zeros((0, 1, 1))
+    source_normals = np.ascontiguousarray(source_normals, dtype=np.float64)
+    kernel = _pressure_derivs if out.shape[1] * out.shape[2] >= _parallel_threshold else _pressure_derivs_serial
+    flat_out = out.reshape(out.shape[0], -1)
+    if np.iscomplexobj(cosine_derivatives):
+        # The kernel needs real directivities, and is linear in the directivity.
+        kernel(source_positions, source_normals, receiver_positions, np.ascontiguousarray(cosine_derivatives.real, dtype=np.float64), float(k), float(p0), flat_out)
+        imaginary = np.empty(flat_out.shape, dtype=np.complex128)
+        kernel(source_positions, source_normals, receiver_positions, np.ascontiguousarray(cosine_derivatives.imag, dtype=np.float64), float(k), float(p0), imaginary)
+        flat_out += 1j * imaginary
+        return out
+    kernel(source_positions, source_normals, receiver_positions, np.ascontiguousarray(cosine_derivatives, dtype=np.float64), float(k), float(p0), flat_out)
+    return out
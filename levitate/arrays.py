@@ -11,11 +11,24 @@ simplify the creation of the transducer positions for common array geometries.
     RectangularArray
     SphericalCapArray
     DoublesidedArray
+    RequestCache
+    SparseRequest
+    ArraySymmetry
 
 """
 
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import os
+import pickle
 import numpy as np
-from . import _indexing
+import scipy.sparse
+import scipy.sparse.csgraph
+import scipy.spatial
+from . import _indexing, transducers
+from .materials import Material
 
 
 class TransducerArray:
@@ -32,6 +45,11 @@ class TransducerArray:
         The normals of the transducer elements in the array, shape 3xN.
     transducer
         An object of `levitate.transducers.TransducerModel` or a subclass. If passed a class it will create a new instance.
+    medium : Material, optional
+        The medium in which the array is operating, passed to the transducer model.
+    precision : {'double', 'single'}, optional
+        The floating point precision of the calculations, passed to the transducer model.
+        Single precision halves the memory used by requests and fields.
     **kwargs :
         All additional keyword arguments will be passed to the a transducer class
         used when instantiating a new transducer model. Note that this will have
@@ -55,15 +73,43 @@ class TransducerArray:
         Wavenumber in air, corresponding to `freq`.
     wavelength : float
         Wavelength in air, corresponding to `freq`.
+    precision : str
+        The floating point precision of the transducer model, 'single' or 'double'.
+    request_cache : RequestCache or None
+        Cache used to store evaluated requests, see `request`.
+        Default `None`, i.e. no caching.
+    num_workers : int
+        The number of threads used to evaluate requests, see `request`.
+        Default 1, i.e. no parallel evaluation.
+    sparse_threshold : float or None
+        Relative magnitude below which transducer contributions are dropped
+        from pressure derivative requests, see `request`.
+        Default `None`, i.e. dense requests.
+    use_symmetries : bool
+        If the symmetries of the array are used to evaluate pressure derivative
+        requests, see `symmetries`. Default `False`.
+    use_lattice : bool
+        If pressure derivative requests on regular grids of positions are evaluated
+        using a lookup table over the differences between the transducer and
+        receiver positions. This applies to arrays where all transducers have the
+        same normal, e.g. `RectangularArray`, when the transducer positions are
+        (mostly) on the same lattice as the grid, and to the `PointSource`, `CircularPiston`,
+        `CircularRing`, `TabulatedTransducer`, and `PlaneWaveTransducer` models, where the
+        field only depends on the difference between the positions. Default `False`.
 
     """
 
     _repr_fmt_spec = '{:%cls(transducer=%transducer_full,\n\tpositions=%positions,\n\tnormals=%normals)}'
     _str_fmt_spec = '{:%cls(transducer=%transducer): %num_transducers transducers}'
+    request_cache = None
+    num_workers = 1
+    sparse_threshold = None
+    use_symmetries = False
+    use_lattice = False
     from .visualizers import ArrayVisualizer, ForceDiagram
 
     def __init__(self, positions, normals,
-                 transducer=None, medium=None,
+                 transducer=None, medium=None, precision=None,
                  **kwargs
                  ):
         if 'transducer_size' in kwargs:
@@ -78,6 +124,8 @@ class TransducerArray:
             self.transducer = transducer
         if medium is not None:
             self.medium = medium
+        if precision is not None:
+            self.precision = precision
 
         self.positions = positions
         self.normals = normals
@@ -170,6 +218,14 @@ class TransducerArray:
     def medium(self, val):
         self.transducer.medium = val
 
+    @property
+    def precision(self):
+        return self.transducer.precision
+
+    @precision.setter
+    def precision(self, val):
+        self.transducer.precision = val
+
     @property
     def transducer_size(self):
         return self.transducer.physical_size
@@ -189,6 +245,8 @@ class TransducerArray:
             raise ValueError('Cannot set position to these values, the first axis must have length 3 and represent the [x,y,z] coordinates!')
         self._positions = val
         self._num_transducers = val.shape[1]
+        self._spatial_index = None
+        self._symmetries = None
 
     @property
     def normals(self):
@@ -206,6 +264,7 @@ class TransducerArray:
         elif val.shape[1] != self.num_transducers:
             raise ValueError('The array needs to have the same number of normals as transducers!')
         self._normals = val / np.sum(val**2, axis=0)**0.5
+        self._symmetries = None
 
     @property
     def num_transducers(self):
@@ -214,6 +273,127 @@ class TransducerArray:
         except AttributeError:
             return 0
 
+    @property
+    def spatial_index(self):
+        """KD-tree over the transducer positions.
+
+        The tree is built the first time it is used, and rebuilt after the
+        positions are set. Modifying the positions in place will not update the tree.
+        """
+        if self._spatial_index is None:
+            self._spatial_index = scipy.spatial.cKDTree(self.positions.T)
+        return self._spatial_index
+
+    @property
+    def symmetries(self):
+        """Symmetries of the array.
+
+        The coordinate permutations and sign flips around the center of the array
+        which map the transducer positions and normals onto themselves, as a list of
+        `ArraySymmetry` objects. The first element is always the identity.
+        The symmetries are found the first time they are used, and again after the
+        positions or normals are set.
+
+        When `use_symmetries` is set, requests for pressure derivatives at positions
+        which are mapped onto themselves by some of the symmetries only evaluate one
+        transducer from each group of equivalent transducers. The others are then found
+        by permuting the positions and the derivative components. This is only done for
+        `CircularPiston`, `CircularRing`, and `TabulatedTransducer` models when they are not
+        evaluated with the compiled kernels, for requests with at least 2**16 combinations
+        of transducers and positions.
+        """
+        if self._symmetries is None:
+            self._symmetries = self._find_symmetries()
+            self._symmetry_orbits = {}
+        return self._symmetries
+
+    def _find_symmetries(self):
+        center = np.mean(self.positions, axis=1)
+        tolerance = 1e-9 * max(np.max(np.abs(self.positions - center[:, None])), 1e-3)
+        symmetries = []
+        for axes in itertools.permutations(range(3)):
+            for signs in itertools.product((1, -1), repeat=3):
+                rotation = np.zeros((3, 3))
+                rotation[[0, 1, 2], axes] = signs
+                symmetry = ArraySymmetry(rotation, center)
+                distance, permutation = self.spatial_index.query(symmetry.transform(self.positions).T, distance_upper_bound=tolerance)
+                if not np.all(np.isfinite(distance)) or len(np.unique(permutation)) != self.num_transducers:
+                    continue
+                if not np.allclose(rotation @ self.normals, self.normals[:, permutation], atol=1e-9):
+                    continue
+                symmetry.permutation = permutation
+                symmetries.append(symmetry)
+        return symmetries
+
+    def transducers_within(self, position, radius):
+        """Find the transducers within a distance from a position.
+
+        Parameters
+        ----------
+        position : array_like
+            Three element array with the position to search around.
+        radius : float
+            The maximum distance from the position.
+
+        Returns
+        -------
+        indices : numpy.ndarray
+            The sorted indices of the transducers within the radius.
+
+        """
+        position = np.asarray(position).reshape(3)
+        return np.array(sorted(self.spatial_index.query_ball_point(position, radius)), dtype=int)
+
+    def nearest_transducers(self, position, num=1):
+        """Find the transducers closest to one or more positions.
+
+        Parameters
+        ----------
+        position : array_like
+            The position(s) to search around, with the first dimension having 3 elements.
+        num : int
+            The number of transducers to find for each position, default 1.
+
+        Returns
+        -------
+        indices : numpy.ndarray
+            The indices of the closest transducers, ordered by distance.
+            The first dimension has `num` elements, and the remaining
+            dimensions are the same as the `position` input with the first dimension removed.
+        distances : numpy.ndarray
+            The distances to the transducers, same shape as `indices`.
+
+        """
+        position = np.asarray(position)
+        num = min(num, self.num_transducers)
+        distances, indices = self.spatial_index.query(position.reshape(3, -1).T, k=[*range(1, num + 1)])
+        shape = (num,) + position.shape[1:]
+        return indices.T.reshape(shape), distances.T.reshape(shape)
+
+    def transducer_clusters(self, distance):
+        """Group the transducers in clusters of neighbouring elements.
+
+        Two transducers are in the same cluster if they are connected through
+        a chain of transducers, with at most `distance` between each link.
+        This will e.g. separate the panels in a multi-panel array.
+
+        Parameters
+        ----------
+        distance : float
+            The maximum distance between neighbouring transducers in a cluster.
+
+        Returns
+        -------
+        labels : numpy.ndarray
+            The cluster label of each transducer, numbered from 0 in the order of
+            the first transducer in each cluster.
+
+        """
+        pairs = self.spatial_index.query_pairs(distance, output_type='ndarray')
+        graph = scipy.sparse.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(self.num_transducers, self.num_transducers))
+        _, labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+        return labels
+
     def focus_phases(self, focus):
         """Focuses the phases to create a focus point.
 
@@ -258,11 +438,13 @@ class TransducerArray:
         focus_phases = self.focus_phases(position)
         return np.mod(phases - focus_phases + np.pi, 2 * np.pi) - np.pi
 
-    def pressure_derivs(self, positions, orders=3):
+    def pressure_derivs(self, positions, orders=3, out=None, workspace=None, geometry=None, wavenumbers=None):
         """Calculate derivatives of the pressure.
 
         Calculates the spatial derivatives of the pressure from all individual
         transducers in a Cartesian coordinate system.
+        Repeated evaluations with the same shapes can avoid allocating new memory
+        by passing a preallocated output array and a `~levitate.transducers.Workspace`.
 
         Parameters
         ----------
@@ -271,6 +453,15 @@ class TransducerArray:
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        out : numpy.ndarray, optional
+            Preallocated complex array to store the derivatives in, with the shape described below.
+        workspace : `~levitate.transducers.Workspace`, optional
+            Storage for intermediate arrays, reused between calls.
+        geometry : `~levitate.transducers.SourceReceiverGeometry`, optional
+            Precalculated geometry for the transducers and the positions.
+        wavenumbers : array_like, optional
+            Evaluate for these wavenumbers instead of the wavenumber of the transducer model.
+            The distances and angles are only calculated once for all the wavenumbers.
 
         Returns
         -------
@@ -278,11 +469,18 @@ class TransducerArray:
             Array with the calculated derivatives. Has the shape (M, N, ...) where M is the number of spatial derivatives,
             and N is the number of transducers, see `num_spatial_derivatives` and `spatial_derivative_order`,
             and the remaining dimensions are the same as the `positions` input with the first dimension removed.
+            If `wavenumbers` is given, the derivatives for each wavenumber are stacked along a new first axis.
 
         """
-        return self.transducer.pressure_derivs(self.positions, self.normals, positions, orders)
-
-    def spherical_harmonics(self, positions, orders=0):
+        if wavenumbers is not None:
+            return self.transducer._evaluate_wavenumbers('pressure_derivs', wavenumbers, self.positions, self.normals, positions, orders,
+                                                         out=out, workspace=workspace, geometry=geometry)
+        kwargs = transducers._geometry_kwargs(self.transducer.pressure_derivs, geometry)
+        if out is not None or workspace is not None:
+            kwargs.update(out=out, workspace=workspace)
+        return self.transducer.pressure_derivs(self.positions, self.normals, positions, orders, **kwargs)
+
+    def spherical_harmonics(self, positions, orders=0, geometry=None):
         """Spherical harmonics expansion of transducer sound fields.
 
         The sound fields generated by the individual transducers in the array are expanded
@@ -298,6 +496,8 @@ class TransducerArray:
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int, default 0
             The maximum order to expand to.
+        geometry : `~levitate.transducers.SourceReceiverGeometry`, optional
+            Precalculated geometry for the transducers and the positions.
 
         Return
         ------
@@ -309,9 +509,30 @@ class TransducerArray:
             the same as the `positions` input with the first dimension removed.
 
         """
-        return self.transducer.spherical_harmonics(self.positions, self.normals, positions, orders)
+        kwargs = transducers._geometry_kwargs(self.transducer.spherical_harmonics, geometry)
+        return self.transducer.spherical_harmonics(self.positions, self.normals, positions, orders, **kwargs)
+
+    def geometry(self, positions):
+        """Create the geometry for the transducers and a set of positions.
+
+        The geometry keeps the distances and angles from the transducers to the
+        positions, which can be reused for multiple requests at the same positions,
+        see `request`.
 
-    def request(self, requests, position):
+        Parameters
+        ----------
+        positions : numpy.ndarray
+            The location(s) of interest, shape (3, ...).
+
+        Returns
+        -------
+        geometry : `~levitate.transducers.SourceReceiverGeometry`
+            The geometry for the transducers in the array and the positions.
+
+        """
+        return transducers.SourceReceiverGeometry(self.positions, self.normals, positions, dtype=np.finfo(self.transducer.dtype).dtype)
+
+    def request(self, requests, position, num_workers=None, geometry=None, sparse_threshold=None):
         """Evaluate a set of requests.
 
         This takes a mapping (e.g. dict) of requests, and evaluates them
@@ -335,13 +556,51 @@ class TransducerArray:
                     Spherical harmonics coefficients for an expansion of the pressure.
                     Should contain the maximum order of expansion, see `spherical_harmonics`.
 
+        num_workers : int, optional
+            The number of threads to use. The positions are split in equal parts which
+            are evaluated in parallel. Defaults to the `num_workers` attribute of the array.
+        geometry : `~levitate.transducers.SourceReceiverGeometry`, optional
+            A geometry from `geometry`, kept between requests at the same positions.
+            Reusing the geometry avoids calculating the distances and angles again,
+            e.g. when only the wavenumber has changed. Not used for parallel evaluation,
+            or for pressure derivatives evaluated with the lookup tables, see `use_lattice`.
+        sparse_threshold : float, optional
+            Evaluate the pressure derivatives as a `SparseRequest`, dropping the
+            transducer contributions with a magnitude below this fraction of the
+            largest contribution at the same position. Defaults to the `sparse_threshold`
+            attribute of the array. The positions are evaluated in chunks, so the dense
+            derivatives for all positions are never stored.
+
         Returns
         -------
         evaluated_requests : dict
             A dictionary of the set of calculated data, according to the requests.
 
+        Note
+        ----
+        If the array has a `request_cache`, the evaluated requests are looked up
+        in the cache before they are calculated. The cached arrays are read-only.
+        Sparse requests are neither cached nor evaluated in parallel.
+
         """
         position = np.asarray(position)
+        parsed_requests = self._parse_requests(requests)
+        sparse_threshold = self.sparse_threshold if sparse_threshold is None else sparse_threshold
+        if sparse_threshold is not None and 'pressure_derivs' in parsed_requests:
+            return self._evaluate_sparse_requests(parsed_requests, position, sparse_threshold)
+
+        cache = self.request_cache
+        if cache is not None:
+            cache_key = cache.key(self, parsed_requests, position)
+            evaluated_requests = cache.get(cache_key, parsed_requests.keys())
+            if evaluated_requests is not None:
+                return evaluated_requests
+            evaluated_requests = self._evaluate_requests(parsed_requests, position, num_workers, geometry=geometry)
+            cache.store(cache_key, evaluated_requests)
+            return evaluated_requests
+        return self._evaluate_requests(parsed_requests, position, num_workers, geometry=geometry)
+
+    def _parse_requests(self, requests):
         parsed_requests = {}
         for key, value in requests.items():
             if key.find('pressure_derivs') > -1:
@@ -353,54 +612,256 @@ class TransducerArray:
                 parsed_requests['spherical_harmonics'] = max(value, parsed_requests.get('spherical_harmonics', -1))
             elif key != 'complex_transducer_amplitudes':
                 raise ValueError("Unknown request from `TransducerArray`: '{}'".format(key))
+        return parsed_requests
+
+    def _request_nbytes(self, requests):
+        """Estimate the memory needed to evaluate a set of requests at a single position."""
+        parsed_requests = self._parse_requests(requests)
+        components = 0
+        if 'pressure_derivs' in parsed_requests:
+            components += _indexing.num_pressure_derivs[parsed_requests['pressure_derivs']]
+        if 'spherical_harmonics' in parsed_requests:
+            components += len(_indexing.SphericalHarmonicsIndexer(parsed_requests['spherical_harmonics']))
+        if 'spherical_harmonics_gradient' in parsed_requests:
+            components += 3 * len(_indexing.SphericalHarmonicsIndexer(parsed_requests['spherical_harmonics_gradient']))
+        return components * self.num_transducers * self.transducer.dtype.itemsize
+
+    def _evaluate_requests(self, parsed_requests, position, num_workers=None, geometry=None):
+        num_workers = self.num_workers if num_workers is None else num_workers
+        num_positions = int(np.prod(position.shape[1:]))
+        if num_workers > 1 and num_positions > 1:
+            return self._evaluate_requests_parallel(parsed_requests, position, min(num_workers, num_positions))
 
+        parsed_requests = dict(parsed_requests)
         evaluated_requests = {}
+        # The distances and angles are calculated once, and shared by all requests.
+        if geometry is None or not geometry.matches(self.positions, self.normals, position):
+            geometry = self.geometry(position)
         if 'pressure_derivs' in parsed_requests:
-            evaluated_requests['pressure_derivs'] = self.pressure_derivs(position, orders=parsed_requests.pop('pressure_derivs'))
+            orders = parsed_requests.pop('pressure_derivs')
+            derivatives = self._lattice_pressure_derivs(position, orders) if self.use_lattice else None
+            if derivatives is None and self.use_symmetries:
+                derivatives = self._symmetric_pressure_derivs(position, orders)
+            if derivatives is None:
+                derivatives = self.pressure_derivs(position, orders=orders, geometry=geometry)
+            evaluated_requests['pressure_derivs'] = derivatives
         if 'spherical_harmonics' in parsed_requests:
-            evaluated_requests['spherical_harmonics'] = self.spherical_harmonics(position, orders=parsed_requests.pop('spherical_harmonics'))
+            evaluated_requests['spherical_harmonics'] = self.spherical_harmonics(position, orders=parsed_requests.pop('spherical_harmonics'), geometry=geometry)
         if 'spherical_harmonics_gradient' in parsed_requests:
-            gradient_order = parsed_requests.pop('spherical_harmonics_gradient')
-            sph_idx = _indexing.SphericalHarmonicsIndexer(gradient_order)
-
-            def A(n, m):
-                return ((n + m + 1) * (n + m + 2) / (2 * n + 1) / (2 * n + 3)) ** 0.5
-
-            def B(n, m):
-                return -((n + m + 1) * (n - m + 1) / (2 * n + 1) / (2 * n + 3)) ** 0.5
-
-            S = evaluated_requests['spherical_harmonics']
-            dS_dxpiy = np.zeros((len(sph_idx), self.num_transducers) + position.shape[1:], dtype=complex)
-            dS_dxmiy = np.zeros((len(sph_idx), self.num_transducers) + position.shape[1:], dtype=complex)
-            dS_dz = np.zeros((len(sph_idx), self.num_transducers) + position.shape[1:], dtype=complex)
-
-            for idx, (n, m) in enumerate(sph_idx):
-                dS_dxpiy[idx] = A(n, -m) * S[sph_idx(n + 1, m - 1)]
-                dS_dxmiy[idx] = -A(n, m) * S[sph_idx(n + 1, m + 1)]
-                dS_dz[idx] = -B(n, m) * S[sph_idx(n + 1, m)]
-                try:
-                    dS_dxpiy[idx] += A(n - 1, m - 1) * S[sph_idx(n - 1, m - 1)]
-                except ValueError:
-                    pass
-                try:
-                    dS_dxmiy[idx] -= A(n - 1, - m - 1) * S[sph_idx(n - 1, m + 1)]
-                except ValueError:
-                    pass
-                try:
-                    dS_dz[idx] += B(n - 1, m) * S[sph_idx(n - 1, m)]
-                except ValueError:
-                    pass
-
-            dS_dx = 0.5 * (dS_dxpiy + dS_dxmiy)
-            dS_dy = -0.5j * (dS_dxpiy - dS_dxmiy)
-
-            dS = np.stack([dS_dx, dS_dy, dS_dz], axis=0) * self.k
-            evaluated_requests['spherical_harmonics_gradient'] = dS
+            evaluated_requests['spherical_harmonics_gradient'] = transducers._spherical_harmonics_gradient(
+                evaluated_requests['spherical_harmonics'], parsed_requests.pop('spherical_harmonics_gradient'), self.k)
 
         if len(parsed_requests) > 0:
             raise ValueError('Unevaluated requests: {}'.format(parsed_requests))
         return evaluated_requests
 
+    def _grid_lattice(self, position):
+        """Place the transducers on the lattice of a regular grid of positions.
+
+        Returns `None` if the positions are not a regular grid, if the transducers
+        have different normals, or if the transducer model is not known to only depend
+        on the difference between the positions. Otherwise returns the grid axes which are not singleton,
+        the steps along these axes as a (3, D) array, the integer lattice coordinates
+        of the transducers as a (D, N) array, and a group index for each transducer.
+        The transducers in a group share the residual offset from the lattice.
+        """
+        if type(self.transducer) not in transducers._translation_invariant_models or position.ndim < 2:
+            return None
+        if not np.allclose(self.normals, self.normals[:, :1], atol=1e-9):
+            return None
+        grid_shape = position.shape[1:]
+        flat_position = position.reshape(3, -1)
+        origin = flat_position[:, 0]
+        axes = [axis for axis, size in enumerate(grid_shape) if size > 1]
+        if len(axes) == 0 or len(axes) > 3:
+            return None
+        steps = np.stack([position[(slice(None),) + tuple(int(axis == ax) for ax in range(len(grid_shape)))] - origin for axis in axes], axis=1)
+        if np.linalg.matrix_rank(steps) < len(axes):
+            return None
+        scale = max(np.max(np.abs(flat_position - origin[:, None])), np.max(np.abs(self.positions - origin[:, None])), 1e-3)
+        tolerance = 1e-9 * scale
+        grid_index = np.indices(grid_shape)[axes]
+        regular_grid = origin.reshape((3,) + len(grid_shape) * (1,)) + np.einsum('id,d...->i...', steps, grid_index)
+        if np.max(np.abs(regular_grid - position)) > tolerance:
+            return None
+
+        offsets = self.positions - self.positions[:, :1]
+        lattice = np.round(np.linalg.lstsq(steps, offsets, rcond=None)[0]).astype(int)
+        residual = offsets - steps @ lattice
+        _, groups = np.unique(np.round(residual / tolerance).astype(np.int64), axis=1, return_inverse=True)
+        return axes, steps, lattice, np.reshape(groups, -1)
+
+    def _lattice_table(self, position, axes, steps, lattice, members, orders):
+        """Evaluate the transducer model over the difference lattice for a group of transducers.
+
+        The table covers the differences from the smallest to the largest lattice
+        coordinate of the transducers, so that the contribution from a transducer with
+        lattice coordinate `m` at grid index `i` is found at index `i - m + max(m)`.
+        """
+        grid_shape = position.shape[1:]
+        upper = np.max(lattice[:, members], axis=1)
+        table_shape = list(grid_shape)
+        table_index = []
+        for axis, upper_index, lower_index in zip(axes, upper, np.min(lattice[:, members], axis=1)):
+            table_shape[axis] = grid_shape[axis] + upper_index - lower_index
+            table_index.append(np.arange(table_shape[axis]) - upper_index)
+        table_index = np.stack(np.meshgrid(*table_index, indexing='ij')).reshape((len(axes),) + tuple(table_shape))
+        receivers = position.reshape(3, -1)[:, 0].reshape((3,) + len(grid_shape) * (1,)) + np.einsum('id,d...->i...', steps, table_index)
+        source = self.positions[:, members[0]] - steps @ lattice[:, members[0]]
+        return self.transducer.pressure_derivs(source[:, None], self.normals[:, :1], receivers, orders)[:, 0]
+
+    def _lattice_pressure_derivs(self, position, orders):
+        """Evaluate pressure derivatives using a lookup table over the difference lattice.
+
+        Returns `None` if the positions are not a regular grid, if there are
+        fewer than 2**16 combinations of transducers and positions, or if the
+        lookup tables would not be smaller than the direct evaluation.
+        """
+        grid_shape = position.shape[1:]
+        if np.prod(grid_shape) * self.num_transducers < 2**16:
+            return None
+        grid_lattice = self._grid_lattice(position)
+        if grid_lattice is None:
+            return None
+        axes, steps, lattice, groups = grid_lattice
+        num_groups = np.max(groups) + 1
+        if num_groups * 2 > self.num_transducers:
+            # Each table should be shared by at least two transducers on average.
+            return None
+        lower = np.full((len(axes), num_groups), np.iinfo(lattice.dtype).max)
+        upper = np.full((len(axes), num_groups), np.iinfo(lattice.dtype).min)
+        np.minimum.at(lower, (slice(None), groups), lattice)
+        np.maximum.at(upper, (slice(None), groups), lattice)
+        table_sizes = np.prod(np.array(grid_shape)[axes][:, None] + upper - lower, axis=0)
+        if np.sum(table_sizes) * 2 > self.num_transducers * np.prod(grid_shape):
+            return None
+
+        derivatives = None
+        for group in range(num_groups):
+            members = np.nonzero(groups == group)[0]
+            table = self._lattice_table(position, axes, steps, lattice, members, orders)
+            if derivatives is None:
+                derivatives = np.empty(table.shape[:1] + (self.num_transducers,) + grid_shape, dtype=table.dtype)
+            upper = np.max(lattice[:, members], axis=1)
+            for transducer in members:
+                index = [slice(None)] * len(grid_shape)
+                for axis, upper_index, lattice_index in zip(axes, upper, lattice[:, transducer]):
+                    index[axis] = slice(upper_index - lattice_index, upper_index - lattice_index + grid_shape[axis])
+                derivatives[:, transducer] = table[(slice(None),) + tuple(index)]
+        return derivatives
+
+    def _symmetry_orbit(self, usable):
+        """Split the transducers into evaluated and mapped transducers for a set of symmetries.
+
+        Each transducer is either evaluated, or mapped from an evaluated transducer by one
+        of the symmetries. Returns a mask of the evaluated transducers, and for each symmetry
+        the indices of the evaluated source transducers and the mapped target transducers.
+        The orbits are cached for each set of symmetries.
+        """
+        try:
+            return self._symmetry_orbits[usable]
+        except KeyError:
+            pass
+        permutations = [self.symmetries[idx].permutation for idx in usable]
+        evaluated = np.zeros(self.num_transducers, dtype=bool)
+        mapped = np.zeros(self.num_transducers, dtype=bool)
+        sources = [[] for _ in usable]
+        targets = [[] for _ in usable]
+        for transducer in range(self.num_transducers):
+            if mapped[transducer]:
+                continue
+            evaluated[transducer] = mapped[transducer] = True
+            for idx, permutation in enumerate(permutations):
+                target = permutation[transducer]
+                if not mapped[target]:
+                    mapped[target] = True
+                    sources[idx].append(transducer)
+                    targets[idx].append(target)
+        evaluated_index = np.cumsum(evaluated) - 1
+        orbit = self._symmetry_orbits[usable] = (
+            evaluated,
+            [evaluated_index[source] for source in sources],
+            [np.array(target, dtype=int) for target in targets],
+        )
+        return orbit
+
+    def _symmetric_pressure_derivs(self, position, orders):
+        """Evaluate pressure derivatives using the symmetries of the array.
+
+        Returns `None` if no symmetry maps the positions onto themselves, or if the
+        direct evaluation is expected to be faster, see `symmetries`.
+        """
+        if type(self.transducer) not in transducers._axisymmetric_models or self.transducer._uses_compiled_kernel:
+            return None
+        flat_position = position.reshape(3, -1)
+        if flat_position.shape[1] * self.num_transducers < 2**16 or len(self.symmetries) < 2:
+            return None
+        if self.num_transducers < 4 * len(self.symmetries):
+            # Too few transducers to gain anything from the bookkeeping.
+            return None
+        center = self.symmetries[0].center
+        tolerance = 1e-9 * max(np.max(np.abs(flat_position - center[:, None])), 1e-3)
+        # A symmetry which maps the positions onto themselves also maps their mean onto itself.
+        mean_position = np.mean(flat_position, axis=1)
+        candidates = [idx for idx, symmetry in enumerate(self.symmetries) if idx > 0 and np.all(np.abs(symmetry.transform(mean_position) - mean_position) <= tolerance)]
+        if len(candidates) == 0:
+            return None
+        receiver_index = scipy.spatial.cKDTree(flat_position.T)
+        # The symmetries which map the positions onto themselves form a group.
+        # For each of them, find the position which is mapped onto each position.
+        usable = []
+        receivers = []
+        for idx in candidates:
+            distance, mapped_receivers = receiver_index.query(self.symmetries[idx].inverse_transform(flat_position).T, distance_upper_bound=tolerance)
+            if np.all(np.isfinite(distance)):
+                usable.append(idx)
+                receivers.append(mapped_receivers)
+        if len(usable) == 0:
+            return None
+
+        evaluated, sources, targets = self._symmetry_orbit(tuple(usable))
+        evaluated_derivatives = self.transducer.pressure_derivs(self.positions[:, evaluated], self.normals[:, evaluated], flat_position, orders)
+        derivatives = np.empty(evaluated_derivatives.shape[:1] + (self.num_transducers,) + evaluated_derivatives.shape[2:], dtype=evaluated_derivatives.dtype)
+        derivatives[:, evaluated] = evaluated_derivatives
+        for idx, mapped_receivers, source, target in zip(usable, receivers, sources, targets):
+            if len(target) == 0:
+                continue
+            components, signs = self.symmetries[idx].derivative_permutation(orders)
+            mapped_derivatives = evaluated_derivatives[components[:, None, None], source[:, None], mapped_receivers]
+            mapped_derivatives[signs < 0] *= -1
+            derivatives[:, target] = mapped_derivatives
+        return derivatives.reshape(derivatives.shape[:2] + position.shape[1:])
+
+    def _evaluate_sparse_requests(self, parsed_requests, position, sparse_threshold, memory_budget=2**28):
+        parsed_requests = dict(parsed_requests)
+        orders = parsed_requests.pop('pressure_derivs')
+        evaluated_requests = self._evaluate_requests(parsed_requests, position, num_workers=1) if len(parsed_requests) > 0 else {}
+        # Only a chunk of the dense derivatives is stored at any time.
+        flat_position = position.reshape(3, -1)
+        chunk_size = max(1, int(memory_budget // max(self._request_nbytes({'pressure_derivs': orders}), 1)))
+        chunks = []
+        for start in range(0, flat_position.shape[1], chunk_size):
+            chunk = self.pressure_derivs(flat_position[:, start:start + chunk_size], orders=orders)
+            chunks.append(SparseRequest.from_dense(chunk, sparse_threshold))
+        evaluated_requests['pressure_derivs'] = SparseRequest.concatenate(chunks, position.shape[1:])
+        return evaluated_requests
+
+    def _evaluate_requests_parallel(self, parsed_requests, position, num_workers):
+        # NumPy releases the GIL in the elementwise operations, so the positions can be evaluated in threads.
+        flat_position = position.reshape(3, -1)
+        chunks = np.array_split(np.arange(flat_position.shape[1]), num_workers)
+        chunks = [slice(chunk[0], chunk[-1] + 1) for chunk in chunks]
+        evaluated_requests = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(self._evaluate_requests, parsed_requests, flat_position[:, chunk], 1): chunk for chunk in chunks}
+            for future in concurrent.futures.as_completed(futures):
+                chunk = futures[future]
+                for key, value in future.result().items():
+                    if key not in evaluated_requests:
+                        evaluated_requests[key] = np.empty(value.shape[:-1] + flat_position.shape[1:], dtype=value.dtype)
+                    evaluated_requests[key][..., chunk] = value
+        return {key: value.reshape(value.shape[:-1] + position.shape[1:]) for key, value in evaluated_requests.items()}
+
 
 class NormalTransducerArray(TransducerArray):
     """Transducer array with a clearly defined normal.
@@ -785,3 +1246,396 @@ class DoublesidedArray(TransducerArray):
             if str(e) != 'super(type, obj): obj must be an instance or subtype of type':
                 raise
         return super().signature(self, position, stype=stype, *args, **kwargs)
+
+
+class RequestCache:
+    """Content-addressed cache for evaluated array requests.
+
+    Stores the outputs of `TransducerArray.request`, keyed by a hash of everything
+    the calculations depend on, i.e. the transducer positions and normals,
+    the parameters of the transducer model (including the medium and the wavenumber),
+    the receiver positions, and the requests. Modifying any of these will
+    create a new key, so there is no need to invalidate the cache manually.
+
+    The cache keeps the most recently used entries in memory, up to a budget
+    in bytes. If a directory is given, all entries are additionally stored as
+    `.npy` files in the directory, which will be memory mapped when loaded.
+    This makes it possible to share the cache between sessions and processes.
+    Use an instance by assigning it to the `request_cache` attribute of arrays.
+
+    Parameters
+    ----------
+    max_bytes : int, default 2**30
+        The memory budget for the in-memory storage. The least recently used
+        entries will be discarded when the budget is exceeded.
+    directory : str, optional
+        Directory used for persistent storage.
+
+    Attributes
+    ----------
+    hits : int
+        The number of successful lookups.
+    misses : int
+        The number of unsuccessful lookups.
+
+    """
+
+    def __init__(self, max_bytes=2**30, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._entries = collections.OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """Number of bytes stored in memory."""
+        return self._nbytes
+
+    def key(self, array, requests, position):
+        """Create the key for a set of requests.
+
+        Parameters
+        ----------
+        array : TransducerArray
+            The array evaluating the requests.
+        requests : dict
+            The requests to evaluate, as parsed by `TransducerArray.request`.
+        position : numpy.ndarray
+            The receiver positions.
+
+        Returns
+        -------
+        key : str
+            The hex digest of the content hash.
+
+        """
+        hasher = hashlib.sha256()
+        for item in (array.positions, array.normals, array.transducer, array.k, requests, np.asarray(position)):
+            self._update_hash(hasher, item)
+        return hasher.hexdigest()
+
+    @classmethod
+    def _update_hash(cls, hasher, obj):
+        hasher.update(type(obj).__qualname__.encode())
+        if isinstance(obj, np.ndarray):
+            obj = np.ascontiguousarray(obj)
+            hasher.update(str((obj.dtype.str, obj.shape)).encode())
+            hasher.update(obj.data)
+        elif obj is None or isinstance(obj, (str, bool, int, float, complex, np.number)):
+            hasher.update(repr(obj).encode())
+        elif isinstance(obj, (list, tuple)):
+            for item in obj:
+                cls._update_hash(hasher, item)
+        elif isinstance(obj, dict):
+            for key in sorted(obj):
+                cls._update_hash(hasher, key)
+                cls._update_hash(hasher, obj[key])
+        elif isinstance(obj, Material):
+            for prop in sorted(obj.properties):
+                cls._update_hash(hasher, prop)
+                cls._update_hash(hasher, getattr(obj, prop))
+        else:
+            try:
+                state = vars(obj)
+            except TypeError:
+                hasher.update(pickle.dumps(obj))
+            else:
+                cls._update_hash(hasher, state)
+
+    def _filename(self, key, name):
+        return os.path.join(self.directory, '{}-{}.npy'.format(key, name))
+
+    def get(self, key, names):
+        """Look up an entry in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry, see `key`.
+        names : iterable of str
+            The names of the evaluated requests in the entry.
+
+        Returns
+        -------
+        evaluated_requests : dict or None
+            The cached data, or `None` if the entry is not in the cache.
+
+        """
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            entry = None
+        else:
+            self._entries.move_to_end(key)
+
+        if entry is None and self.directory is not None:
+            try:
+                entry = {name: np.load(self._filename(key, name), mmap_mode='r') for name in names}
+            except FileNotFoundError:
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(entry)
+
+    def store(self, key, evaluated_requests):
+        """Store an entry in the cache.
+
+        The arrays will be marked as read-only, since they will be shared
+        with subsequent lookups.
+
+        Parameters
+        ----------
+        key : str
+            The key of the entry, see `key`.
+        evaluated_requests : dict
+            The evaluated requests, as returned from `TransducerArray.request`.
+
+        """
+        for value in evaluated_requests.values():
+            value.flags.writeable = False
+        entry = dict(evaluated_requests)
+
+        if self.directory is not None:
+            for name, value in entry.items():
+                filename = self._filename(key, name)
+                if not os.path.exists(filename):
+                    # Write to a temporary file first so that other processes never see incomplete files.
+                    temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+                    with open(temp_filename, 'wb') as file:
+                        np.save(file, value)
+                    os.replace(temp_filename, filename)
+
+        nbytes = sum(value.nbytes for value in entry.values())
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._nbytes -= sum(value.nbytes for value in self._entries.pop(key).values())
+        self._entries[key] = entry
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes:
+            _, discarded = self._entries.popitem(last=False)
+            self._nbytes -= sum(value.nbytes for value in discarded.values())
+
+    def clear(self):
+        """Remove all entries stored in memory.
+
+        Files in the storage directory are not removed.
+        """
+        self._entries.clear()
+        self._nbytes = 0
+
+
+class SparseRequest:
+    """Sparse representation of an evaluated request.
+
+    Stores the contributions from the transducers to the positions in a
+    compressed sparse row format, with the positions as rows and the transducers
+    as columns. All components, e.g. the different spatial derivatives, use
+    the same sparsity pattern. Created by `TransducerArray.request` when
+    using a sparse threshold, and used directly by the fields.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The stored values, shape `(M, nnz)` for `M` components.
+    indices : numpy.ndarray
+        The transducer index for each stored value, shape `(nnz,)`.
+    indptr : numpy.ndarray
+        The start of each (flattened) position in `data` and `indices`.
+    shape : tuple
+        The shape of the corresponding dense request, `(M, N, ...)`.
+    truncation_error : numpy.ndarray
+        The sum of the magnitudes of the dropped values, shape `(M, ...)`.
+
+    Attributes
+    ----------
+    truncation_error : numpy.ndarray
+        The sum of the magnitudes of the dropped values for each component and position.
+        This is an upper bound of the error in the summed request for transducer
+        amplitudes with magnitude of at most one.
+
+    """
+
+    def __init__(self, data, indices, indptr, shape, truncation_error):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        self.truncation_error = truncation_error
+
+    @classmethod
+    def from_dense(cls, dense, threshold):
+        """Create a sparse request from a dense request.
+
+        A transducer-position pair is kept if the magnitude of any of the components
+        is at least `threshold` times the largest magnitude of that component at the position.
+
+        Parameters
+        ----------
+        dense : numpy.ndarray
+            The dense request, shape `(M, N, ...)`.
+        threshold : float
+            The relative magnitude threshold.
+
+        """
+        dense = np.asarray(dense)
+        flat = dense.reshape(dense.shape[:2] + (-1,))
+        magnitude = np.abs(flat)
+        keep = np.any(magnitude >= threshold * magnitude.max(axis=1, keepdims=True), axis=0)
+        positions, transducers = np.nonzero(keep.T)
+        data = flat[:, transducers, positions]
+        indptr = np.zeros(flat.shape[2] + 1, dtype=np.intp)
+        np.cumsum(np.bincount(positions, minlength=flat.shape[2]), out=indptr[1:])
+        truncation_error = np.sum(np.where(keep, 0, magnitude), axis=1).reshape(dense.shape[:1] + dense.shape[2:])
+        return cls(data, transducers, indptr, dense.shape, truncation_error)
+
+    @classmethod
+    def concatenate(cls, requests, position_shape=None):
+        """Concatenate sparse requests along the (flattened) positions.
+
+        Parameters
+        ----------
+        requests : sequence of SparseRequest
+            The requests to concatenate.
+        position_shape : tuple, optional
+            The shape of the positions of the concatenated request.
+            Defaults to flat positions.
+
+        """
+        offsets = np.cumsum([0] + [request.nnz for request in requests[:-1]])
+        data = np.concatenate([request.data for request in requests], axis=1)
+        indices = np.concatenate([request.indices for request in requests])
+        indptr = np.concatenate([[0]] + [request.indptr[1:] + offset for request, offset in zip(requests, offsets)])
+        truncation_error = np.concatenate([request.truncation_error.reshape(request.shape[0], -1) for request in requests], axis=1)
+        if position_shape is None:
+            position_shape = truncation_error.shape[1:]
+        shape = requests[0].shape[:2] + tuple(position_shape)
+        return cls(data, indices, indptr, shape, truncation_error.reshape(shape[:1] + shape[2:]))
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nnz(self):
+        """The number of stored transducer-position pairs."""
+        return self.indices.size
+
+    @property
+    def density(self):
+        """The fraction of the transducer-position pairs which are stored."""
+        return self.nnz / max(1, int(np.prod(self.shape[1:])))
+
+    def matrix(self, component):
+        """Get a component as a `scipy.sparse.csr_matrix`, shape (positions, transducers)."""
+        return scipy.sparse.csr_matrix((self.data[component], self.indices, self.indptr), shape=(len(self.indptr) - 1, self.shape[1]))
+
+    def summed(self, complex_transducer_amplitudes):
+        """Sum the contributions from the transducers, shape `(M, ...)`.
+
+        Stacked states, i.e. amplitudes with shape `(K, N)`, give a trailing state axis.
+        """
+        complex_transducer_amplitudes = np.asarray(complex_transducer_amplitudes)
+        summed = np.stack([self.matrix(component) @ complex_transducer_amplitudes.T for component in range(self.shape[0])])
+        return summed.reshape(self.shape[:1] + self.shape[2:] + complex_transducer_amplitudes.shape[:-1])
+
+    def individual(self, complex_transducer_amplitudes):
+        """Get the dense contributions from the transducers, shape `(M, N, ...)`.
+
+        Stacked states, i.e. amplitudes with shape `(K, N)`, give a trailing state axis.
+        """
+        complex_transducer_amplitudes = np.asarray(complex_transducer_amplitudes)
+        if complex_transducer_amplitudes.ndim > 1:
+            return np.einsum('ki,ji...->ji...k', complex_transducer_amplitudes, self.toarray())
+        return np.einsum('i,ji...->ji...', complex_transducer_amplitudes, self.toarray())
+
+    def toarray(self):
+        """Convert to a dense request, with zeros for the dropped values."""
+        num_positions = len(self.indptr) - 1
+        dense = np.zeros((self.shape[0], self.shape[1], num_positions), dtype=self.dtype)
+        positions = np.repeat(np.arange(num_positions), np.diff(self.indptr))
+        dense[:, self.indices, positions] = self.data
+        return dense.reshape(self.shape)
+
+
+class ArraySymmetry:
+    """Symmetry of a transducer array.
+
+    Describes a transform :math:`T(x) = R (x - c) + c` of the array, where :math:`R`
+    permutes the coordinate axes and flips their signs, and :math:`c` is the center
+    of the array. The transform maps transducer `i` onto transducer `permutation[i]`.
+    For transducer models with a directivity which is symmetric around the normal, the field from
+    transducer `permutation[i]` at :math:`T(x)` is the field from transducer `i` at
+    :math:`x`, with the spatial derivatives permuted and sign flipped by :math:`R`.
+
+    Parameters
+    ----------
+    rotation : numpy.ndarray
+        The signed permutation matrix :math:`R`, shape (3, 3).
+    center : numpy.ndarray
+        The fixed point :math:`c` of the transform.
+    permutation : numpy.ndarray, optional
+        The indices of the transformed transducers.
+
+    """
+
+    def __init__(self, rotation, center, permutation=None):
+        self.rotation = np.asarray(rotation)
+        self.center = np.asarray(center)
+        self.permutation = permutation
+
+    def transform(self, positions):
+        """Transform positions, shape (3, ...)."""
+        positions = np.asarray(positions)
+        center = self.center.reshape((3,) + (1,) * (positions.ndim - 1))
+        return np.einsum('ij,j...->i...', self.rotation, positions - center) + center
+
+    def inverse_transform(self, positions):
+        """Transform positions with the inverse transform, shape (3, ...)."""
+        positions = np.asarray(positions)
+        center = self.center.reshape((3,) + (1,) * (positions.ndim - 1))
+        return np.einsum('ji,j...->i...', self.rotation, positions - center) + center
+
+    def derivative_permutation(self, orders):
+        """Find how the spatial derivatives transform.
+
+        The derivative `idx` of the transformed field is `signs[idx]` times
+        the derivative `components[idx]` of the original field, in the order
+        given by `~levitate._indexing.pressure_derivs_order`.
+
+        Parameters
+        ----------
+        orders : int
+            The number of orders of derivatives.
+
+        Returns
+        -------
+        components : numpy.ndarray
+            The indices of the original derivatives.
+        signs : numpy.ndarray
+            The signs of the original derivatives.
+
+        """
+        counts = [tuple(name.count(axis) for axis in 'xyz') for name in _indexing.pressure_derivs_order]
+        index = {count: idx for idx, count in enumerate(counts)}
+        axes = np.argmax(np.abs(self.rotation), axis=1)
+        axis_signs = self.rotation[np.arange(3), axes]
+        num_derivs = _indexing.num_pressure_derivs[orders]
+        components = np.empty(num_derivs, dtype=int)
+        signs = np.empty(num_derivs)
+        for idx, name in enumerate(_indexing.pressure_derivs_order[:num_derivs]):
+            # Each derivative along axis i of the new field is a derivative along axes[i] of the original.
+            original = ['xyz'[axes['xyz'.index(axis)]] for axis in name]
+            components[idx] = index[tuple(original.count(axis) for axis in 'xyz')]
+            signs[idx] = np.prod([axis_signs['xyz'.index(axis)] for axis in name])
+        return components, signs
@@ -64,3 +64,8 @@ def imag(field):
 def conjugate(field):
     from ._transformers import Conjugate
     return field.copy()._append_transform(Conjugate)
+
+
+def compile(field):
+    from ._compiler import compile
+    return compile(field)
@@ -0,0 +1,291 @@
+"""Compilation of bound fields into flat evaluation plans.
+
+The field wrappers store algebraic operations as nested transforms, which are
+interpreted on every call. For small arrays, e.g. in optimizations with many
+function evaluations, the time spent walking the wrappers is a noticeable part
+of the total time. A compiled field walks the wrappers once, and stores
+
+- the unique positions, with the combined requirements and cached requests,
+- the unique field implementations at each position, which are evaluated once per call,
+- the transforms as a flat list of steps working on numbered slots.
+
+The seeds used to evaluate cost function jacobians in reverse mode are created
+once for each shape of the inputs, and reused between calls.
+"""
+
+import numpy as np
+
+from . import _wrappers
+
+
+class _Leaf:
+    """A field implementation at one of the positions in a compiled field."""
+
+    def __init__(self, field, position_idx, slot):
+        self.field = field
+        self.position_idx = position_idx
+        self.slot = slot
+        self.values_keys = tuple(field.values_require)
+        self.jacobians_keys = tuple(field.jacobians_require)
+        self.size = int(np.prod(field.shape))
+        self.offset = None
+        self.seeds = {}
+
+
+class CompiledField:
+    """Flat evaluation plan for a bound field.
+
+    Evaluates the same values as the field it was compiled from, see `compile`.
+    The positions and transforms of the field are fixed at compilation, so later
+    changes to the field are not included in the compiled field.
+
+    Parameters
+    ----------
+    field : FieldPoint or MultiFieldPoint
+        The bound field to compile.
+
+    """
+
+    def __init__(self, field):
+        if not isinstance(field, _wrappers.bound_fields):
+            raise TypeError(f'Cannot compile object of type {type(field).__name__}, only bound fields can be compiled')
+        self.array = field.array
+        self.positions = []
+        self.requirements = []
+        self.leaves = []
+        self.steps = []
+        self.num_slots = 0
+        self.output = self._add_node(field)
+        self.num_outputs = 0
+        for leaf in self.leaves:
+            leaf.offset = self.num_outputs
+            self.num_outputs += leaf.size
+        self._cached_requests = None
+        self._cached_wavenumber = None
+        self._cached_geometries = [None] * len(self.positions)
+
+    def _new_slot(self):
+        self.num_slots += 1
+        return self.num_slots - 1
+
+    def _position_idx(self, position):
+        for idx, existing in enumerate(self.positions):
+            if existing.shape == position.shape and np.allclose(existing, position):
+                return idx
+        self.positions.append(position)
+        self.requirements.append(_wrappers.FieldImplementation.requirement())
+        return len(self.positions) - 1
+
+    def _requires(self, field):
+        return field.values_require
+
+    def _add_leaf(self, field, position):
+        position_idx = self._position_idx(position)
+        self.requirements[position_idx] = self.requirements[position_idx] + self._requires(field)
+        for leaf in self.leaves:
+            if leaf.position_idx == position_idx and leaf.field == field:
+                return leaf.slot
+        leaf = _Leaf(field, position_idx, self._new_slot())
+        self.leaves.append(leaf)
+        return leaf.slot
+
+    def _add_node(self, node):
+        """Add the leaves and steps for a wrapper, returning the output slot(s)."""
+        if isinstance(node, _wrappers.FieldPoint):
+            output = self._add_leaf(node.field, node.position)
+        elif isinstance(node, _wrappers.MultiFieldPoint):
+            output = [self._add_node(field) for field in node.fields]
+        else:
+            raise TypeError(f'Cannot compile object of type {type(node).__name__}')
+        for transform in node.transforms:
+            slot = self._new_slot()
+            self.steps.append((transform, output, slot))
+            output = slot
+        return output
+
+    def _requests(self):
+        """Get the evaluated requests at all the positions, see `MultiFieldPoint._requests`."""
+        if self._cached_requests is None or self._cached_wavenumber != self.array.k:
+            for idx, position in enumerate(self.positions):
+                if self._cached_geometries[idx] is None:
+                    self._cached_geometries[idx] = self.array.geometry(position)
+            self._cached_requests = [
+                self.array.request(requirement, position, geometry=geometry)
+                for requirement, position, geometry in zip(self.requirements, self.positions, self._cached_geometries)
+            ]
+            self._cached_wavenumber = self.array.k
+            for leaf in self.leaves:
+                leaf.seeds = {}
+        return self._cached_requests
+
+    def _evaluate_requirements(self, complex_transducer_amplitudes):
+        return [_wrappers.FieldBase.evaluate_requirements(complex_transducer_amplitudes, requests) for requests in self._requests()]
+
+    @staticmethod
+    def _gather(slots, inputs):
+        if isinstance(inputs, list):
+            return [CompiledField._gather(slots, input) for input in inputs]
+        return slots[inputs]
+
+    @staticmethod
+    def _unzip(pairs):
+        """Split (nested lists of) pairs of values and jacobians into values and jacobians."""
+        if not isinstance(pairs, list):
+            return pairs
+        values, jacobians = [], []
+        for value, jacobian in map(CompiledField._unzip, pairs):
+            values.append(value)
+            jacobians.append(jacobian)
+        return values, jacobians
+
+    def _run(self, slots, method):
+        """Run the transform steps on the slots, using either the values or values_jacobians method."""
+        for transform, inputs, output in self.steps:
+            arguments = self._gather(slots, inputs)
+            if method == 'values':
+                slots[output] = transform.values(arguments)
+            else:
+                slots[output] = transform.values_jacobians(*self._unzip(arguments))
+        output = self._gather(slots, self.output)
+        return output if method == 'values' else self._unzip(output)
+
+    def __call__(self, complex_transducer_amplitudes):
+        """Evaluate the compiled field.
+
+        Parameters
+        ----------
+        complex_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes of the
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values.
+
+        Returns
+        -------
+        values: ndarray or list
+            The values of the field used to compile.
+
+        """
+        requirements = self._evaluate_requirements(complex_transducer_amplitudes)
+        slots = [None] * self.num_slots
+        for leaf in self.leaves:
+            leaf_requirements = requirements[leaf.position_idx]
+            slots[leaf.slot] = leaf.field.values(**{key: leaf_requirements[key] for key in leaf.values_keys})
+        values = self._run(slots, 'values')
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _wrappers._states_first(values)
+        return values
+
+
+class CompiledCostFunction(CompiledField):
+    """Flat evaluation plan for a cost function.
+
+    Evaluates the same values and jacobians as the cost function it was compiled from,
+    see `compile` and `CompiledField`.
+
+    Parameters
+    ----------
+    field : CostFunctionSingle or CostFunctionMulti
+        The cost function to compile.
+
+    Attributes
+    ----------
+    use_adjoint : bool
+        Evaluate the jacobians in reverse mode, see the cost functions.
+        Copied from the compiled cost function.
+
+    """
+
+    def __init__(self, field):
+        if not isinstance(field, _wrappers.cost_functions):
+            raise TypeError(f'Cannot compile object of type {type(field).__name__} as a cost function')
+        super().__init__(field)
+        self.use_adjoint = field.use_adjoint
+
+    def _requires(self, field):
+        return field.values_require + field.jacobians_require
+
+    def _seeded_values(self, leaf, values):
+        """Get the values and the seeded jacobians of a leaf, see `Field._seeded_values_jacobians`."""
+        trailing = np.shape(values)[leaf.field.ndim:]
+        key = ('outputs', trailing, np.result_type(values))
+        try:
+            seed = leaf.seeds[key]
+        except KeyError:
+            seed = np.zeros((leaf.size, self.num_outputs), dtype=np.result_type(values))
+            seed[:, leaf.offset:leaf.offset + leaf.size] = np.eye(leaf.size)
+            seed = seed.reshape(leaf.field.shape + (self.num_outputs,) + (1,) * len(trailing))
+            seed = leaf.seeds[key] = np.broadcast_to(seed, leaf.field.shape + (self.num_outputs,) + trailing)
+        return values, seed
+
+    def _individual_seeds(self, leaf, requirements, accumulator):
+        key = ('individual',) + tuple((key, np.shape(requirements[key]), requirements[key].dtype) for key in leaf.jacobians_keys if key.endswith('_summed'))
+        try:
+            return leaf.seeds[key]
+        except KeyError:
+            seeds = leaf.seeds[key] = accumulator.seeds(leaf.field, requirements)
+            return seeds
+
+    def __call__(self, complex_transducer_amplitudes):
+        """Evaluate the compiled cost function.
+
+        Parameters
+        ----------
+        complex_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes of the
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values and jacobians.
+
+        Returns
+        -------
+        values : ndarray
+            The values of the cost function.
+        jacobians : ndarray
+            The jacobians of the cost function.
+
+        """
+        requirements = self._evaluate_requirements(complex_transducer_amplitudes)
+        slots = [None] * self.num_slots
+        for leaf in self.leaves:
+            leaf_requirements = requirements[leaf.position_idx]
+            values = leaf.field.values(**{key: leaf_requirements[key] for key in leaf.values_keys})
+            if self.use_adjoint:
+                slots[leaf.slot] = self._seeded_values(leaf, values)
+            else:
+                slots[leaf.slot] = values, leaf.field.jacobians(**{key: leaf_requirements[key] for key in leaf.jacobians_keys})
+        values, jacobians = self._run(slots, 'values_jacobians')
+
+        if self.use_adjoint:
+            accumulator = _wrappers._AdjointAccumulator()
+            for leaf in self.leaves:
+                leaf_requirements = requirements[leaf.position_idx]
+                seeds = self._individual_seeds(leaf, leaf_requirements, accumulator)
+                accumulator.add(leaf.field, leaf_requirements, jacobians[leaf.offset:leaf.offset + leaf.size], seeds=seeds)
+            jacobians = accumulator.gradient()
+
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _wrappers._states_first(values), _wrappers._states_first(jacobians)
+        return values, jacobians
+
+
+def compile(field):
+    """Compile a bound field or cost function into a flat evaluation plan.
+
+    The compiled field is called in the same way as the field, and returns the same results.
+    Identical field implementations at the same position are only evaluated once.
+
+    Parameters
+    ----------
+    field : FieldPoint, MultiFieldPoint, CostFunctionSingle, or CostFunctionMulti
+        The bound field or cost function to compile.
+
+    Returns
+    -------
+    compiled : CompiledField or CompiledCostFunction
+        The compiled field.
+
+    """
+    if isinstance(field, _wrappers.cost_functions):
+        return CompiledCostFunction(field)
+    return CompiledField(field)
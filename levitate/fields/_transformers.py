@@ -78,6 +78,19 @@ class SingleInput:
     def ndim(self):
         return len(self.shape)
 
+    def _align(self, parameter, values):
+        """Align a parameter with the field axes of values or jacobians.
+
+        The values have trailing axes after the field axes, e.g. for the positions,
+        transducers, or stacked states, which the parameter should not broadcast with.
+        """
+        if parameter.ndim == 0:
+            return parameter, values
+        trailing = np.ndim(values) - self.input.ndim
+        values = np.reshape(values, (1,) * (self.ndim - self.input.ndim) + np.shape(values))
+        parameter = parameter.reshape((1,) * (self.ndim - parameter.ndim) + parameter.shape + (1,) * trailing)
+        return parameter, values
+
 
 class MultiInput:
     def __init__(self, input):
@@ -118,7 +131,8 @@ class Shift(SingleInput, Transform):
         self.ndim  # Checks that the shapes are compatible
 
     def values(self, values):
-        return values + self.shift
+        shift, values = self._align(self.shift, values)
+        return values + shift
 
     def jacobians(self, values, jacobians):
         return jacobians
@@ -145,10 +159,12 @@ class Scale(SingleInput, Transform):
         self.ndim  # Checks that the shapes are compatible
 
     def values(self, values):
-        return values * self.scale
+        scale, values = self._align(self.scale, values)
+        return values * scale
 
     def jacobians(self, values, jacobians):
-        return jacobians * self.scale[..., None]
+        scale, jacobians = self._align(self.scale, jacobians)
+        return jacobians * scale
 
     @property
     def shape(self):
@@ -167,19 +183,22 @@ class Power(SingleInput, Transform):
         self.exponent = np.asarray(exponent)
         if not np.issubdtype(self.exponent.dtype, np.number):
             raise InvalidParameterError(f'Cannot raise to value {exponent} of type {type(exponent).__name__}')
-        self.ndim  # Checks that the shapes are compatible
+        self._output_val_reshape = (slice(None),) * self.ndim + (None, Ellipsis)  # Also checks that the shapes are compatible
 
     def values(self, values):
         with np.errstate(invalid='raise'):
             try:
-                return values ** self.exponent
+                exponent, values = self._align(self.exponent, values)
+                return values ** exponent
             except FloatingPointError:
                 raise DomainError('Cannot take a non-integer exponent of a negative base')
 
     def jacobians(self, values, jacobians):
         with np.errstate(invalid='raise'):
             try:
-                return jacobians * self.exponent * values[self._val_reshape] ** (self.exponent - 1)
+                exponent, jacobians = self._align(self.exponent, jacobians)
+                _, values = self._align(self.exponent, values)
+                return jacobians * exponent * values[self._output_val_reshape] ** (exponent - 1)
             except FloatingPointError:
                 raise DomainError('Cannot take a non-integer exponent of a negative base')
 
@@ -204,12 +223,13 @@ class Exponential(SingleInput, Transform):
             raise InvalidParameterError(f'Cannot exponentiate complex value {base} to a field')
         if np.min(self.base) < 0:
             raise DomainError(f'Cannot use negative base {base} for exponentiation')
-        self.ndim  # Checks that the shapes are compatible
+        self._output_val_reshape = (slice(None),) * self.ndim + (None, Ellipsis)  # Also checks that the shapes are compatible
 
     def values(self, values):
         with np.errstate(invalid='raise'):
             try:
-                return self.base ** values
+                base, values = self._align(self.base, values)
+                return base ** values
             except FloatingPointError:
                 raise DomainError('Cannot take a non-integer exponent of a negative base')
 
@@ -220,7 +240,8 @@ class Exponential(SingleInput, Transform):
                 log_base = np.log(self.base)
             except FloatingPointError:
                 raise DomainError('Cannot take a non-integer exponent of a negative base')
-        jacobians = jacobians * values[self._val_reshape] * log_base
+        log_base, jacobians = self._align(log_base, jacobians)
+        jacobians = jacobians * values[self._output_val_reshape] * log_base
         return values, jacobians
 
     @property
@@ -418,32 +439,17 @@ class Index(SingleInput, Transform):
 
 
 class Softplus(SingleInput, Transform):
+    @staticmethod
+    def _softplus(values):
+        # log(1 + exp(x)), shifted with the positive real part of x to avoid overflow.
+        shift = np.maximum(np.real(values), 0)
+        return shift + np.log1p(np.expm1(-shift) + np.exp(values - shift))
+
     def values(self, values):
-        if values.ndim > 0:
-            small_value_indices = values < 100
-            values = values.copy()
-            values[small_value_indices] = np.log(1 + np.exp(values[small_value_indices]))
-        elif values < 100:
-            values = np.log(1 + np.exp(values))
-        return values
+        return self._softplus(values)
 
     def values_jacobians(self, values, jacobians):
-        if values.ndim > 0:
-            small_value_indices = values < 100
-            # jacobian_indices = small_value_indices[self._val_reshape]
-
-            exp_and_one = 1 + np.exp(values[small_value_indices])
-
-            jacobians = jacobians.copy()
-            # Normally we would need to use self._val_reshape to reshape the values to fit with the jacobians
-            # with all the dimentions correctly. Here we don't need this since the logical indexing flattens.
-            jacobians[small_value_indices] = jacobians[small_value_indices] * (1 - 1 / exp_and_one[:, None])
-
-            values = values.copy()
-            values[small_value_indices] = np.log(exp_and_one)
-        elif values < 100:
-            exp_and_one = 1 + np.exp(values)
-            jacobians = jacobians * (1 - 1 / exp_and_one)
-            values = np.log(exp_and_one)
-
-        return values, jacobians
+        output = self._softplus(values)
+        # The derivative is the logistic function, exp(x) / (1 + exp(x)) = exp(x - softplus(x)).
+        derivative = np.exp(values - output)
+        return output, jacobians * derivative[self._val_reshape]
@@ -3,6 +3,187 @@ import collections
 import inspect
 
 from . import _transformers
+from .. import arrays
+
+
+class _LazyRequirements(dict):
+    """Requirements dictionary which evaluates some requirements when first accessed.
+
+    The results of the field implementations evaluated with the requirements are
+    stored in `evaluated`, so that shared implementations are only evaluated once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.factories = {}
+        self.requests = None
+        self.evaluated = {}
+
+    def __missing__(self, key):
+        try:
+            factory = self.factories.pop(key)
+        except KeyError:
+            raise KeyError(key) from None
+        value = self[key] = factory()
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.factories
+
+
+def _sum_transducers(amplitudes, request, axis):
+    """Sum the contributions from all transducers, weighted with the amplitudes.
+
+    The transducer axis is contracted with a matrix product, which is done
+    by BLAS without creating the individual contributions. Stacked states,
+    i.e. amplitudes with shape (K, N), give a trailing state axis.
+    """
+    shape = request.shape[:axis] + request.shape[axis + 1:] + amplitudes.shape[:-1]
+    request = request.reshape(request.shape[:axis + 1] + (-1,))
+    if amplitudes.ndim == 1:
+        return np.matmul(amplitudes, request).reshape(shape)
+    return np.matmul(np.swapaxes(request, -1, -2), amplitudes.T).reshape(shape)
+
+
+def _weight_transducers(amplitudes, request, axis):
+    """Weight the contributions from all transducers with the amplitudes.
+
+    Stacked states, i.e. amplitudes with shape (K, N), give a trailing state axis.
+    """
+    components = 'jk'[:axis]
+    states = 's' if amplitudes.ndim > 1 else ''
+    return np.einsum('{states}i,{components}i...->{components}i...{states}'.format(states=states, components=components), amplitudes, request)
+
+
+def _states_first(values):
+    """Move the trailing state axis to the front, also for lists of values."""
+    if isinstance(values, (list, tuple)):
+        return type(values)(_states_first(value) for value in values)
+    return np.moveaxis(values, -1, 0)
+
+
+class _AdjointAccumulator:
+    """Collect the gradient of a scalar cost function in reverse mode.
+
+    The jacobians of the field implementations are linear in the individual
+    requirements, which are the requests weighted with the transducer amplitudes.
+    Instead of creating the individual requirements and the jacobians, the cost
+    function gradient is accumulated as weights for each component of the requests.
+    The weights are contracted with the requests once for each set of requirements,
+    in `gradient`. Fields which cannot be evaluated like this add their
+    jacobians, contracted with the cotangent, directly.
+    The cotangents of an implementation which is used by several fields with the
+    same requirements are added before the jacobians are evaluated.
+    """
+
+    # The axis of the transducers in the requests.
+    transducer_axis = {'pressure_derivs': 1, 'spherical_harmonics': 1, 'spherical_harmonics_gradient': 2}
+
+    def __init__(self):
+        self.direct = 0
+        self.weights = {}
+        self.pending = {}
+
+    def seeds(self, field, requirements):
+        """Create identity seeds for the individual requirements of a field implementation.
+
+        Returns `None` if the jacobians of the field cannot be evaluated from the weights,
+        or if it is not beneficial. Otherwise returns the seeded individual requirements as
+        a dictionary, and a list of the request names and the slices of their components.
+        The seeds only depend on the shapes of the requirements, so they can be reused.
+        """
+        requests = getattr(requirements, 'requests', None)
+        if requests is None:
+            return None
+        components = []
+        for key in field.jacobians_require:
+            if key.endswith('_summed'):
+                continue
+            name = key[:-len('_individual')]
+            if name not in self.transducer_axis or isinstance(requests.get(name, None), arrays.SparseRequest):
+                return None
+            components.append((name, requests[name].shape[:self.transducer_axis[name]]))
+        num_components = sum(int(np.prod(shape)) for name, shape in components)
+        num_transducers = np.shape(requirements['complex_transducer_amplitudes'])[-1]
+        if num_components >= num_transducers:
+            return None
+
+        seeded = {}
+        slices = []
+        start = 0
+        for name, shape in components:
+            size = int(np.prod(shape))
+            summed = requirements[name + '_summed']
+            seed = np.zeros((size, num_components), dtype=summed.dtype)
+            seed[:, start:start + size] = np.eye(size)
+            seeded[name + '_individual'] = seed.reshape(shape + (num_components,) + (1,) * (summed.ndim - len(shape)))
+            slices.append((name, slice(start, start + size)))
+            start += size
+        return seeded, slices
+
+    def add(self, field, requirements, cotangent, seeds=False):
+        """Add the gradient from a field implementation.
+
+        Parameters
+        ----------
+        field : FieldImplementation
+            The implementation to add the gradient from.
+        requirements : dict
+            The evaluated requirements for the field.
+        cotangent : numpy.ndarray
+            The derivatives of the cost function with respect to the values
+            of the field, flattened over the field axes.
+        seeds : tuple or None, optional
+            Previously created seeds, see `seeds`.
+        """
+        key = (id(field), id(requirements))
+        if key in self.pending:
+            field, requirements, accumulated, seeds = self.pending[key]
+            cotangent = accumulated + cotangent
+        self.pending[key] = (field, requirements, cotangent, seeds)
+
+    def _contract(self, field, requirements, cotangent, seeds):
+        """Contract the cotangent with the jacobians of a field implementation."""
+        size = int(np.prod(field.shape))
+        if seeds is False:
+            seeds = self.seeds(field, requirements)
+        if seeds is None:
+            jacobians = field.jacobians(**{key: requirements[key] for key in field.jacobians_require})
+            jacobians = jacobians.reshape((size,) + jacobians.shape[field.ndim:])
+            self.direct = self.direct + np.einsum('m...,mi...->i...', cotangent, jacobians)
+            return
+
+        seeded, slices = seeds
+        coefficients = field.jacobians(**{key: seeded[key] if key in seeded else requirements[key] for key in field.jacobians_require})
+        coefficients = coefficients.reshape((size,) + coefficients.shape[field.ndim:])
+        weights = np.einsum('m...,mc...->c...', cotangent, coefficients)
+        _, accumulated = self.weights.setdefault(id(requirements), (requirements, {}))
+        for name, components in slices:
+            accumulated[name] = accumulated.get(name, 0) + weights[components]
+
+    def gradient(self):
+        """Contract the accumulated weights with the requests."""
+        for field, requirements, cotangent, seeds in self.pending.values():
+            self._contract(field, requirements, cotangent, seeds)
+        self.pending = {}
+        gradient = self.direct
+        for requirements, accumulated in self.weights.values():
+            amplitudes = requirements['complex_transducer_amplitudes']
+            for name, weights in accumulated.items():
+                request = requirements.requests[name]
+                axis = self.transducer_axis[name]
+                request = request.reshape((-1,) + request.shape[axis:])
+                if amplitudes.ndim > 1:
+                    # Stacked states are along the last axis.
+                    contracted = np.einsum('c...k,ci...->i...k', weights, request)
+                    contracted *= amplitudes.T.reshape(amplitudes.shape[1:] + (1,) * (contracted.ndim - 2) + amplitudes.shape[:1])
+                elif request.ndim == 2:
+                    contracted = np.matmul(weights, request) * amplitudes
+                else:
+                    contracted = np.einsum('c...,ci...->i...', weights, request)
+                    contracted *= amplitudes.reshape(amplitudes.shape + (1,) * (contracted.ndim - 1))
+                gradient = gradient + contracted
+        return gradient
 
 
 class IncompatibleFieldsError(TypeError):
@@ -214,18 +395,39 @@ class FieldBase:
     @staticmethod
     def evaluate_requirements(complex_transducer_amplitudes, requests):
         complex_transducer_amplitudes = np.asarray(complex_transducer_amplitudes)
-        # Apply the input complex amplitudes
-        evaluated_requrements = {}
+
+        def amplitudes(request):
+            # Match the precision of the request, so that single precision requests give single precision requirements.
+            return complex_transducer_amplitudes.astype(np.result_type(request.dtype, np.complex64), copy=False)
+
+        # Apply the input complex amplitudes. The summed requirements are calculated directly,
+        # and the individual requirements are only calculated if a field needs them.
+        # Stacked states are kept along a trailing axis, after the positions, so that the
+        # field implementations see them as additional positions.
+        evaluated_requrements = _LazyRequirements()
         evaluated_requrements['complex_transducer_amplitudes'] = complex_transducer_amplitudes
-        if 'pressure_derivs' in requests:
-            evaluated_requrements['pressure_derivs_individual'] = np.einsum('i,ji...->ji...', complex_transducer_amplitudes, requests['pressure_derivs'])
-            evaluated_requrements['pressure_derivs_summed'] = np.sum(evaluated_requrements['pressure_derivs_individual'], axis=1)
+        evaluated_requrements.requests = requests
+        if isinstance(requests.get('pressure_derivs', None), arrays.SparseRequest):
+            # The values only need the summed requirements, so the individual ones are expanded on demand.
+            sparse_request = requests['pressure_derivs']
+            sparse_amplitudes = amplitudes(sparse_request)
+            evaluated_requrements['pressure_derivs_summed'] = sparse_request.summed(sparse_amplitudes)
+            evaluated_requrements.factories['pressure_derivs_individual'] = lambda: sparse_request.individual(sparse_amplitudes)
+        elif 'pressure_derivs' in requests:
+            pressure_derivs = requests['pressure_derivs']
+            pressure_amplitudes = amplitudes(pressure_derivs)
+            evaluated_requrements['pressure_derivs_summed'] = _sum_transducers(pressure_amplitudes, pressure_derivs, axis=1)
+            evaluated_requrements.factories['pressure_derivs_individual'] = lambda: _weight_transducers(pressure_amplitudes, pressure_derivs, axis=1)
         if 'spherical_harmonics' in requests:
-            evaluated_requrements['spherical_harmonics_individual'] = np.einsum('i,ji...->ji...', complex_transducer_amplitudes, requests['spherical_harmonics'])
-            evaluated_requrements['spherical_harmonics_summed'] = np.sum(evaluated_requrements['spherical_harmonics_individual'], axis=1)
+            spherical_harmonics = requests['spherical_harmonics']
+            harmonics_amplitudes = amplitudes(spherical_harmonics)
+            evaluated_requrements['spherical_harmonics_summed'] = _sum_transducers(harmonics_amplitudes, spherical_harmonics, axis=1)
+            evaluated_requrements.factories['spherical_harmonics_individual'] = lambda: _weight_transducers(harmonics_amplitudes, spherical_harmonics, axis=1)
         if 'spherical_harmonics_gradient' in requests:
-            evaluated_requrements['spherical_harmonics_gradient_individual'] = np.einsum('i,jki...->jki...', complex_transducer_amplitudes, requests['spherical_harmonics_gradient'])
-            evaluated_requrements['spherical_harmonics_gradient_summed'] = np.sum(evaluated_requrements['spherical_harmonics_gradient_individual'], axis=2)
+            gradient = requests['spherical_harmonics_gradient']
+            gradient_amplitudes = amplitudes(gradient)
+            evaluated_requrements['spherical_harmonics_gradient_summed'] = _sum_transducers(gradient_amplitudes, gradient, axis=2)
+            evaluated_requrements.factories['spherical_harmonics_gradient_individual'] = lambda: _weight_transducers(gradient_amplitudes, gradient, axis=2)
         return evaluated_requrements
 
     def __eq__(self, other):
@@ -248,6 +450,21 @@ class FieldBase:
     def jacobians(self, requirements, transform=True):
         return self.values_jacobians(requirements, transform=transform)[1]
 
+    def _adjoint_values_jacobians(self, requirements):
+        """Evaluate the values and jacobians of a scalar output in reverse mode.
+
+        The derivatives of the output with respect to the values of the field
+        implementations are found by seeding the transforms, see `_seeded_values_jacobians`.
+        The jacobians of the implementations are then only contracted with these
+        derivatives, see `_AdjointAccumulator`, so the jacobians of the intermediate
+        fields are never created for all transducers.
+        """
+        total = self._num_outputs
+        values, cotangent = self._seeded_values_jacobians(requirements, 0, total)
+        accumulator = _AdjointAccumulator()
+        self._accumulate_adjoint(requirements, cotangent, 0, accumulator)
+        return values, accumulator.gradient()
+
     @property
     def values_jacobians_require(self):
         values_require = self.values_require
@@ -398,21 +615,64 @@ class Field(FieldBase):
     def name(self):
         return self.field.__class__.__name__
 
+    def _evaluate_implementation(self, requirements, jacobians=False):
+        """Evaluate the values, and optionally the jacobians, of the field implementation.
+
+        The results are stored in the evaluated requirements, if possible. Equal
+        implementations at the same position are shared between the fields in a
+        `MultiFieldPoint`, which then evaluates each implementation once per call.
+        """
+        evaluated = getattr(requirements, 'evaluated', None)
+        if evaluated is None:
+            evaluated = {}
+        values_key = id(self.field)
+        if values_key not in evaluated:
+            evaluated[values_key] = self.field.values(**{key: requirements[key] for key in self.values_require})
+        if not jacobians:
+            return evaluated[values_key]
+        jacobians_key = (values_key, 'jacobians')
+        if jacobians_key not in evaluated:
+            evaluated[jacobians_key] = self.field.jacobians(**{key: requirements[key] for key in self.jacobians_require})
+        return evaluated[values_key], evaluated[jacobians_key]
+
     def values(self, requirements, transform=True):
-        values = self.field.values(**{key: requirements[key] for key in self.values_require})
+        values = self._evaluate_implementation(requirements)
         if transform:
             for transform in self.transforms:
                 values = transform.values(values)
         return values
 
     def values_jacobians(self, requirements, transform=True):
-        values = self.field.values(**{key: requirements[key] for key in self.values_require})
-        jacobians = self.field.jacobians(**{key: requirements[key] for key in self.jacobians_require})
+        values, jacobians = self._evaluate_implementation(requirements, jacobians=True)
         if transform:
             for transform in self.transforms:
                 values, jacobians = transform.values_jacobians(values, jacobians)
         return values, jacobians
 
+    @property
+    def _num_outputs(self):
+        return int(np.prod(self.field.shape))
+
+    def _seeded_values_jacobians(self, requirements, offset, total):
+        """Evaluate the values, and the jacobians with respect to the outputs of the field implementations.
+
+        The jacobians are seeded with an identity instead of the transducer contributions,
+        placed at `offset` in an axis of length `total`. After the transforms, the jacobians
+        are the derivatives of the output with respect to the values of the implementations.
+        """
+        values = self._evaluate_implementation(requirements)
+        size = self._num_outputs
+        seed = np.zeros((size, total), dtype=values.dtype)
+        seed[:, offset:offset + size] = np.eye(size)
+        trailing = np.shape(values)[self.field.ndim:]
+        jacobians = np.broadcast_to(seed.reshape(self.field.shape + (total,) + (1,) * len(trailing)), self.field.shape + (total,) + trailing)
+        for transform in self.transforms:
+            values, jacobians = transform.values_jacobians(values, jacobians)
+        return values, jacobians
+
+    def _accumulate_adjoint(self, requirements, cotangent, offset, accumulator):
+        accumulator.add(self.field, requirements, cotangent[offset:offset + self._num_outputs])
+
     @property
     def values_require(self):
         return self.field.values_require
@@ -430,9 +690,11 @@ class Field(FieldBase):
 
         Parameters
         ----------
-        compelx_transducer_amplitudes : complex numpy.ndarray
+        complex_transducer_amplitudes : complex numpy.ndarray
             Complex representation of the transducer phases and amplitudes of the
-            array used to create the field.
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values.
         position : array-like
             The position(s) where to evaluate the field.
             The first dimension needs to have 3 elements.
@@ -446,8 +708,90 @@ class Field(FieldBase):
         requests = self.array.request(self.values_require, position)
         requirements = self.evaluate_requirements(complex_transducer_amplitudes, requests)
         values = self.values(requirements)
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _states_first(values)
         return values
 
+    def iter_chunks(self, complex_transducer_amplitudes, position, memory_budget=2**28):
+        """Evaluate the field implementation in chunks of positions.
+
+        The positions are flattened and split into chunks, which are evaluated
+        one at a time. This limits the memory needed for the intermediate requests,
+        which scale with the number of transducers times the number of positions.
+
+        Parameters
+        ----------
+        compelx_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes of the
+            array used to create the field.
+        position : array-like
+            The position(s) where to evaluate the field.
+            The first dimension needs to have 3 elements.
+        memory_budget : int, default 256 MiB
+            The approximate number of bytes to use for the requests in each chunk.
+
+        Yields
+        ------
+        indices : slice
+            The indices of the chunk in the flattened positions.
+        values : ndarray
+            The values of the implemented field in the chunk, with the
+            positions along the last axis.
+
+        """
+        position = np.asarray(position)
+        flat_position = position.reshape(3, -1)
+        num_positions = flat_position.shape[1]
+        # The requests and the individual requirements both have one element per transducer and position.
+        position_nbytes = 2 * self.array._request_nbytes(self.values_require)
+        chunk_size = max(1, int(memory_budget // max(position_nbytes, 1)))
+        for start in range(0, num_positions, chunk_size):
+            indices = slice(start, min(start + chunk_size, num_positions))
+            yield indices, self(complex_transducer_amplitudes, flat_position[:, indices])
+
+    def evaluate_chunked(self, complex_transducer_amplitudes, position, out=None, memory_budget=2**28):
+        """Evaluate the field implementation over a large set of positions.
+
+        Evaluates the same values as calling the field, but splits the positions
+        in chunks to limit the memory usage, see `iter_chunks`.
+        The output can be preallocated, e.g. as a `numpy.memmap`, to handle
+        results which are too large to keep in memory.
+
+        Parameters
+        ----------
+        compelx_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes of the
+            array used to create the field.
+        position : array-like
+            The position(s) where to evaluate the field.
+            The first dimension needs to have 3 elements.
+        out : ndarray, optional
+            Contiguous array to write the values to, with the same shape
+            as the values from calling the field.
+        memory_budget : int, default 256 MiB
+            The approximate number of bytes to use for the requests in each chunk.
+
+        Returns
+        -------
+        values: ndarray
+            The values of the implemented field used to create the wrapper.
+
+        """
+        position = np.asarray(position)
+        flat_out = None
+        for indices, values in self.iter_chunks(complex_transducer_amplitudes, position, memory_budget=memory_budget):
+            if flat_out is None:
+                shape = values.shape[:-1] + position.shape[1:]
+                if out is None:
+                    out = np.empty(shape, dtype=values.dtype)
+                elif out.shape != shape:
+                    raise ValueError('Output array has shape {}, expected {}'.format(out.shape, shape))
+                flat_out = out.reshape(values.shape[:-1] + (-1,))
+                if not np.shares_memory(flat_out, out):
+                    raise ValueError('Output array must be contiguous')
+            flat_out[..., indices] = values
+        return out
+
     def __matmul__(self, position):
         position = np.asarray(position)
         if position.ndim < 1 or position.shape[0] != 3:
@@ -490,19 +834,43 @@ class FieldPoint(Field):
         )
 
     def _clear_cache(self):
+        for attr in ('_cached_requests', '_cached_wavenumber', '_cached_geometry'):
+            try:
+                delattr(self, attr)
+            except AttributeError:
+                pass
+
+    def _requests(self, requirements):
+        """Get the evaluated requests at the bound position.
+
+        The requests are cached together with the wavenumber used to evaluate them.
+        If the wavenumber has changed, e.g. after updating the properties of the medium,
+        the requests are evaluated again using the cached geometry, since the distances
+        and angles only depend on the positions.
+        """
         try:
-            del self._cached_requests
+            if self._cached_wavenumber == self.array.k:
+                return self._cached_requests
         except AttributeError:
             pass
+        try:
+            geometry = self._cached_geometry
+        except AttributeError:
+            geometry = self._cached_geometry = self.array.geometry(self.position)
+        self._cached_requests = self.array.request(requirements, self.position, geometry=geometry)
+        self._cached_wavenumber = self.array.k
+        return self._cached_requests
 
     def __call__(self, complex_transducer_amplitudes):
         """Evaluate the field implementation.
 
         Parameters
         ----------
-        compelx_transducer_amplitudes : complex numpy.ndarray
+        complex_transducer_amplitudes : complex numpy.ndarray
             Complex representation of the transducer phases and amplitudes of the
-            array used to create the field.
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values.
 
         Returns
         -------
@@ -510,12 +878,11 @@ class FieldPoint(Field):
             The values of the implemented field used to create the wrapper.
 
         """
-        try:
-            requests = self._cached_requests
-        except AttributeError:
-            requests = self._cached_requests = self.array.request(self.values_require, self.position)
+        requests = self._requests(self.values_require)
         requirements = self.evaluate_requirements(complex_transducer_amplitudes, requests)
         values = self.values(requirements)
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _states_first(values)
         return values
 
     def __format__(self, fmt_spec):
@@ -603,7 +970,9 @@ class MultiField(MultiFieldBase):
         ----------
         complex_transducer_amplitudes : complex numpy.ndarray
             Complex representation of the transducer phases and amplitudes of the
-            array used to create the field.
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values.
         position : array-like
             The position(s) where to evaluate the fields.
             The first dimension needs to have 3 elements.
@@ -620,6 +989,8 @@ class MultiField(MultiFieldBase):
         requests = self.array.request(self.values_require, position)
         requirements = self.evaluate_requirements(complex_transducer_amplitudes, requests)
         values = self.values(requirements)
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _states_first(values)
         return values
 
     def values(self, requirements, transform=True):
@@ -663,6 +1034,8 @@ class MultiFieldPoint(MultiFieldBase):
     This class collects multiple `FieldPoint` bound to the same position(s)
     for simultaneous evaluation. Since the fields can use the same spatial
     structures this is more efficient than to evaluate all the fields one by one.
+    Equal field implementations at the same position are shared between the fields,
+    and only evaluated once for each evaluation of the stacked fields.
 
     Parameters
     ----------
@@ -682,9 +1055,10 @@ class MultiFieldPoint(MultiFieldBase):
         self.values_require = []
         self.jacobians_require = []
         self._field_position_idx = []
+        self._implementations = []
 
         self.positions = []
-        self._cached_requests = []
+        self._clear_cache()
         self.extend(fields)
 
     def copy(self):
@@ -694,6 +1068,7 @@ class MultiFieldPoint(MultiFieldBase):
         new_obj.jacobians_require = list(self.jacobians_require)
         new_obj.positions = list(self.positions)
         new_obj._field_position_idx = list(self._field_position_idx)
+        new_obj._implementations = [list(implementations) for implementations in self._implementations]
         new_obj._clear_cache()
         return new_obj
 
@@ -702,9 +1077,11 @@ class MultiFieldPoint(MultiFieldBase):
 
         Parameters
         ----------
-        compelx_transducer_amplitudes : complex numpy.ndarray
+        complex_transducer_amplitudes : complex numpy.ndarray
             Complex representation of the transducer phases and amplitudes of the
-            array used to create the field.
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values.
 
         Returns
         -------
@@ -714,12 +1091,11 @@ class MultiFieldPoint(MultiFieldBase):
             arrays in the list might not have compatible shapes.
 
         """
-        for idx, (position, requirement) in enumerate(zip(self.positions, self.values_require)):
-            if self._cached_requests[idx] is None:
-                self._cached_requests[idx] = self.array.request(requirement, position)
-
-        requirements = [self.evaluate_requirements(complex_transducer_amplitudes, request) for request in self._cached_requests]
+        requests = self._requests(self.values_require)
+        requirements = [self.evaluate_requirements(complex_transducer_amplitudes, request) for request in requests]
         values = self.values(requirements)
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _states_first(values)
         return values
 
     def map_positions_to_fields(self, position_quanties):
@@ -742,11 +1118,36 @@ class MultiFieldPoint(MultiFieldBase):
         # The position does not match any of the existing positions.
         # Add the new position, as well as an empty requirements dict.
         self.positions.append(position)
+        self._cached_geometries.append(None)
         self.values_require.append(FieldImplementation.requirement())
         self.jacobians_require.append(FieldImplementation.requirement())
+        self._implementations.append([])
         self._cached_requests.append(None)
         return len(self.positions) - 1
 
+    def _share_implementations(self, other):
+        """Replace field implementations with equal implementations already used at the same position.
+
+        The evaluated implementations are stored with the requirements for each
+        position, see `Field._evaluate_implementation`, so the shared implementations
+        are only evaluated once per call.
+        """
+        if isinstance(other, FieldPoint):
+            implementations = self._implementations[self._find_pos_idx(other.position)]
+            for implementation in implementations:
+                if implementation is other.field or implementation == other.field:
+                    break
+            else:
+                implementations.append(other.field)
+                return other
+            if implementation is not other.field:
+                other = other.copy()
+                other.field = implementation
+            return other
+        other = other.copy()
+        other.fields = [self._share_implementations(field) for field in other.fields]
+        return other
+
     def values(self, requirements, transform=True):
         values = []
         requirements = self.map_positions_to_fields(requirements)
@@ -772,8 +1173,36 @@ class MultiFieldPoint(MultiFieldBase):
                 values, jacobians = transform.values_jacobians(values, jacobians)
         return values, jacobians
 
+    @property
+    def _num_outputs(self):
+        return sum(field._num_outputs for field in self.fields)
+
+    def _seeded_values_jacobians(self, requirements, offset, total):
+        """Evaluate the values, and the jacobians with respect to the outputs of the field implementations.
+
+        See `Field._seeded_values_jacobians`.
+        """
+        values = []
+        jacobians = []
+        requirements = self.map_positions_to_fields(requirements)
+        for field, requirement in zip(self.fields, requirements):
+            field_values, field_jacobians = field._seeded_values_jacobians(requirement, offset, total)
+            values.append(field_values)
+            jacobians.append(field_jacobians)
+            offset += field._num_outputs
+        for transform in self.transforms:
+            values, jacobians = transform.values_jacobians(values, jacobians)
+        return values, jacobians
+
+    def _accumulate_adjoint(self, requirements, cotangent, offset, accumulator):
+        requirements = self.map_positions_to_fields(requirements)
+        for field, requirement in zip(self.fields, requirements):
+            field._accumulate_adjoint(requirement, cotangent, offset, accumulator)
+            offset += field._num_outputs
+
     def append(self, other):
         if isinstance(other, FieldPoint):
+            other = self._share_implementations(other)
             position_idx = self._find_pos_idx(other.position)
             self._field_position_idx.append(position_idx)
             if not self.values_require[position_idx].includes(other.values_require):
@@ -784,6 +1213,7 @@ class MultiFieldPoint(MultiFieldBase):
                 self._clear_cache(position_idx)
 
         elif isinstance(other, MultiFieldPoint):
+            other = self._share_implementations(other)
             self._field_position_idx.append([])
             for position, values_require, jacobians_require in zip(other.positions, other.values_require, other.jacobians_require):
                 position_idx = self._find_pos_idx(position)
@@ -805,32 +1235,78 @@ class MultiFieldPoint(MultiFieldBase):
     def _clear_cache(self, idx=None):
         if idx is None:
             self._cached_requests = [None] * len(self.positions)
+            self._cached_geometries = [None] * len(self.positions)
+            self._cached_wavenumber = None
         else:
+            # The geometry only depends on the position, so it is kept when the requirements change.
             self._cached_requests[idx] = None
 
+    def _requests(self, requirements):
+        """Get the evaluated requests at all the positions.
+
+        See `FieldPoint` for details on how the cached requests are updated.
+        """
+        if self._cached_wavenumber != self.array.k:
+            self._cached_requests = [None] * len(self.positions)
+            self._cached_wavenumber = self.array.k
+        for idx, (position, requirement) in enumerate(zip(self.positions, requirements)):
+            if self._cached_requests[idx] is None:
+                if self._cached_geometries[idx] is None:
+                    self._cached_geometries[idx] = self.array.geometry(position)
+                self._cached_requests[idx] = self.array.request(requirement, position, geometry=self._cached_geometries[idx])
+        return self._cached_requests
+
     @property
     def cost_function(self):
         return CostFunctionMulti(*self.fields, transforms=self.transforms)
 
 
 class CostFunctionSingle(FieldPoint):
+    """Scalar cost function of a single bound field, evaluating both values and jacobians.
+
+    Attributes
+    ----------
+    use_adjoint : bool
+        Evaluate the jacobians in reverse mode, where the jacobians of the field
+        implementations are contracted with the derivatives of the cost function
+        instead of being evaluated for all transducers. Default True.
+
+    """
+
+    use_adjoint = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.shape != ():
             raise ValueError(f'Cannot create non-scalar cost function of shape {self.shape}')
 
     def __call__(self, complex_transducer_amplitudes):
-        try:
-            requests = self._cached_requests
-        except AttributeError:
-            requests = self._cached_requests = self.array.request(self.values_require + self.jacobians_require, self.position)
+        requests = self._requests(self.values_require + self.jacobians_require)
 
         requirements = self.evaluate_requirements(complex_transducer_amplitudes, requests)
-        values, jacobians = self.values_jacobians(requirements)
+        if self.use_adjoint:
+            values, jacobians = self._adjoint_values_jacobians(requirements)
+        else:
+            values, jacobians = self.values_jacobians(requirements)
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _states_first(values), _states_first(jacobians)
         return values, jacobians
 
 
 class CostFunctionMulti(MultiFieldPoint):
+    """Scalar cost function of multiple bound fields, evaluating both values and jacobians.
+
+    Attributes
+    ----------
+    use_adjoint : bool
+        Evaluate the jacobians in reverse mode, where the jacobians of the field
+        implementations are contracted with the derivatives of the cost function
+        instead of being evaluated for all transducers. Default True.
+
+    """
+
+    use_adjoint = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.shape != ():
@@ -841,9 +1317,11 @@ class CostFunctionMulti(MultiFieldPoint):
 
         Parameters
         ----------
-        compelx_transducer_amplitudes : complex numpy.ndarray
+        complex_transducer_amplitudes : complex numpy.ndarray
             Complex representation of the transducer phases and amplitudes of the
-            array used to create the field.
+            array used to create the field. Multiple states can be evaluated at once
+            by stacking them in a (K, N) array, which gives a leading state axis
+            in the returned values.
 
         Returns
         -------
@@ -853,12 +1331,14 @@ class CostFunctionMulti(MultiFieldPoint):
             arrays in the list might not have compatible shapes.
 
         """
-        for idx, (position, values_require, jacobians_require) in enumerate(zip(self.positions, self.values_require, self.jacobians_require)):
-            if self._cached_requests[idx] is None:
-                self._cached_requests[idx] = self.array.request(values_require + jacobians_require, position)
-
-        requirements = [self.evaluate_requirements(complex_transducer_amplitudes, request) for request in self._cached_requests]
-        values, jacobians = self.values_jacobians(requirements)
+        requests = self._requests([values_require + jacobians_require for values_require, jacobians_require in zip(self.values_require, self.jacobians_require)])
+        requirements = [self.evaluate_requirements(complex_transducer_amplitudes, request) for request in requests]
+        if self.use_adjoint:
+            values, jacobians = self._adjoint_values_jacobians(requirements)
+        else:
+            values, jacobians = self.values_jacobians(requirements)
+        if np.ndim(complex_transducer_amplitudes) > 1:
+            return _states_first(values), _states_first(jacobians)
         return values, jacobians
 
 
@@ -0,0 +1,462 @@
+"""Accelerated evaluation of sound fields from large arrays.
+
+Evaluating the sound field directly scales with the number of transducers
+times the number of positions, which limits field maps of large arrays over
+large grids. The classes in this module trade a controlled approximation
+for fewer operations, or use the structure of the array and the grid.
+
+.. autosummary::
+    :nosignatures:
+
+    TreeCode
+    AngularSpectrum
+
+"""
+
+import functools
+import math
+import numpy as np
+import scipy.special
+from . import _indexing, transducers
+
+
+class TreeCode:
+    """Tree-code evaluation of the sound field from a transducer array.
+
+    The positions are grouped in cubic boxes. For each box, the transducers
+    far from the box are combined into local spherical harmonics expansions
+    around the center of the box, which are evaluated at all positions in the box.
+    The transducers close to the box are evaluated directly.
+    This replaces the number of transducers times the number of positions with
+    the number of transducers times the number of boxes, plus the number of
+    positions times the number of expansion coefficients.
+
+    The spherical spreading is expanded exactly using the addition theorem,
+    while the directivity of each far transducer is approximated over the box
+    with a Taylor polynomial around the box center. Each term in the polynomial
+    multiplies a separate expansion, with the directivity derivatives as weights.
+    A transducer is far from a box if the distance to the box center is at least
+    `separation` times the radius of the box, and the Taylor polynomial matches
+    the directivity to within `tolerance`, sampled on the bounding sphere of the box.
+    The expansion order is chosen so that the truncation error is below `tolerance`
+    at this separation. The error in the field from each transducer is then
+    approximately `tolerance` relative to the magnitude of the field from that transducer.
+
+    Parameters
+    ----------
+    array : TransducerArray
+        The array to evaluate the sound field from.
+        The transducer model must be a `~levitate.transducers.PointSource` or a subclass.
+    box_size : float, optional
+        The side length of the boxes. Defaults to one wavelength.
+    tolerance : float, default 1e-6
+        The relative accuracy target for the field from each transducer.
+    separation : float, default 2
+        The minimum distance from a far transducer to the box center, relative to the box radius.
+    directivity_order : int, default 2
+        The order of the Taylor polynomials for the directivity, at most 3.
+    memory_budget : int, default 256 MiB
+        The approximate number of bytes to use for intermediate arrays.
+
+    """
+
+    def __init__(self, array, box_size=None, tolerance=1e-6, separation=2, directivity_order=2, memory_budget=2**28):
+        self.array = array
+        self.box_size = box_size
+        self.tolerance = tolerance
+        self.separation = separation
+        self.directivity_order = directivity_order
+        self.memory_budget = memory_budget
+
+    def expansion_order(self, radius):
+        """Find the order needed for expansions over a sphere.
+
+        Uses the terms in the addition theorem for spherical waves to find the
+        order where the remaining terms are below the tolerance, for
+        transducers at `separation` times the radius.
+
+        Parameters
+        ----------
+        radius : float
+            The radius of the sphere which the expansion should cover.
+
+        Returns
+        -------
+        order : int
+            The expansion order.
+
+        """
+        k = self.array.k
+        inner = k * radius
+        outer = inner * self.separation
+        n = np.arange(int(inner) + 200)
+        with np.errstate(over='ignore', invalid='ignore'):
+            bessel = scipy.special.spherical_jn(n, inner)
+            hankel = scipy.special.spherical_jn(n, outer) + 1j * scipy.special.spherical_yn(n, outer)
+            terms = (2 * n + 1) * np.abs(bessel) * np.abs(hankel)
+        # Stop where the Bessel functions underflow or the Hankel functions overflow.
+        valid = np.isfinite(terms) & (bessel != 0)
+        if not np.all(valid):
+            terms = terms[:np.argmin(valid)]
+        # The field from a transducer has magnitude of at least 1 / (k (R + r)) at the positions.
+        tail = np.cumsum(terms[::-1])[::-1] * k * (outer / k + radius)
+        converged = np.nonzero(tail[1:] <= self.tolerance)[0]
+        if len(converged) == 0:
+            raise ValueError('Cannot reach tolerance {} with separation {}'.format(self.tolerance, self.separation))
+        return int(converged[0])
+
+    def pressure_derivs(self, complex_transducer_amplitudes, positions, orders=0):
+        """Calculate the summed spatial derivatives of the sound pressure.
+
+        Parameters
+        ----------
+        complex_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes.
+        positions : numpy.ndarray
+            The location(s) at which to evaluate the sound field, shape (3, ...).
+        orders : int
+            How many orders of derivatives to calculate. Currently three orders are supported.
+
+        Returns
+        -------
+        derivatives : numpy.ndarray
+            Array with the calculated derivatives, same as the sum over the transducers
+            in `TransducerArray.pressure_derivs`. Has the shape `(M,) + positions.shape[1:]`
+            where `M` is the number of spatial derivatives, see `num_spatial_derivatives`
+            and `spatial_derivative_order`.
+
+        """
+        transducer = self.array.transducer
+        if not isinstance(transducer, transducers.PointSource):
+            raise NotImplementedError('The tree code needs a transducer model based on `PointSource`, got `{}`'.format(type(transducer).__name__))
+        positions = np.asarray(positions)
+        complex_transducer_amplitudes = np.asarray(complex_transducer_amplitudes)
+        flat_positions = positions.reshape(3, -1)
+        num_derivs = _indexing.num_pressure_derivs[orders]
+
+        box_size = self.array.wavelength if self.box_size is None else self.box_size
+        radius = 0.5 * 3**0.5 * box_size
+        order = self.expansion_order(radius)
+        origin = flat_positions.min(axis=1, keepdims=True)
+        boxes, box_index = np.unique(np.floor((flat_positions - origin) / box_size).astype(int), axis=1, return_inverse=True)
+        centers = origin + (boxes + 0.5) * box_size
+        # The positions are sorted by box, so that each box is a contiguous range.
+        sort_index = np.argsort(box_index.reshape(-1), kind='stable')
+        box_bounds = np.searchsorted(box_index.reshape(-1)[sort_index], np.arange(centers.shape[1] + 1))
+        sorted_positions = flat_positions[:, sort_index]
+        sorted_derivatives = np.zeros((num_derivs, flat_positions.shape[1]), dtype=np.complex128)
+
+        box_nbytes = (order + orders + 2)**2 * self.array.num_transducers * 16
+        for chunk in self._chunks(centers.shape[1], box_nbytes):
+            far, directivity = self._directivity_polynomials(centers[:, chunk], radius)
+            weights = far * complex_transducer_amplitudes[:, None] * directivity
+            expansions = self._local_expansions(weights, centers[:, chunk], order, orders)
+            points = slice(box_bounds[chunk.start], box_bounds[chunk.stop])
+            sorted_derivatives[:, points] = self._evaluate_expansions(
+                expansions, centers[:, chunk], box_bounds[chunk.start:chunk.stop + 1] - points.start, sorted_positions[:, points], order, orders)
+
+            # Direct evaluation of the transducers close to each box.
+            for box in range(chunk.start, chunk.stop):
+                near = ~far[:, box - chunk.start]
+                if not np.any(near):
+                    continue
+                indices = slice(box_bounds[box], box_bounds[box + 1])
+                near_derivatives = transducer.pressure_derivs(
+                    self.array.positions[:, near], self.array.normals[:, near], sorted_positions[:, indices], orders)
+                sorted_derivatives[:, indices] += np.einsum('i,ji...->j...', complex_transducer_amplitudes[near], near_derivatives)
+
+        derivatives = np.empty((num_derivs, flat_positions.shape[1]), dtype=transducer.dtype)
+        derivatives[:, sort_index] = sorted_derivatives
+        return derivatives.reshape((num_derivs,) + positions.shape[1:])
+
+    def evaluate(self, field, complex_transducer_amplitudes, positions):
+        """Evaluate a field using the tree code.
+
+        Works for fields which only need the summed pressure derivatives,
+        e.g. `~levitate.fields.Pressure` and `~levitate.fields.Velocity`.
+
+        Parameters
+        ----------
+        field : Field or MultiField
+            The field to evaluate, without bound positions.
+        complex_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes.
+        positions : numpy.ndarray
+            The location(s) at which to evaluate the field, shape (3, ...).
+
+        Returns
+        -------
+        values : numpy.ndarray
+            The values of the field.
+
+        """
+        values_require = field.values_require
+        if isinstance(values_require, list):
+            raise TypeError('The tree code can only evaluate fields without positions')
+        unsupported = set(values_require) - {'pressure_derivs_summed', 'complex_transducer_amplitudes'}
+        if len(unsupported) > 0:
+            raise ValueError('The tree code cannot evaluate the requirements {}'.format(sorted(unsupported)))
+        requirements = {'complex_transducer_amplitudes': np.asarray(complex_transducer_amplitudes)}
+        if 'pressure_derivs_summed' in values_require:
+            requirements['pressure_derivs_summed'] = self.pressure_derivs(complex_transducer_amplitudes, positions, orders=values_require['pressure_derivs_summed'])
+        return field.values(requirements)
+
+    def _chunks(self, num_items, item_nbytes):
+        chunk_size = max(1, int(self.memory_budget // max(item_nbytes, 1)))
+        for start in range(0, num_items, chunk_size):
+            yield slice(start, min(start + chunk_size, num_items))
+
+    def _directivity_polynomials(self, centers, radius):
+        transducer = self.array.transducer
+        source_positions, source_normals = self.array.positions, self.array.normals
+        # Axes and diagonals, sampling the bounding spheres of the boxes.
+        directions = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]] + [[x, y, 1] for x in (-1, 1) for y in (-1, 1)]).T
+        directions = np.concatenate([directions, -directions], axis=1)
+        directions = directions / np.sum(directions**2, axis=0)**0.5
+        directivity = transducer.directivity_derivatives(source_positions, source_normals, centers, orders=self.directivity_order)
+        sampled = transducer.directivity(source_positions, source_normals, centers[:, :, None] + radius * directions[:, None, :])
+        polynomial = np.einsum('anb,as->nbs', directivity, _monomials(radius * directions, self.directivity_order))
+        reference = np.maximum(np.max(np.abs(sampled), axis=-1), np.abs(directivity[0]))
+        distance = np.sum((source_positions[:, :, None] - centers[:, None, :])**2, axis=0)**0.5
+        far = (distance >= self.separation * radius) & (np.max(np.abs(sampled - polynomial), axis=-1) <= self.tolerance * reference)
+        return far, directivity
+
+    def _local_expansions(self, weights, centers, order, orders):
+        # One expansion of the spherical spreading for each term in the directivity polynomials.
+        transducer = self.array.transducer
+        monopole = transducers.PointSource(freq=transducer.freq, p0=transducer.p0, medium=transducer.medium)
+        num_derivs = _indexing.num_pressure_derivs[orders]
+        num_coefficients = (order + 1)**2
+        coefficients = monopole.spherical_harmonics(self.array.positions, self.array.normals, centers, orders=order + orders)
+        # Sum over the transducers as a matrix product for each box, shape (terms, coefficients, boxes).
+        summed = np.matmul(np.ascontiguousarray(coefficients.transpose(2, 0, 1)), np.ascontiguousarray(weights.transpose(2, 1, 0))).transpose(2, 1, 0)
+        expansions = np.zeros((weights.shape[0], num_derivs, num_coefficients, centers.shape[1]), dtype=np.complex128)
+        for term, term_weights in enumerate(weights):
+            if not np.any(term_weights):
+                continue
+            # The derivative expansions are calculated from the gradients of the lower order derivatives,
+            # each of which has one order less in the expansion.
+            derivative_expansions = {'': summed[term]}
+            gradients = {}
+            for idx, name in enumerate(_indexing.pressure_derivs_order[:num_derivs]):
+                if name:
+                    prefix = name[:-1]
+                    if prefix not in gradients:
+                        gradients[prefix] = transducers._spherical_harmonics_gradient(
+                            derivative_expansions[prefix], order + orders - len(prefix) - 1, self.array.k)
+                    derivative_expansions[name] = gradients[prefix]['xyz'.index(name[-1])]
+                expansions[term, idx] = derivative_expansions[name][:num_coefficients]
+        return expansions
+
+    def _evaluate_expansions(self, expansions, centers, box_bounds, positions, order, orders):
+        num_terms, num_derivs, num_coefficients = expansions.shape[:3]
+        expansion_orders = np.repeat(np.arange(order + 1), 2 * np.arange(order + 1) + 1)
+        combinations = _polynomial_product_rule(self.directivity_order, orders)
+        box_index = np.repeat(np.arange(centers.shape[1]), np.diff(box_bounds))
+        derivatives = np.zeros((num_derivs, positions.shape[1]), dtype=np.complex128)
+        point_nbytes = (num_terms * num_derivs + 2) * num_coefficients * 16
+        for chunk in self._chunks(positions.shape[1], point_nbytes):
+            diff = positions[:, chunk] - centers[:, box_index[chunk]]
+            distance = np.sum(diff**2, axis=0)**0.5
+            # The direction is arbitrary at the center of the box, where only the zeroth order is non-zero.
+            at_center = distance == 0
+            safe_distance = np.where(at_center, 1, distance)
+            cos_theta = np.where(at_center, 1, diff[2] / safe_distance)
+            sin_theta_exp_phi = np.where(at_center, 0, (diff[0] - 1j * diff[1]) / safe_distance)
+            basis = np.conjugate(transducers._conjugate_spherical_harmonics(cos_theta, sin_theta_exp_phi, order))
+            basis *= scipy.special.spherical_jn(np.arange(order + 1)[:, None], self.array.k * distance)[expansion_orders]
+            values = np.empty((num_terms * num_derivs, basis.shape[1]), dtype=np.complex128)
+            for box in range(box_index[chunk.start], box_index[chunk.stop - 1] + 1):
+                indices = slice(max(box_bounds[box], chunk.start) - chunk.start, min(box_bounds[box + 1], chunk.stop) - chunk.start)
+                values[:, indices] = expansions[..., box].reshape(-1, num_coefficients) @ basis[:, indices]
+            values = values.reshape(num_terms, num_derivs, -1)
+            polynomials = np.einsum('dtem,mp->dtep', combinations, _monomials(diff, self.directivity_order))
+            derivatives[:, chunk] = np.einsum('dtep,tep->dp', polynomials, values)
+        return derivatives
+
+
+class AngularSpectrum:
+    """FFT evaluation of the sound field from an array on regular grids.
+
+    When all transducers have the same normal and are placed on the lattice
+    of a regular grid of positions, e.g. a `~levitate.arrays.RectangularArray`
+    and a slice parallel to the array with compatible spacing, the summed field is a
+    discrete convolution of the transducer amplitudes with the field from a single
+    transducer. The angular spectrum of the field on the grid is then the product of
+    the spectrum of the amplitudes and the spectrum of the single transducer field,
+    and the whole grid is evaluated with a few FFTs. The single transducer field is
+    sampled over the grid and transformed, rather than using the analytic transfer
+    function, so the result is the same as the direct evaluation up to rounding.
+
+    Transducers which are offset from the lattice by the same amount share a
+    convolution, so slices which are not parallel to the array need one convolution
+    for each row of transducers in the slice direction.
+
+    Each evaluation is validated against the direct evaluation at a few positions
+    in the grid.
+
+    Parameters
+    ----------
+    array : TransducerArray
+        The array to evaluate the sound field from.
+        All transducers must have the same normal, and the transducer
+        model cannot have reflectors.
+    validate : int, default 8
+        The number of positions where the result is compared to the direct evaluation.
+    tolerance : float, default 1e-6
+        The largest accepted difference in the validation, relative to the
+        summed magnitude of the fields from the individual transducers.
+
+    """
+
+    def __init__(self, array, validate=8, tolerance=1e-6):
+        self.array = array
+        self.validate = validate
+        self.tolerance = tolerance
+
+    def pressure_derivs(self, complex_transducer_amplitudes, positions, orders=0):
+        """Calculate the summed spatial derivatives of the sound pressure.
+
+        Parameters
+        ----------
+        complex_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes.
+        positions : numpy.ndarray
+            The location(s) at which to evaluate the sound field, shape (3, ...).
+            Must be a regular grid, e.g. from `numpy.mgrid`.
+        orders : int
+            How many orders of derivatives to calculate. Currently three orders are supported.
+
+        Returns
+        -------
+        derivatives : numpy.ndarray
+            Array with the calculated derivatives, same as the sum over the transducers
+            in `TransducerArray.pressure_derivs`. Has the shape `(M,) + positions.shape[1:]`
+            where `M` is the number of spatial derivatives, see `num_spatial_derivatives`
+            and `spatial_derivative_order`.
+
+        Raises
+        ------
+        ValueError
+            If the positions are not a regular grid, or the array cannot be placed on it.
+        RuntimeError
+            If the validation against the direct evaluation fails.
+
+        """
+        positions = np.asarray(positions)
+        complex_transducer_amplitudes = np.asarray(complex_transducer_amplitudes)
+        grid_lattice = self.array._grid_lattice(positions)
+        if grid_lattice is None:
+            raise ValueError('The angular spectrum needs positions on a regular grid and transducers with the same normal')
+        axes, steps, lattice, groups = grid_lattice
+        grid_shape = positions.shape[1:]
+        fft_axes = tuple(axis + 1 for axis in axes)
+
+        derivatives = 0
+        for group in range(np.max(groups) + 1):
+            members = np.nonzero(groups == group)[0]
+            table = self.array._lattice_table(positions, axes, steps, lattice, members, orders)
+            lower = np.min(lattice[:, members], axis=1)
+            upper = np.max(lattice[:, members], axis=1)
+            # The amplitudes are placed on the lattice, reversed, so that the
+            # convolution with the table at index `i + max(m) - min(m)` gives grid index `i`.
+            image_shape = [1] * len(grid_shape)
+            for axis, size in zip(axes, upper - lower + 1):
+                image_shape[axis] = size
+            image = np.zeros(image_shape, dtype=table.dtype)
+            index = [np.zeros(len(members), dtype=int)] * len(grid_shape)
+            for axis, coordinates in zip(axes, lattice[:, members] - lower[:, None]):
+                index[axis] = coordinates
+            np.add.at(image, tuple(index), complex_transducer_amplitudes[members])
+
+            sizes = [table.shape[axis] for axis in fft_axes]
+            spectrum = np.fft.fftn(table, s=sizes, axes=fft_axes) * np.fft.fftn(image, s=sizes, axes=tuple(axes))
+            convolution = np.fft.ifftn(spectrum, s=sizes, axes=fft_axes)
+            output = [slice(None)] * len(grid_shape)
+            for axis, size in zip(axes, upper - lower + 1):
+                output[axis] = slice(size - 1, size - 1 + grid_shape[axis])
+            derivatives = derivatives + convolution[(slice(None),) + tuple(output)]
+        derivatives = np.asarray(derivatives, dtype=self.array.transducer.dtype)
+
+        if self.validate > 0:
+            self._validate(derivatives, complex_transducer_amplitudes, positions, orders)
+        return derivatives
+
+    def evaluate(self, field, complex_transducer_amplitudes, positions):
+        """Evaluate a field using the angular spectrum.
+
+        Works for fields which only need the summed pressure derivatives,
+        e.g. `~levitate.fields.Pressure` and `~levitate.fields.Velocity`.
+
+        Parameters
+        ----------
+        field : Field or MultiField
+            The field to evaluate, without bound positions.
+        complex_transducer_amplitudes : complex numpy.ndarray
+            Complex representation of the transducer phases and amplitudes.
+        positions : numpy.ndarray
+            The location(s) at which to evaluate the field, a regular grid with shape (3, ...).
+
+        Returns
+        -------
+        values : numpy.ndarray
+            The values of the field.
+
+        """
+        values_require = field.values_require
+        if isinstance(values_require, list):
+            raise TypeError('The angular spectrum can only evaluate fields without positions')
+        unsupported = set(values_require) - {'pressure_derivs_summed', 'complex_transducer_amplitudes'}
+        if len(unsupported) > 0:
+            raise ValueError('The angular spectrum cannot evaluate the requirements {}'.format(sorted(unsupported)))
+        requirements = {'complex_transducer_amplitudes': np.asarray(complex_transducer_amplitudes)}
+        if 'pressure_derivs_summed' in values_require:
+            requirements['pressure_derivs_summed'] = self.pressure_derivs(complex_transducer_amplitudes, positions, orders=values_require['pressure_derivs_summed'])
+        return field.values(requirements)
+
+    def _validate(self, derivatives, complex_transducer_amplitudes, positions, orders):
+        flat_derivatives = derivatives.reshape(derivatives.shape[0], -1)
+        samples = np.unique(np.linspace(0, flat_derivatives.shape[1] - 1, self.validate).astype(int))
+        direct = self.array.pressure_derivs(positions.reshape(3, -1)[:, samples], orders=orders)
+        magnitudes = np.einsum('i,ji...->j...', np.abs(complex_transducer_amplitudes), np.abs(direct))
+        direct = np.einsum('i,ji...->j...', complex_transducer_amplitudes, direct)
+        error = np.abs(flat_derivatives[:, samples] - direct)
+        if np.any(error > self.tolerance * magnitudes):
+            raise RuntimeError('The angular spectrum differs from the direct evaluation by up to {:.3g} relative to the field magnitude'.format(
+                np.max(error / np.maximum(magnitudes, np.finfo(magnitudes.dtype).tiny))))
+
+
+def _monomials(diff, orders):
+    """Calculate the Taylor monomials for the spatial derivatives, ordered as `pressure_derivs_order`."""
+    monomials = np.empty((_indexing.num_pressure_derivs[orders],) + diff.shape[1:])
+    for idx, name in enumerate(_indexing.pressure_derivs_order[:len(monomials)]):
+        monomials[idx] = 1
+        for axis, component in enumerate(diff):
+            count = name.count('xyz'[axis])
+            if count > 0:
+                monomials[idx] *= component**count / math.factorial(count)
+    return monomials
+
+
+@functools.lru_cache(maxsize=None)
+def _polynomial_product_rule(polynomial_orders, orders):
+    """Coefficients for the derivatives of Taylor monomials times expansions.
+
+    The derivative `d` of a sum over terms `t`, with Taylor monomials `P_t` multiplying
+    the expansions `E_t`, is the sum of `combinations[d, t, e, m] * P_m * E_t^e`,
+    where `E_t^e` is the derivative `e` of the expansion.
+    """
+    counts = [tuple(name.count(axis) for axis in 'xyz') for name in _indexing.pressure_derivs_order]
+    index = {count: idx for idx, count in enumerate(counts)}
+    num_terms = _indexing.num_pressure_derivs[polynomial_orders]
+    num_derivs = _indexing.num_pressure_derivs[orders]
+    combinations = np.zeros((num_derivs, num_terms, num_derivs, num_terms))
+    for derivative in range(num_derivs):
+        for coefficient, monomial_derivative, expansion_derivative in _indexing.pressure_derivs_product_rule[derivative]:
+            for term in range(num_terms):
+                # The derivative of (r - r0)^a / a! is (r - r0)^(a - b) / (a - b)!, or zero if b > a.
+                remaining = tuple(a - b for a, b in zip(counts[term], counts[monomial_derivative]))
+                if min(remaining) >= 0:
+                    combinations[derivative, term, expansion_derivative, index[remaining]] += coefficient
+    combinations.flags.writeable = False
+    return combinations
@@ -14,19 +14,332 @@ sound fields for any number of source positions and receiver positions at once.
     PlaneWaveTransducer
     CircularPiston
     CircularRing
+    TabulatedTransducer
     TransducerReflector
+    ImageSourceReflector
+    Workspace
+    SourceReceiverGeometry
 """
 
 import numpy as np
+import copy
+import functools
+import inspect
 import logging
+from math import factorial
 from scipy.special import j0, j1
-from scipy.special import spherical_jn, spherical_yn, sph_harm
+from scipy.interpolate import make_interp_spline, PPoly
 from .materials import air
-from . import _indexing
+from . import _indexing, _kernels
 
 logger = logging.getLogger(__name__)
 
 
+class Workspace:
+    """Reusable storage for intermediate arrays.
+
+    Evaluating the sound field models requires a number of intermediate arrays
+    of the same size as the output, e.g. distances and phases. A workspace keeps
+    these arrays between calls, so that repeated evaluations with the same shapes
+    can reuse the memory instead of allocating new arrays.
+    Pass the same workspace object to e.g. `PointSource.pressure_derivs` or
+    `TransducerArray.pressure_derivs` for each call, preferably together with
+    a preallocated output array using the `out` argument.
+
+    Note
+    ----
+    The intermediate arrays will be overwritten by subsequent calls, so a workspace
+    should not be used by multiple threads simultaneously.
+
+    Attributes
+    ----------
+    allocations : int
+        The number of arrays which have been allocated by this workspace,
+        excluding any sub-workspaces.
+
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self._children = {}
+        self.allocations = 0
+
+    def array(self, name, shape, dtype=np.float64):
+        """Get an array from the workspace.
+
+        If the workspace has an array with the requested name, shape, and dtype,
+        that array is returned. Otherwise a new array is allocated and stored.
+        The content of the returned array is undefined.
+
+        Parameters
+        ----------
+        name : str
+            Identifier for the array.
+        shape : tuple of int
+            The shape of the array.
+        dtype : data-type, default float64
+            The data type of the array.
+
+        Returns
+        -------
+        array : numpy.ndarray
+            The stored array.
+
+        """
+        shape = tuple(shape)
+        array = self._arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = self._arrays[name] = np.empty(shape, dtype=dtype)
+            self.allocations += 1
+        return array
+
+    def child(self, name):
+        """Get a named sub-workspace.
+
+        Sub-workspaces are used when models are nested, e.g. for reflectors,
+        to keep the arrays used by the inner model separate.
+        """
+        try:
+            return self._children[name]
+        except KeyError:
+            child = self._children[name] = type(self)()
+            return child
+
+    @property
+    def nbytes(self):
+        """The total number of bytes used by the workspace and its sub-workspaces."""
+        return sum(array.nbytes for array in self._arrays.values()) + sum(child.nbytes for child in self._children.values())
+
+
+def _output_array(out, shape, dtype=np.complex128):
+    """Validate or allocate an output array."""
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != tuple(shape):
+        raise ValueError('Output array has shape {}, expected {}'.format(out.shape, tuple(shape)))
+    return out
+
+
+class SourceReceiverGeometry:
+    """Geometric relations between sources and receivers.
+
+    Most transducer models need the vectors from the sources to the receivers,
+    the distances, and the angles to the source normals. This class calculates
+    these quantities when they are first needed, and keeps them for reuse.
+    Passing the same geometry to several model methods, using the `geometry`
+    keyword argument, avoids calculating them more than once.
+    `~levitate.arrays.TransducerArray.request` does this for all requests.
+
+    Parameters
+    ----------
+    source_positions : numpy.ndarray
+        The location of the transducer, as a (3, ...) shape array.
+    source_normals : numpy.ndarray or None
+        The look direction of the transducer, as a (3, ...) shape array.
+        Only needed for the angles.
+    receiver_positions : numpy.ndarray
+        The location(s) at which to evaluate the radiation, shape (3, ...).
+    dtype : data-type, default float64
+        The real data type of the calculated arrays.
+    workspace : Workspace, optional
+        Storage to use for the calculated arrays.
+
+    Attributes
+    ----------
+    shape : tuple
+        The shape `source_positions.shape[1:] + receiver_positions.shape[1:]`.
+    diff : numpy.ndarray
+        The vectors from the sources to the receivers, shape `(3,) + shape`.
+    distance : numpy.ndarray
+        The length of `diff`.
+    normals : numpy.ndarray
+        The normalized source normals, shaped to broadcast with `diff`.
+    cos_angle : numpy.ndarray
+        The cosine of the angle between the source normal and `diff`.
+    sin_angle : numpy.ndarray
+        The (non-negative) sine of the angle between the source normal and `diff`.
+
+    """
+
+    def __init__(self, source_positions, source_normals, receiver_positions, dtype=np.float64, workspace=None):
+        self.source_positions = np.asarray(source_positions)
+        self.source_normals = None if source_normals is None else np.asarray(source_normals)
+        self.receiver_positions = np.asarray(receiver_positions)
+        if self.receiver_positions.shape[0] != 3:
+            raise ValueError('Incorrect shape of positions')
+        self.dtype = np.dtype(dtype)
+        self.shape = self.source_positions.shape[1:2] + self.receiver_positions.shape[1:]
+        self._workspace = workspace if workspace is not None else Workspace()
+
+    def matches(self, source_positions, source_normals, receiver_positions):
+        """Check if the geometry describes a set of sources and receivers.
+
+        Normals are only compared if both this geometry and the
+        inputs have normals.
+        """
+        def same(first, second):
+            if first is second:
+                return True
+            return np.shape(first) == np.shape(second) and np.array_equal(first, second)
+        return (
+            same(self.source_positions, source_positions)
+            and same(self.receiver_positions, receiver_positions)
+            and (self.source_normals is None or source_normals is None or same(self.source_normals, source_normals))
+        )
+
+    @property
+    def diff(self):
+        try:
+            return self._diff
+        except AttributeError:
+            pass
+        source_positions, receiver_positions = self.source_positions, self.receiver_positions
+        self._diff = self._workspace.array('diff', (3,) + self.shape, self.dtype)
+        np.subtract(
+            receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:]),
+            source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,)),
+            out=self._diff)
+        return self._diff
+
+    @property
+    def distance(self):
+        try:
+            return self._distance
+        except AttributeError:
+            pass
+        self._distance = self._workspace.array('distance', self.shape, self.dtype)
+        np.einsum('i...,i...->...', self.diff, self.diff, out=self._distance)
+        np.sqrt(self._distance, out=self._distance)
+        return self._distance
+
+    @property
+    def normals(self):
+        try:
+            return self._normals
+        except AttributeError:
+            pass
+        if self.source_normals is None:
+            raise ValueError('Source normals are needed to calculate the angles')
+        normals = self.source_normals / np.sum(self.source_normals**2, axis=0)**0.5
+        self._normals = normals.reshape(self.source_positions.shape[:2] + (self.receiver_positions.ndim - 1) * (1,)).astype(self.dtype, copy=False)
+        return self._normals
+
+    @property
+    def cos_angle(self):
+        try:
+            return self._cos_angle
+        except AttributeError:
+            pass
+        self._cos_angle = self._workspace.array('cos_angle', self.shape, self.dtype)
+        np.einsum('i...,i...->...', self.diff, self.normals, out=self._cos_angle)
+        self._cos_angle /= self.distance
+        # Clip needed because numrical precicion sometimes give a value slightly outside the reasonable range.
+        np.clip(self._cos_angle, -1, 1, out=self._cos_angle)
+        return self._cos_angle
+
+    @property
+    def sin_angle(self):
+        try:
+            return self._sin_angle
+        except AttributeError:
+            pass
+        self._sin_angle = self._workspace.array('sin_angle', self.shape, self.dtype)
+        np.multiply(self.cos_angle, self.cos_angle, out=self._sin_angle)
+        np.subtract(1, self._sin_angle, out=self._sin_angle)
+        np.sqrt(self._sin_angle, out=self._sin_angle)
+        return self._sin_angle
+
+
+def _geometry(geometry, source_positions, source_normals, receiver_positions, dtype=np.float64, workspace=None):
+    """Reuse a geometry if it matches the inputs, otherwise create a new one."""
+    if geometry is not None and geometry.matches(source_positions, source_normals, receiver_positions):
+        return geometry
+    return SourceReceiverGeometry(source_positions, source_normals, receiver_positions, dtype=dtype, workspace=workspace)
+
+
+def _geometry_kwargs(method, geometry):
+    """Keyword arguments to pass a geometry to a method, if the method accepts it.
+
+    Models defined outside of this module might not accept a geometry.
+    """
+    if geometry is not None and _accepts_keyword(method, 'geometry'):
+        return {'geometry': geometry}
+    return {}
+
+
+def _accepts_keyword(method, name):
+    """Check if a method can be called with a keyword argument."""
+    return _accepts_keyword_cached(getattr(method, '__func__', method), name)
+
+
+@functools.lru_cache(maxsize=None)
+def _accepts_keyword_cached(func, name):
+    parameters = inspect.signature(func).parameters
+    return name in parameters or any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values())
+
+
+def _conjugate_spherical_harmonics(cos_theta, sin_theta_exp_phi, orders, out=None):
+    """Calculate conjugated spherical harmonics up to an order.
+
+    The harmonics are calculated for all orders using the recurrence relations
+    for normalized associated Legendre functions, with the Condon-Shortley phase included.
+    The azimuthal phase is carried by the sectoral harmonics Y_m^m, using
+    (x - jy) / r = sin(theta) exp(-j phi), which is well defined also on the z-axis.
+    The output is indexed as `~levitate._indexing.SphericalHarmonicsIndexer`.
+    """
+    sph_idx = _indexing.SphericalHarmonicsIndexer(orders)
+    out = _output_array(out, (len(sph_idx),) + np.shape(cos_theta))
+    sectoral = np.full(np.shape(cos_theta), (4 * np.pi)**-0.5, dtype=np.complex128)
+    for m in range(orders + 1):
+        if m > 0:
+            sectoral *= sin_theta_exp_phi
+            sectoral *= -((2 * m + 1) / (2 * m))**0.5
+        out[sph_idx(m, m)] = sectoral
+        if m < orders:
+            out[sph_idx(m + 1, m)] = (2 * m + 3)**0.5 * cos_theta * sectoral
+        for n in range(m + 2, orders + 1):
+            a = ((4 * n**2 - 1) / (n**2 - m**2))**0.5
+            b = (((n - 1)**2 - m**2) / (4 * (n - 1)**2 - 1))**0.5
+            # In place version of a * (cos_theta * Y_(n-1)^m - b * Y_(n-2)^m).
+            current = np.multiply(out[sph_idx(n - 1, m)], a * cos_theta, out=out[sph_idx(n, m)])
+            current -= (a * b) * out[sph_idx(n - 2, m)]
+        if m > 0:
+            # conj(Y_n^-m) = (-1)^m Y_n^m
+            for n in range(m, orders + 1):
+                np.conjugate(out[sph_idx(n, m)], out=out[sph_idx(n, -m)])
+                if m % 2:
+                    out[sph_idx(n, -m)] *= -1
+    return out
+
+
+def _spherical_harmonics_gradient(coefficients, orders, k, out=None):
+    """Calculate the gradient of spherical harmonics expansions.
+
+    Uses the ladder tables from `~levitate._indexing.spherical_harmonics_gradient_ladders`,
+    so the expansion coefficients need to be given up to order `orders + 1`.
+    The output has the three Cartesian components along the first axis, followed
+    by the coefficients of the gradient up to order `orders`.
+    """
+    coefficient_shape = (-1,) + (1,) * (coefficients.ndim - 1)
+
+    def ladder(upper, upper_coefficients, lower_target, lower, lower_coefficients, scale, out=None):
+        # Scales the small coefficient arrays instead of the full derivative arrays.
+        out = np.multiply(coefficients[upper], (scale * upper_coefficients).astype(coefficients.real.dtype).reshape(coefficient_shape), out=out)
+        out[lower_target] += (scale * lower_coefficients).astype(coefficients.real.dtype).reshape(coefficient_shape) * coefficients[lower]
+        return out
+
+    out = _output_array(out, (3, len(_indexing.SphericalHarmonicsIndexer(orders))) + coefficients.shape[1:], coefficients.dtype)
+    for order, ladders in enumerate(_indexing.spherical_harmonics_gradient_ladders(orders)):
+        modes = slice(order**2, (order + 1)**2)
+        dS_dxpiy = ladder(*ladders['xpiy'], scale=0.5 * k)
+        dS_dxmiy = ladder(*ladders['xmiy'], scale=0.5 * k)
+        np.add(dS_dxpiy, dS_dxmiy, out=out[0, modes])
+        np.subtract(dS_dxmiy, dS_dxpiy, out=out[1, modes])
+        out[1, modes] *= 1j
+        ladder(*ladders['z'], scale=k, out=out[2, modes])
+    return out
+
+
 class TransducerModel:
     """Base class for ultrasonic single frequency transducers.
 
@@ -42,6 +355,10 @@ class TransducerModel:
     physical_size : float, default 10e-3
         The physical dimentions of the transducer. Mainly used for visualization
         and some geometrical assumptions.
+    precision : {'double', 'single'}
+        The floating point precision used for the calculations.
+        Single precision gives complex64 outputs, which halves the memory
+        footprint at the cost of a relative accuracy around 1e-6.
 
     Attributes
     ----------
@@ -53,20 +370,37 @@ class TransducerModel:
         Angular frequency.
     freq : float
         Wave frequency.
+    precision : str
+        The floating point precision, see above.
+    dtype : numpy.dtype
+        The complex data type used for the outputs, non settable.
+    use_compiled : bool
+        If the pressure derivatives are calculated with compiled kernels when
+        numba is installed. Only used by `PointSource`, `CircularPiston`,
+        `CircularRing`, and `TabulatedTransducer`. Default `True`.
 
     """
 
     _repr_fmt_spec = '{:%cls(freq=%freq, p0=%p0, medium=%mediumfull, physical_size=%physical_size)}'
     _str_fmt_spec = '{:%cls(freq=%freq, p0=%p0, medium=%medium)}'
+    use_compiled = True
+
+    _precisions = {'single': (np.float32, np.complex64), 'double': (np.float64, np.complex128)}
 
-    def __init__(self, freq=40e3, p0=6, medium=air, physical_size=10e-3):
+    def __init__(self, freq=40e3, p0=6, medium=air, physical_size=10e-3, precision='double'):
         self.medium = medium
         self.freq = freq
         self.p0 = p0
         self.physical_size = physical_size
+        self.precision = precision
         # The murata transducers are measured to 85 dB SPL at 1 V at 1 m, which corresponds to ~6 Pa at 20 V
         # The datasheet specifies 120 dB SPL @ 0.3 m, which corresponds to ~6 Pa @ 1 m
 
+    @property
+    def _uses_compiled_kernel(self):
+        """If `pressure_derivs` is calculated with the compiled kernel."""
+        return self.use_compiled and _kernels.available and type(self) in _compiled_models
+
     def __format__(self, fmt_spec):
         return fmt_spec.replace('%cls', self.__class__.__name__).replace('%freq', str(self.freq)).replace('%p0', str(self.p0)).replace('%mediumfull', repr(self.medium)).replace('%medium', str(self.medium)).replace('%physical_size', str(self.physical_size))
 
@@ -87,6 +421,7 @@ class TransducerModel:
             and np.allclose(self.k, other.k)
             and self.medium == other.medium
             and self.physical_size == other.physical_size
+            and self.precision == other.precision
         )
 
     @property
@@ -121,6 +456,54 @@ class TransducerModel:
     def wavelength(self, value):
         self.k = 2 * np.pi / value
 
+    @property
+    def precision(self):
+        return self._precision
+
+    @precision.setter
+    def precision(self, value):
+        if value not in self._precisions:
+            raise ValueError("Unknown precision '{}', use one of {}".format(value, ', '.join(self._precisions)))
+        self._precision = value
+
+    @property
+    def dtype(self):
+        return np.dtype(self._precisions[self.precision][1])
+
+    @property
+    def _real_dtype(self):
+        return np.dtype(self._precisions[self.precision][0])
+
+    def _at_wavenumber(self, k):
+        """Get a copy of the model with a different wavenumber."""
+        model = copy.copy(self)
+        model.k = k
+        return model
+
+    def _evaluate_wavenumbers(self, method, wavenumbers, source_positions, source_normals, receiver_positions, *args, out=None, workspace=None, **kwargs):
+        """Evaluate a method for multiple wavenumbers.
+
+        The results are stacked along a new first axis. The source-receiver
+        geometry and the intermediate arrays are shared between the wavenumbers,
+        and the results are written directly to the output if the method accepts `out`.
+        """
+        wavenumbers = np.asarray(wavenumbers, dtype=float).reshape(-1)
+        workspace = workspace if workspace is not None else Workspace()
+        geometry = _geometry(kwargs.pop('geometry', None), source_positions, source_normals, receiver_positions, self._real_dtype)
+        for idx, k in enumerate(wavenumbers):
+            func = getattr(self._at_wavenumber(k), method)
+            call_kwargs = dict(kwargs, **_geometry_kwargs(func, geometry))
+            if _accepts_keyword(func, 'workspace'):
+                call_kwargs['workspace'] = workspace
+            if out is not None and _accepts_keyword(func, 'out'):
+                call_kwargs['out'] = out[idx]
+            value = func(source_positions, source_normals, receiver_positions, *args, **call_kwargs)
+            if out is None:
+                out = np.empty((len(wavenumbers),) + value.shape, dtype=value.dtype)
+            if value is not call_kwargs.get('out'):
+                out[idx] = value
+        return out
+
     def pressure(self, source_positions, source_normals, receiver_positions, **kwargs):
         """Calculate the complex sound pressure from the transducer.
 
@@ -158,6 +541,13 @@ class TransducerModel:
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        out : numpy.ndarray, optional
+            Preallocated array to store the derivatives in, with the shape described below.
+        workspace : Workspace, optional
+            Storage for intermediate arrays, reused between calls.
+        wavenumbers : array_like, optional
+            Evaluate for these wavenumbers instead of `k`. The derivatives for
+            each wavenumber are stacked along a new first axis.
 
         Returns
         -------
@@ -183,11 +573,12 @@ class PointSource(TransducerModel):
     where :math:`r` is the distance from the source, and :math:`k` is the wavenumber of the wave.
     """
 
-    def directivity(self, source_positions, source_normals, receiver_positions):
+    def directivity(self, source_positions, source_normals, receiver_positions, geometry=None):
         """Evaluate transducer directivity.
 
         Subclasses will preferably implement this to create new directivity models.
         Default implementation is omnidirectional sources.
+        Subclasses can use a `SourceReceiverGeometry` by accepting a `geometry` argument.
 
         Parameters
         ----------
@@ -198,6 +589,8 @@ class PointSource(TransducerModel):
         receiver_positions : numpy.ndarray
             The location(s) at which to evaluate the radiation, shape (3, ...).
             The first dimension must have length 3 and represent the coordinates of the points.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
 
         Returns
         -------
@@ -207,7 +600,7 @@ class PointSource(TransducerModel):
         """
         return np.ones(np.asarray(source_positions).shape[1:2] + np.asarray(receiver_positions).shape[1:])
 
-    def pressure_derivs(self, source_positions, source_normals, receiver_positions, orders=3, **kwargs):
+    def pressure_derivs(self, source_positions, source_normals, receiver_positions, orders=3, out=None, workspace=None, geometry=None, wavenumbers=None, **kwargs):
         """Calculate the spatial derivatives of the greens function.
 
         This is the combination of the derivative of the spherical spreading, and
@@ -224,6 +617,15 @@ class PointSource(TransducerModel):
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        out : numpy.ndarray, optional
+            Preallocated array to store the derivatives in, with the shape described below.
+        workspace : Workspace, optional
+            Storage for intermediate arrays, reused between calls.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
+        wavenumbers : array_like, optional
+            Evaluate for these wavenumbers instead of `k`. The derivatives for
+            each wavenumber are stacked along a new first axis.
 
         Returns
         -------
@@ -232,46 +634,61 @@ class PointSource(TransducerModel):
             where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
 
         """
-        receiver_positions = np.asarray(receiver_positions)
-        if receiver_positions.shape[0] != 3:
-            raise ValueError('Incorrect shape of positions')
-        wavefront_derivatives = self.wavefront_derivatives(source_positions, receiver_positions, orders)
+        if wavenumbers is not None:
+            return self._evaluate_wavenumbers('pressure_derivs', wavenumbers, source_positions, source_normals, receiver_positions, orders, out=out, workspace=workspace, geometry=geometry)
+        if self._uses_compiled_kernel:
+            return self._compiled_pressure_derivs(source_positions, source_normals, receiver_positions, orders, out=out, geometry=geometry)
+        if workspace is None:
+            workspace = Workspace()
+        geometry = _geometry(geometry, source_positions, source_normals, receiver_positions, self._real_dtype, workspace.child('geometry'))
         if type(self) == PointSource:
-            return wavefront_derivatives * self.p0
-        directivity_derivatives = self.directivity_derivatives(source_positions, source_normals, receiver_positions, orders)
+            derivatives = self.wavefront_derivatives(source_positions, receiver_positions, orders, out=out, workspace=workspace, geometry=geometry)
+            derivatives *= self.p0
+            return derivatives
+
+        shape = (_indexing.num_pressure_derivs[orders],) + geometry.shape
+        wavefront_derivatives = self.wavefront_derivatives(source_positions, receiver_positions, orders, out=workspace.array('wavefront_derivatives', shape, self.dtype), workspace=workspace, geometry=geometry)
+        directivity_derivatives = self.directivity_derivatives(source_positions, source_normals, receiver_positions, orders, **_geometry_kwargs(self.directivity_derivatives, geometry))
+
+        derivatives = _output_array(out, shape, self.dtype)
+        product = workspace.array('product', shape[1:], self.dtype)
+        for idx, terms in enumerate(_indexing.pressure_derivs_product_rule[:derivatives.shape[0]]):
+            derivative = derivatives[idx, ...]
+            (_, wavefront_idx, directivity_idx), *terms = terms
+            np.multiply(wavefront_derivatives[wavefront_idx], directivity_derivatives[directivity_idx], out=derivative)
+            for coefficient, wavefront_idx, directivity_idx in terms:
+                np.multiply(wavefront_derivatives[wavefront_idx], directivity_derivatives[directivity_idx], out=product)
+                if coefficient != 1:
+                    product *= coefficient
+                derivative += product
 
-        derivatives = np.empty(wavefront_derivatives.shape, dtype=np.complex128)
-        derivatives[0] = wavefront_derivatives[0] * directivity_derivatives[0]
-
-        if orders > 0:
-            derivatives[1] = wavefront_derivatives[0] * directivity_derivatives[1] + directivity_derivatives[0] * wavefront_derivatives[1]
-            derivatives[2] = wavefront_derivatives[0] * directivity_derivatives[2] + directivity_derivatives[0] * wavefront_derivatives[2]
-            derivatives[3] = wavefront_derivatives[0] * directivity_derivatives[3] + directivity_derivatives[0] * wavefront_derivatives[3]
-
-        if orders > 1:
-            derivatives[4] = wavefront_derivatives[0] * directivity_derivatives[4] + directivity_derivatives[0] * wavefront_derivatives[4] + 2 * directivity_derivatives[1] * wavefront_derivatives[1]
-            derivatives[5] = wavefront_derivatives[0] * directivity_derivatives[5] + directivity_derivatives[0] * wavefront_derivatives[5] + 2 * directivity_derivatives[2] * wavefront_derivatives[2]
-            derivatives[6] = wavefront_derivatives[0] * directivity_derivatives[6] + directivity_derivatives[0] * wavefront_derivatives[6] + 2 * directivity_derivatives[3] * wavefront_derivatives[3]
-            derivatives[7] = wavefront_derivatives[0] * directivity_derivatives[7] + directivity_derivatives[0] * wavefront_derivatives[7] + wavefront_derivatives[1] * directivity_derivatives[2] + directivity_derivatives[1] * wavefront_derivatives[2]
-            derivatives[8] = wavefront_derivatives[0] * directivity_derivatives[8] + directivity_derivatives[0] * wavefront_derivatives[8] + wavefront_derivatives[1] * directivity_derivatives[3] + directivity_derivatives[1] * wavefront_derivatives[3]
-            derivatives[9] = wavefront_derivatives[0] * directivity_derivatives[9] + directivity_derivatives[0] * wavefront_derivatives[9] + wavefront_derivatives[2] * directivity_derivatives[3] + directivity_derivatives[2] * wavefront_derivatives[3]
+        derivatives *= self.p0
+        return derivatives
 
-        if orders > 2:
-            derivatives[10] = wavefront_derivatives[0] * directivity_derivatives[10] + directivity_derivatives[0] * wavefront_derivatives[10] + 3 * (directivity_derivatives[4] * wavefront_derivatives[1] + wavefront_derivatives[4] * directivity_derivatives[1])
-            derivatives[11] = wavefront_derivatives[0] * directivity_derivatives[11] + directivity_derivatives[0] * wavefront_derivatives[11] + 3 * (directivity_derivatives[5] * wavefront_derivatives[2] + wavefront_derivatives[5] * directivity_derivatives[2])
-            derivatives[12] = wavefront_derivatives[0] * directivity_derivatives[12] + directivity_derivatives[0] * wavefront_derivatives[12] + 3 * (directivity_derivatives[6] * wavefront_derivatives[3] + wavefront_derivatives[6] * directivity_derivatives[3])
-            derivatives[13] = wavefront_derivatives[0] * directivity_derivatives[13] + directivity_derivatives[0] * wavefront_derivatives[13] + wavefront_derivatives[2] * directivity_derivatives[4] + directivity_derivatives[2] * wavefront_derivatives[4] + 2 * (wavefront_derivatives[1] * directivity_derivatives[7] + directivity_derivatives[1] * wavefront_derivatives[7])
-            derivatives[14] = wavefront_derivatives[0] * directivity_derivatives[14] + directivity_derivatives[0] * wavefront_derivatives[14] + wavefront_derivatives[3] * directivity_derivatives[4] + directivity_derivatives[3] * wavefront_derivatives[4] + 2 * (wavefront_derivatives[1] * directivity_derivatives[8] + directivity_derivatives[1] * wavefront_derivatives[8])
-            derivatives[15] = wavefront_derivatives[0] * directivity_derivatives[15] + directivity_derivatives[0] * wavefront_derivatives[15] + wavefront_derivatives[1] * directivity_derivatives[5] + directivity_derivatives[1] * wavefront_derivatives[5] + 2 * (wavefront_derivatives[2] * directivity_derivatives[7] + directivity_derivatives[2] * wavefront_derivatives[7])
-            derivatives[16] = wavefront_derivatives[0] * directivity_derivatives[16] + directivity_derivatives[0] * wavefront_derivatives[16] + wavefront_derivatives[3] * directivity_derivatives[5] + directivity_derivatives[3] * wavefront_derivatives[5] + 2 * (wavefront_derivatives[2] * directivity_derivatives[9] + directivity_derivatives[2] * wavefront_derivatives[9])
-            derivatives[17] = wavefront_derivatives[0] * directivity_derivatives[17] + directivity_derivatives[0] * wavefront_derivatives[17] + wavefront_derivatives[1] * directivity_derivatives[6] + directivity_derivatives[1] * wavefront_derivatives[6] + 2 * (wavefront_derivatives[3] * directivity_derivatives[8] + directivity_derivatives[3] * wavefront_derivatives[8])
-            derivatives[18] = wavefront_derivatives[0] * directivity_derivatives[18] + directivity_derivatives[0] * wavefront_derivatives[18] + wavefront_derivatives[2] * directivity_derivatives[6] + directivity_derivatives[2] * wavefront_derivatives[6] + 2 * (wavefront_derivatives[3] * directivity_derivatives[9] + directivity_derivatives[3] * wavefront_derivatives[9])
-            derivatives[19] = wavefront_derivatives[0] * directivity_derivatives[19] + wavefront_derivatives[19] * directivity_derivatives[0] + wavefront_derivatives[1] * directivity_derivatives[9] + wavefront_derivatives[2] * directivity_derivatives[8] + wavefront_derivatives[3] * directivity_derivatives[7] + directivity_derivatives[1] * wavefront_derivatives[9] + directivity_derivatives[2] * wavefront_derivatives[8] + directivity_derivatives[3] * wavefront_derivatives[7]
+    def _compiled_pressure_derivs(self, source_positions, source_normals, receiver_positions, orders, out=None, geometry=None):
+        """Calculate the pressure derivatives with the fused kernel from `~levitate._kernels`.
 
-        derivatives *= self.p0
+        The directivity and its derivatives with respect to the cosine of the
+        angle are evaluated with NumPy, everything else is done in the kernel.
+        """
+        source_positions = np.asarray(source_positions)
+        receiver_positions = np.asarray(receiver_positions)
+        shape = (_indexing.num_pressure_derivs[orders],) + source_positions.shape[1:2] + receiver_positions.shape[1:]
+        flat_shape = (shape[0], int(np.prod(source_positions.shape[1:2])), int(np.prod(receiver_positions.shape[1:])))
+        derivatives = _output_array(out, shape, self.dtype)
+        if type(self) == PointSource:
+            normals = cosine_derivatives = None
+        else:
+            geometry = _geometry(geometry, source_positions, source_normals, receiver_positions, self._real_dtype)
+            normals = geometry.normals.reshape(3, -1)
+            cosine_derivatives = np.stack(self._cosine_derivatives(geometry.cos_angle, geometry.sin_angle, orders)).reshape((orders + 1,) + flat_shape[1:])
+        flat_derivatives = derivatives.reshape(flat_shape) if derivatives.flags.c_contiguous else np.empty(flat_shape, self.dtype)
+        _kernels.pressure_derivs(source_positions.reshape(3, -1), normals, receiver_positions.reshape(3, -1), cosine_derivatives, self.k, self.p0, flat_derivatives)
+        if not derivatives.flags.c_contiguous:
+            derivatives[...] = flat_derivatives.reshape(shape)
         return derivatives
 
-    def wavefront_derivatives(self, source_positions, receiver_positions, orders=3):
+    def wavefront_derivatives(self, source_positions, receiver_positions, orders=3, out=None, workspace=None, geometry=None):
         """Calculate the spatial derivatives of the spherical spreading.
 
         Parameters
@@ -283,6 +700,12 @@ class PointSource(TransducerModel):
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        out : numpy.ndarray, optional
+            Preallocated array to store the derivatives in, with the shape described below.
+        workspace : Workspace, optional
+            Storage for intermediate arrays, reused between calls.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
 
         Returns
         -------
@@ -291,49 +714,84 @@ class PointSource(TransducerModel):
             where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
 
         """
-        source_positions = np.asarray(source_positions)
-        receiver_positions = np.asarray(receiver_positions)
-        if receiver_positions.shape[0] != 3:
-            raise ValueError('Incorrect shape of positions')
-        diff = receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:]) - source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        r = np.sum(diff**2, axis=0)**0.5
-        kr = self.k * r
-        jkr = 1j * kr
-        phase = np.exp(jkr)
-
-        derivatives = np.empty((_indexing.num_pressure_derivs[orders],) + r.shape, dtype=np.complex128)
-        derivatives[0] = phase / r
-
-        if orders > 0:
-            coeff = (jkr - 1) * phase / r**3
-            derivatives[1] = diff[0] * coeff
-            derivatives[2] = diff[1] * coeff
-            derivatives[3] = diff[2] * coeff
-
-        if orders > 1:
-            coeff = (3 - kr**2 - 3 * jkr) * phase / r**5
-            const = (jkr - 1) * phase / r**3
-            derivatives[4] = diff[0]**2 * coeff + const
-            derivatives[5] = diff[1]**2 * coeff + const
-            derivatives[6] = diff[2]**2 * coeff + const
-            derivatives[7] = diff[0] * diff[1] * coeff
-            derivatives[8] = diff[0] * diff[2] * coeff
-            derivatives[9] = diff[1] * diff[2] * coeff
-
-        if orders > 2:
-            const = (3 - 3 * jkr - kr**2) * phase / r**5
-            coeff = (-15 + 15 * jkr + 6 * kr**2 - 1j * kr**3) * phase / r**7
-            derivatives[10] = diff[0] * (3 * const + diff[0]**2 * coeff)
-            derivatives[11] = diff[1] * (3 * const + diff[1]**2 * coeff)
-            derivatives[12] = diff[2] * (3 * const + diff[2]**2 * coeff)
-            derivatives[13] = diff[1] * (const + diff[0]**2 * coeff)
-            derivatives[14] = diff[2] * (const + diff[0]**2 * coeff)
-            derivatives[15] = diff[0] * (const + diff[1]**2 * coeff)
-            derivatives[16] = diff[2] * (const + diff[1]**2 * coeff)
-            derivatives[17] = diff[0] * (const + diff[2]**2 * coeff)
-            derivatives[18] = diff[1] * (const + diff[2]**2 * coeff)
-            derivatives[19] = diff[0] * diff[1] * diff[2] * coeff
-
+        if workspace is None:
+            workspace = Workspace()
+        real_dtype = self._real_dtype
+        geometry = _geometry(geometry, source_positions, None, receiver_positions, real_dtype, workspace.child('geometry'))
+        shape = geometry.shape
+        derivatives = _output_array(out, (_indexing.num_pressure_derivs[orders],) + shape, self.dtype)
+
+        # All intermediate values are calculated in place in arrays from the workspace.
+        diff = geometry.diff
+        diff_sq = workspace.array('diff_sq', (3,) + shape, real_dtype)
+        np.multiply(diff, diff, out=diff_sq)
+        r_inv = workspace.array('r_inv', shape, real_dtype)
+        np.reciprocal(geometry.distance, out=r_inv)
+        r_inv_sq = workspace.array('r_inv_sq', shape, real_dtype)
+        np.multiply(r_inv, r_inv, out=r_inv_sq)
+        kr = workspace.array('kr', shape, real_dtype)
+        np.multiply(geometry.distance, self.k, out=kr)
+        # G = exp(jkr) / r, calculated as (cos(kr) + j sin(kr)) / r
+        green = derivatives[0, ...]
+        np.cos(kr, out=green.real)
+        np.sin(kr, out=green.imag)
+        green *= r_inv
+        if orders == 0:
+            return derivatives
+
+        # The derivative coefficients are all written as polynomials in jkr, times G / r^(2n).
+        base = workspace.array('base', shape, self.dtype)
+        polynomial = workspace.array('polynomial', shape, self.dtype)
+        real_temp = workspace.array('real_temp', shape, real_dtype)
+
+        # First order: (jkr - 1) G / r^2
+        np.multiply(green, r_inv_sq, out=base)
+        first_coeff = workspace.array('first_coeff', shape, self.dtype)
+        polynomial.real = -1
+        polynomial.imag = kr
+        np.multiply(base, polynomial, out=first_coeff)
+        for axis in range(3):
+            np.multiply(diff[axis], first_coeff, out=derivatives[1 + axis, ...])
+        if orders == 1:
+            return derivatives
+
+        # Second order: (3 - 3jkr - (kr)^2) G / r^4
+        base *= r_inv_sq
+        second_coeff = workspace.array('second_coeff', shape, self.dtype)
+        np.multiply(kr, kr, out=polynomial.real)
+        np.subtract(3, polynomial.real, out=polynomial.real)
+        np.multiply(kr, -3, out=polynomial.imag)
+        np.multiply(base, polynomial, out=second_coeff)
+        for idx, axis in zip(range(4, 7), range(3)):
+            np.multiply(diff_sq[axis], second_coeff, out=derivatives[idx, ...])
+            derivatives[idx] += first_coeff
+        for idx, (first, second) in zip(range(7, 10), [(0, 1), (0, 2), (1, 2)]):
+            np.multiply(diff[first], diff[second], out=real_temp)
+            np.multiply(real_temp, second_coeff, out=derivatives[idx, ...])
+        if orders == 2:
+            return derivatives
+
+        # Third order: (-15 + 15jkr + 6(kr)^2 - j(kr)^3) G / r^6
+        base *= r_inv_sq
+        third_coeff = workspace.array('third_coeff', shape, self.dtype)
+        np.multiply(kr, kr, out=real_temp)
+        np.multiply(real_temp, 6, out=polynomial.real)
+        polynomial.real -= 15
+        np.subtract(15, real_temp, out=real_temp)
+        np.multiply(real_temp, kr, out=polynomial.imag)
+        np.multiply(base, polynomial, out=third_coeff)
+        np.multiply(second_coeff, 3, out=base)
+        for idx, axis in zip(range(10, 13), range(3)):
+            np.multiply(diff_sq[axis], third_coeff, out=derivatives[idx, ...])
+            derivatives[idx] += base
+            derivatives[idx] *= diff[axis]
+        for idx, (squared, single) in zip(range(13, 19), [(0, 1), (0, 2), (1, 0), (1, 2), (2, 0), (2, 1)]):
+            np.multiply(diff_sq[squared], third_coeff, out=derivatives[idx, ...])
+            derivatives[idx] += second_coeff
+            derivatives[idx] *= diff[single]
+        np.multiply(diff[0], diff[1], out=real_temp)
+        real_temp *= diff[2]
+        np.multiply(real_temp, third_coeff, out=derivatives[19, ...])
         return derivatives
 
     def directivity_derivatives(self, source_positions, source_normals, receiver_positions, orders=3):
@@ -406,7 +864,7 @@ class PointSource(TransducerModel):
             derivatives[_indexing.pressure_derivs_order.index(derivative)] = np.sum(weighted_values, axis=(source_positions.ndim - 1)) / h**len(derivative)
         return derivatives
 
-    def spherical_harmonics(self, source_positions, source_normals, receiver_positions, orders=0, **kwargs):
+    def spherical_harmonics(self, source_positions, source_normals, receiver_positions, orders=0, geometry=None, **kwargs):
         """Expand sound field in spherical harmonics.
 
         Performs a spherical harmonics expansion of the sound field created from the transducer model.
@@ -424,6 +882,8 @@ class PointSource(TransducerModel):
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of spherical harmonics coefficients to calculate.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
 
         Returns
         -------
@@ -434,19 +894,12 @@ class PointSource(TransducerModel):
             for details on the structure of the coefficients.
 
         """
-        source_positions = np.asarray(source_positions)
-        source_normals = np.asarray(source_normals)
-        receiver_positions = np.asarray(receiver_positions)
-        if receiver_positions.shape[0] != 3:
-            raise ValueError('Incorrect shape of positions')
-
-        # We need the vector from the receiver to the source, since we are calculating an expansion centered
-        # at the receiving point.
-        diff = source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,)) - receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:])
-        r = np.sum(diff**2, axis=0)**0.5
+        geometry = _geometry(geometry, source_positions, source_normals, receiver_positions, self._real_dtype)
+        # The expansion is centered at the receiving point, so the angles are for the
+        # vector from the receiver to the source, i.e. -diff.
+        diff = geometry.diff
+        r = geometry.distance
         kr = self.k * r
-        colatitude = np.arccos(diff[2] / r)
-        azimuth = np.arctan2(diff[1], diff[0])
         # Calculate the spherical hankel function of the second kind
         # See Williams Eq 8.22:
         # exp(jk|r-r'|) / (4pi |r-r'|) = jk sum_n j_n(k r_min) h_n(k r_max) sum_m Y_n^m (theta', phi')^* Y_n^m (theta, phi)
@@ -454,13 +907,24 @@ class PointSource(TransducerModel):
         # exp(-jk|r-r'|) / (4pi |r-r'|) = -jk sum_n j_n(k r_min) h^(2)_n(k r_max) sum_m Y_n^-m (theta', phi') Y_n^m (theta, phi)
 
         sph_idx = _indexing.SphericalHarmonicsIndexer(orders)
-        coefficients = np.empty((len(sph_idx),) + source_positions.shape[1:2] + receiver_positions.shape[1:], dtype=np.complex128)
+        coefficients = np.empty((len(sph_idx),) + geometry.shape, dtype=self.dtype)
+        cos_theta = -diff[2] / r
+        sin_theta_exp_phi = (1j * diff[1] - diff[0]) / r
+        _conjugate_spherical_harmonics(cos_theta, sin_theta_exp_phi, orders, out=coefficients)
+
+        # The spherical hankel functions of the first kind are calculated using the upward recurrence
+        # h_(n+1)(x) = (2n + 1) / x h_n(x) - h_(n-1)(x), which is stable since y_n is the dominant part.
+        exp_jkr = np.exp(1j * kr)
+        hankel = -1j * exp_jkr / kr
         for n in sph_idx.orders:
-            hankel_func = spherical_jn(n, kr) + 1j * spherical_yn(n, kr)
-            for m in sph_idx.modes:
-                coefficients[sph_idx(n, m)] = hankel_func * np.conj(sph_harm(m, n, azimuth, colatitude))
-        directivity = self.directivity(source_positions, source_normals, receiver_positions)
-        return self.p0 * 4 * np.pi * 1j * self.k * directivity * coefficients
+            if n == 1:
+                hankel, previous_hankel = -exp_jkr * (1 / kr + 1j / kr**2), hankel
+            elif n > 1:
+                hankel, previous_hankel = (2 * n - 1) / kr * hankel - previous_hankel, hankel
+            coefficients[sph_idx(n, -n):sph_idx(n, n) + 1] *= hankel
+        directivity = self.directivity(source_positions, source_normals, receiver_positions, **_geometry_kwargs(self.directivity, geometry))
+        coefficients *= self.p0 * 4 * np.pi * 1j * self.k * directivity
+        return coefficients
 
 
 class TransducerReflector(TransducerModel):
@@ -540,6 +1004,14 @@ class TransducerReflector(TransducerModel):
     def medium(self, val):
         self._transducer.medium = val
 
+    @property
+    def precision(self):
+        return self._transducer.precision
+
+    @precision.setter
+    def precision(self, val):
+        self._transducer.precision = val
+
     @property
     def p0(self):
         return self._transducer.p0
@@ -556,7 +1028,7 @@ class TransducerReflector(TransducerModel):
     def physical_size(self, val):
         self._transducer.physical_size = val
 
-    def pressure_derivs(self, source_positions, source_normals, receiver_positions, *args, **kwargs):
+    def pressure_derivs(self, source_positions, source_normals, receiver_positions, *args, out=None, workspace=None, wavenumbers=None, **kwargs):
         """Calculate the spatial derivatives of the greens function.
 
         Parameters
@@ -570,6 +1042,13 @@ class TransducerReflector(TransducerModel):
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        out : numpy.ndarray, optional
+            Preallocated array to store the derivatives in, with the shape described below.
+        workspace : Workspace, optional
+            Storage for intermediate arrays, reused between calls.
+        wavenumbers : array_like, optional
+            Evaluate for these wavenumbers instead of `k`. The derivatives for
+            each wavenumber are stacked along a new first axis.
 
         Returns
         -------
@@ -578,7 +1057,16 @@ class TransducerReflector(TransducerModel):
             where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
 
         """
-        return self._evaluate_with_reflector(self._transducer.pressure_derivs, source_positions, source_normals, receiver_positions, *args, **kwargs)
+        if wavenumbers is not None:
+            return self._evaluate_wavenumbers('pressure_derivs', wavenumbers, source_positions, source_normals, receiver_positions, *args, out=out, workspace=workspace, **kwargs)
+        if out is None and workspace is None:
+            return self._evaluate_with_reflector(self._transducer.pressure_derivs, source_positions, source_normals, receiver_positions, *args, **kwargs)
+        return self._evaluate_with_reflector(self._transducer.pressure_derivs, source_positions, source_normals, receiver_positions, *args, out=out, workspace=workspace, **kwargs)
+
+    def _at_wavenumber(self, k):
+        model = copy.copy(self)
+        model._transducer = self._transducer._at_wavenumber(k)
+        return model
 
     def spherical_harmonics(self, source_positions, source_normals, receiver_positions, *args, **kwargs):
         """Evaluate the spherical harmonics expansion at a point.
@@ -597,8 +1085,16 @@ class TransducerReflector(TransducerModel):
         Calculates the positions and normals of the mirror sources. Evaluates the function
         using both the real sources and the mirrored sources. Adds the two results, considering
         some arbitrary complex reflections coefficient.
+        If `out` or `workspace` is given, they are passed on to the function
+        and the results are combined in place.
+        A `geometry` is only used for the real sources.
 
         """
+        out = kwargs.pop('out', None)
+        workspace = kwargs.pop('workspace', None)
+        geometry = kwargs.pop('geometry', None)
+        direct_kwargs = dict(kwargs, **_geometry_kwargs(func, geometry))
+        in_place = out is not None or workspace is not None
         source_positions = np.asarray(source_positions)
         source_normals = np.asarray(source_normals)
         receiver_positions = np.asarray(receiver_positions)
@@ -607,8 +1103,15 @@ class TransducerReflector(TransducerModel):
         mirror_position = source_positions - 2 * plane_normal * ((source_positions * plane_normal).sum(axis=0) - plane_distance)
         mirror_normal = source_normals - 2 * plane_normal * (source_normals * plane_normal).sum(axis=0)
 
-        direct = func(source_positions, source_normals, receiver_positions, *args, **kwargs)
-        reflected = func(mirror_position, mirror_normal, receiver_positions, *args, **kwargs)
+        if in_place:
+            workspace = workspace if workspace is not None else Workspace()
+            inner_workspace = workspace.child('reflector')
+            direct = func(source_positions, source_normals, receiver_positions, *args, out=out, workspace=inner_workspace, **direct_kwargs)
+            reflected = workspace.array('reflected', direct.shape, direct.dtype)
+            reflected = func(mirror_position, mirror_normal, receiver_positions, *args, out=reflected, workspace=inner_workspace, **kwargs)
+        else:
+            direct = func(source_positions, source_normals, receiver_positions, *args, **direct_kwargs)
+            reflected = func(mirror_position, mirror_normal, receiver_positions, *args, **kwargs)
 
         source_side = np.sign((source_positions * plane_normal).sum(axis=0) - plane_distance).reshape(source_positions.shape[1:] + (1,) * (receiver_positions.ndim - 1))
         receiver_side = np.sign(np.einsum('i...,i', receiver_positions, self.plane_normal) - plane_distance)
@@ -616,11 +1119,166 @@ class TransducerReflector(TransducerModel):
         # `source_side * receiver_side` will be -1 if they are on different sides, 0 if any of them is in the plane, and 1 otherwise.
         # We should return 0 if the source and receiver is on different sides, otherwise we return the calculated expression.
         # The below expression maps (-1, 0, 1) to (0, 1, 1).
-        same_side = np.sign(source_side * receiver_side + 1)
+        same_side = np.sign(source_side * receiver_side + 1).astype(direct.real.dtype)
 
+        if in_place:
+            reflected *= self.reflection_coefficient
+            direct += reflected
+            direct *= same_side
+            return direct
         return (direct + self.reflection_coefficient * reflected) * same_side
 
 
+class ImageSourceReflector(TransducerReflector):
+    """Class for transducers with multiple planar reflectors.
+
+    Extends `TransducerReflector` to several infinite planes using the image source
+    method, including reflection paths between the planes up to a maximum number
+    of reflections. All image sources are created once, and the underlying model
+    is evaluated for the real and the image sources in a single call.
+    Each image is weighted by the product of the reflection coefficients along its path.
+    Unlike nested `TransducerReflector` objects, the number of calls does not grow
+    with the number of planes, and paths which would give the same image source,
+    e.g. in a corner between perpendicular planes, are only included once.
+
+    Contributions are only included where the receiver is on the same side of all
+    the planes as the source, so the sources and receivers should be in the
+    region bounded by the planes.
+
+    Parameters
+    ----------
+    transducer : `TransducerModel` instance or (sub)class
+        The base transducer to reflect. If passed a class it will be instantiated
+        with the remaining arguments not used by the reflector.
+    planes : sequence of tuples
+        The reflecting planes, each as `(plane_intersect, plane_normal)` or
+        `(plane_intersect, plane_normal, reflection_coefficient)`. The reflection
+        coefficient defaults to 1. Default is a single plane at `z=0`.
+    max_order : int, default 1
+        The maximum number of reflections for the image sources.
+
+    """
+
+    _repr_fmt_spec = '{:%cls(transducer=%transducer_full, planes=%planes, max_order=%max_order)}'
+    _str_fmt_spec = '{:%cls(transducer=%transducer, planes=%planes, max_order=%max_order)}'
+
+    def __init__(self, transducer, planes=(((0, 0, 0), (0, 0, 1)),), max_order=1, *args, **kwargs):
+        if type(transducer) is type:
+            transducer = transducer(*args, **kwargs)
+        self._transducer = transducer
+        planes = [tuple(plane) + (1,) for plane in planes]
+        self.plane_intersects = np.array([plane[0] for plane in planes], dtype=float).T.reshape((3, -1))
+        self.plane_normals = np.array([plane[1] for plane in planes], dtype=float).T.reshape((3, -1))
+        self.plane_normals /= (self.plane_normals**2).sum(axis=0)**0.5
+        self.reflection_coefficients = np.array([plane[2] for plane in planes])
+        self.max_order = max_order
+        self._images = self._image_transforms()
+
+    def __format__(self, fmt_str):
+        planes = [(tuple(intersect), tuple(normal), coefficient) for intersect, normal, coefficient in zip(self.plane_intersects.T, self.plane_normals.T, self.reflection_coefficients)]
+        s_out = fmt_str.replace('%transducer_full', repr(self._transducer)).replace('%transducer', str(self._transducer))
+        s_out = s_out.replace('%planes', str(planes)).replace('%max_order', str(self.max_order))
+        return TransducerModel.__format__(self, s_out)
+
+    def __eq__(self, other):
+        return (
+            TransducerModel.__eq__(self, other)
+            and self._transducer == other._transducer
+            and self.max_order == other.max_order
+            and self.plane_intersects.shape == other.plane_intersects.shape
+            and np.allclose(self.plane_intersects, other.plane_intersects)
+            and np.allclose(self.plane_normals, other.plane_normals)
+            and np.allclose(self.reflection_coefficients, other.reflection_coefficients)
+        )
+
+    @property
+    def num_images(self):
+        """The number of image sources for each real source, excluding the real source."""
+        return len(self._images[2]) - 1
+
+    def _image_transforms(self):
+        """Create the affine transforms from the real sources to the image sources.
+
+        Returns
+        -------
+        rotations : numpy.ndarray
+            The linear part of the transforms, shape (I, 3, 3). Also used for the normals.
+        translations : numpy.ndarray
+            The translations of the positions, shape (3, I).
+        weights : numpy.ndarray
+            The product of the reflection coefficients for each image, shape (I,).
+
+        """
+        plane_distances = np.einsum('ij,ij->j', self.plane_normals, self.plane_intersects)
+        # Reflection in the plane n.x = d is x -> (I - 2nn^T) x + 2dn.
+        # Each entry is (rotation, translation, weight, index of the last reflecting plane).
+        images = [(np.eye(3), np.zeros(3), 1, None)]
+        previous_order = images
+        for order in range(self.max_order):
+            current_order = []
+            for rotation, translation, weight, last_plane in previous_order:
+                for plane, (normal, distance, coefficient) in enumerate(zip(self.plane_normals.T, plane_distances, self.reflection_coefficients)):
+                    if plane == last_plane:
+                        continue  # Reflecting twice in the same plane gives the previous image.
+                    householder = np.eye(3) - 2 * np.outer(normal, normal)
+                    current_order.append((householder @ rotation, householder @ translation + 2 * distance * normal, weight * coefficient, plane))
+            images.extend(current_order)
+            previous_order = current_order
+
+        unique = {}
+        for rotation, translation, weight, _ in images:
+            key = tuple(np.round(np.concatenate([rotation.ravel(), translation]), 12))
+            unique.setdefault(key, (rotation, translation, weight))
+        rotations, translations, weights = zip(*unique.values())
+        return np.stack(rotations), np.stack(translations, axis=1), np.array(weights)
+
+    def _evaluate_with_reflector(self, func, source_positions, source_normals, receiver_positions, *args, **kwargs):
+        """Evaluate a function using image sources for all planes.
+
+        Evaluates the function once for the real sources and all image sources,
+        then sums the results weighted with the reflection coefficients.
+        If `out` or `workspace` is given the results are combined in place.
+
+        """
+        out = kwargs.pop('out', None)
+        workspace = kwargs.pop('workspace', None)
+        # A geometry only describes the real sources, so it cannot be used with the images.
+        kwargs.pop('geometry', None)
+        source_positions = np.asarray(source_positions)
+        source_normals = np.asarray(source_normals)
+        receiver_positions = np.asarray(receiver_positions)
+        rotations, translations, weights = self._images
+        source_shape = source_positions.shape[1:2]
+        receiver_shape = receiver_positions.shape[1:]
+
+        # The images are stacked along the source axis, shape (3, images * sources).
+        image_positions = np.einsum('iab,b...->ai...', rotations, source_positions)
+        image_positions += translations.reshape((3, -1) + (1,) * len(source_shape))
+        image_positions = image_positions.reshape((3, -1))
+        image_normals = np.einsum('iab,b...->ai...', rotations, source_normals).reshape((3, -1))
+
+        if out is not None or workspace is not None:
+            workspace = workspace if workspace is not None else Workspace()
+            inner_kwargs = {'workspace': workspace.child('images')}
+            if out is not None:
+                inner_kwargs['out'] = workspace.array('images', (out.shape[0], image_positions.shape[1]) + receiver_shape, out.dtype)
+            values = func(image_positions, image_normals, receiver_positions, *args, **inner_kwargs, **kwargs)
+        else:
+            values = func(image_positions, image_normals, receiver_positions, *args, **kwargs)
+        values = values.reshape(values.shape[:1] + (len(weights),) + source_shape + receiver_shape)
+        out = _output_array(out, values.shape[:1] + values.shape[2:], values.dtype)
+        np.einsum('i,mi...->m...', weights.astype(values.dtype), values, out=out)
+
+        # Contributions are removed if the source and the receiver are on different sides of any of the planes,
+        # see `TransducerReflector` for the mapping of the sides.
+        plane_distances = np.einsum('ij,ij->j', self.plane_normals, self.plane_intersects)
+        source_side = np.sign(np.einsum('ip,i...->p...', self.plane_normals, source_positions) - plane_distances.reshape((-1,) + (1,) * len(source_shape)))
+        receiver_side = np.sign(np.einsum('ip,i...->p...', self.plane_normals, receiver_positions) - plane_distances.reshape((-1,) + (1,) * len(receiver_shape)))
+        same_side = np.sign(source_side.reshape(source_side.shape + (1,) * len(receiver_shape)) * receiver_side.reshape(receiver_side.shape[:1] + (1,) * len(source_shape) + receiver_shape) + 1)
+        out *= np.prod(same_side, axis=0).astype(out.real.dtype)
+        return out
+
+
 class PlaneWaveTransducer(TransducerModel):
     """Class representing planar waves.
 
@@ -628,7 +1286,7 @@ class PlaneWaveTransducer(TransducerModel):
     plane wave.
     """
 
-    def pressure_derivs(self, source_positions, source_normals, receiver_positions, orders=3, **kwargs):
+    def pressure_derivs(self, source_positions, source_normals, receiver_positions, orders=3, out=None, geometry=None, wavenumbers=None, **kwargs):
         """Calculate the spatial derivatives of the greens function.
 
         Parameters
@@ -642,6 +1300,13 @@ class PlaneWaveTransducer(TransducerModel):
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        out : numpy.ndarray, optional
+            Preallocated array to store the derivatives in, with the shape described below.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
+        wavenumbers : array_like, optional
+            Evaluate for these wavenumbers instead of `k`. The derivatives for
+            each wavenumber are stacked along a new first axis.
 
         Returns
         -------
@@ -650,15 +1315,13 @@ class PlaneWaveTransducer(TransducerModel):
             where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
 
         """
-        source_positions = np.asarray(source_positions)
-        receiver_positions = np.asarray(receiver_positions)
-        source_normals = np.asarray(source_normals, dtype=np.float64)
-        source_normals /= (source_normals**2).sum(axis=0)**0.5
-        source_normals = source_normals.reshape(source_normals.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        diff = receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:]) - source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        x_dot_n = np.einsum('i..., i...', diff, source_normals)
+        if wavenumbers is not None:
+            return self._evaluate_wavenumbers('pressure_derivs', wavenumbers, source_positions, source_normals, receiver_positions, orders, out=out, geometry=geometry)
+        geometry = _geometry(geometry, source_positions, source_normals, receiver_positions)
+        source_normals = geometry.normals
+        x_dot_n = np.einsum('i..., i...', geometry.diff, source_normals)
 
-        derivatives = np.empty((_indexing.num_pressure_derivs[orders],) + source_positions.shape[1:2] + receiver_positions.shape[1:], dtype=np.complex128)
+        derivatives = _output_array(out, (_indexing.num_pressure_derivs[orders],) + geometry.shape, self.dtype)
         derivatives[0] = self.p0 * np.exp(1j * self.k * x_dot_n)
 
         if orders > 0:
@@ -686,6 +1349,136 @@ class PlaneWaveTransducer(TransducerModel):
         return derivatives
 
 
+def _bessel_ratios(max_order, x):
+    """Evaluate :math:`J_n(x) / x^n` for `n` from 0 to `max_order`.
+
+    Uses the upwards recurrence from :math:`J_0` and :math:`J_1`, which is
+    much faster than evaluating higher order Bessel functions directly.
+    The recurrence is unstable for small arguments, where a truncated power
+    series is used instead.
+    """
+    x2 = x**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = [j0(x), j1(x) / x]
+        for n in range(1, max_order):
+            ratios.append((2 * n * ratios[n] - ratios[n - 1]) / x2)
+    small = x < 1
+    if not np.any(small):
+        return ratios[:max_order + 1]
+    # The series is only evaluated for the small arguments.
+    x2_small = x2[small] if np.ndim(x) > 0 else x2
+    for n in range(1, max_order + 1):
+        series = 0
+        for term in reversed(range(8)):
+            series = 1 / (factorial(term) * factorial(n + term)) - x2_small / 4 * series
+        if np.ndim(x) > 0:
+            ratios[n][small] = series / 2**n
+        else:
+            ratios[n] = series / 2**n
+    return ratios[:max_order + 1]
+
+
+def _axisymmetric_directivity_derivatives(source_positions, source_normals, receiver_positions, orders, cosine_derivatives, geometry=None):
+    """Calculate the spatial derivatives of axisymmetric directivities.
+
+    Applies the chain rule to directivities which only depend on the angle
+    between the transducer normal and the vector from the transducer to
+    the receiving point.
+
+    Parameters
+    ----------
+    source_positions : numpy.ndarray
+        The location of the transducer, as a (3, ...) shape array.
+    source_normals : numpy.ndarray
+        The look direction of the transducer, as a (3, ...) shape array.
+    receiver_positions : numpy.ndarray
+        The location(s) at which to evaluate the radiation, shape (3, ...).
+        The first dimension must have length 3 and represent the coordinates of the points.
+    orders : int
+        How many orders of derivatives to calculate. Currently three orders are supported.
+    cosine_derivatives : callable
+        Called as `cosine_derivatives(cos, sin, orders)` with the cosine and sine of the angle.
+        Should return a list with the directivity and its derivatives with respect to
+        the cosine of the angle, up to and including `orders`.
+    geometry : SourceReceiverGeometry, optional
+        Precalculated geometry for the sources and receivers.
+
+    Returns
+    -------
+    derivatives : numpy.ndarray
+        Array with the calculated derivatives. Has the shape `(M,) + source_positions.shape[1:] + receiver_positions.shape[1:]`.
+        where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
+
+    """
+    geometry = _geometry(geometry, source_positions, source_normals, receiver_positions)
+    diff = geometry.diff
+    r = geometry.distance
+    n = geometry.normals
+    cos = geometry.cos_angle
+    sin = geometry.sin_angle
+    dot = cos * r
+    directivity_derivatives = cosine_derivatives(cos, sin, orders)
+
+    derivatives = np.empty((_indexing.num_pressure_derivs[orders],) + geometry.shape, dtype=np.complex128)
+    derivatives[0] = directivity_derivatives[0]
+    if orders > 0:
+        r2 = r**2
+        r3 = r**3
+        cos_dx = (r2 * n[0] - diff[0] * dot) / r3
+        cos_dy = (r2 * n[1] - diff[1] * dot) / r3
+        cos_dz = (r2 * n[2] - diff[2] * dot) / r3
+
+        first_order_const = directivity_derivatives[1]
+        derivatives[1] = first_order_const * cos_dx
+        derivatives[2] = first_order_const * cos_dy
+        derivatives[3] = first_order_const * cos_dz
+
+    if orders > 1:
+        r5 = r2 * r3
+        cos_dx2 = (3 * diff[0]**2 * dot - 2 * diff[0] * n[0] * r2 - dot * r2) / r5
+        cos_dy2 = (3 * diff[1]**2 * dot - 2 * diff[1] * n[1] * r2 - dot * r2) / r5
+        cos_dz2 = (3 * diff[2]**2 * dot - 2 * diff[2] * n[2] * r2 - dot * r2) / r5
+        cos_dxdy = (3 * diff[0] * diff[1] * dot - r2 * (n[0] * diff[1] + n[1] * diff[0])) / r5
+        cos_dxdz = (3 * diff[0] * diff[2] * dot - r2 * (n[0] * diff[2] + n[2] * diff[0])) / r5
+        cos_dydz = (3 * diff[1] * diff[2] * dot - r2 * (n[1] * diff[2] + n[2] * diff[1])) / r5
+
+        second_order_const = directivity_derivatives[2]
+        derivatives[4] = second_order_const * cos_dx**2 + first_order_const * cos_dx2
+        derivatives[5] = second_order_const * cos_dy**2 + first_order_const * cos_dy2
+        derivatives[6] = second_order_const * cos_dz**2 + first_order_const * cos_dz2
+        derivatives[7] = second_order_const * cos_dx * cos_dy + first_order_const * cos_dxdy
+        derivatives[8] = second_order_const * cos_dx * cos_dz + first_order_const * cos_dxdz
+        derivatives[9] = second_order_const * cos_dy * cos_dz + first_order_const * cos_dydz
+
+    if orders > 2:
+        r4 = r2**2
+        r7 = r5 * r2
+        cos_dx3 = (-15 * diff[0]**3 * dot + 9 * r2 * (diff[0]**2 * n[0] + diff[0] * dot) - 3 * r4 * n[0]) / r7
+        cos_dy3 = (-15 * diff[1]**3 * dot + 9 * r2 * (diff[1]**2 * n[1] + diff[1] * dot) - 3 * r4 * n[1]) / r7
+        cos_dz3 = (-15 * diff[2]**3 * dot + 9 * r2 * (diff[2]**2 * n[2] + diff[2] * dot) - 3 * r4 * n[2]) / r7
+        cos_dx2dy = (-15 * diff[0]**2 * diff[1] * dot + 3 * r2 * (diff[0]**2 * n[1] + 2 * diff[0] * diff[1] * n[0] + diff[1] * dot) - r4 * n[1]) / r7
+        cos_dx2dz = (-15 * diff[0]**2 * diff[2] * dot + 3 * r2 * (diff[0]**2 * n[2] + 2 * diff[0] * diff[2] * n[0] + diff[2] * dot) - r4 * n[2]) / r7
+        cos_dy2dx = (-15 * diff[1]**2 * diff[0] * dot + 3 * r2 * (diff[1]**2 * n[0] + 2 * diff[1] * diff[0] * n[1] + diff[0] * dot) - r4 * n[0]) / r7
+        cos_dy2dz = (-15 * diff[1]**2 * diff[2] * dot + 3 * r2 * (diff[1]**2 * n[2] + 2 * diff[1] * diff[2] * n[1] + diff[2] * dot) - r4 * n[2]) / r7
+        cos_dz2dx = (-15 * diff[2]**2 * diff[0] * dot + 3 * r2 * (diff[2]**2 * n[0] + 2 * diff[2] * diff[0] * n[2] + diff[0] * dot) - r4 * n[0]) / r7
+        cos_dz2dy = (-15 * diff[2]**2 * diff[1] * dot + 3 * r2 * (diff[2]**2 * n[1] + 2 * diff[2] * diff[1] * n[2] + diff[1] * dot) - r4 * n[1]) / r7
+        cos_dxdydz = (-15 * diff[0] * diff[1] * diff[2] * dot + 3 * r2 * (n[0] * diff[1] * diff[2] + n[1] * diff[0] * diff[2] + n[2] * diff[0] * diff[1])) / r7
+
+        third_order_const = directivity_derivatives[3]
+        derivatives[10] = third_order_const * cos_dx**3 + 3 * second_order_const * cos_dx2 * cos_dx + first_order_const * cos_dx3
+        derivatives[11] = third_order_const * cos_dy**3 + 3 * second_order_const * cos_dy2 * cos_dy + first_order_const * cos_dy3
+        derivatives[12] = third_order_const * cos_dz**3 + 3 * second_order_const * cos_dz2 * cos_dz + first_order_const * cos_dz3
+        derivatives[13] = third_order_const * cos_dx**2 * cos_dy + second_order_const * (cos_dx2 * cos_dy + 2 * cos_dxdy * cos_dx) + first_order_const * cos_dx2dy
+        derivatives[14] = third_order_const * cos_dx**2 * cos_dz + second_order_const * (cos_dx2 * cos_dz + 2 * cos_dxdz * cos_dx) + first_order_const * cos_dx2dz
+        derivatives[15] = third_order_const * cos_dy**2 * cos_dx + second_order_const * (cos_dy2 * cos_dx + 2 * cos_dxdy * cos_dy) + first_order_const * cos_dy2dx
+        derivatives[16] = third_order_const * cos_dy**2 * cos_dz + second_order_const * (cos_dy2 * cos_dz + 2 * cos_dydz * cos_dy) + first_order_const * cos_dy2dz
+        derivatives[17] = third_order_const * cos_dz**2 * cos_dx + second_order_const * (cos_dz2 * cos_dx + 2 * cos_dxdz * cos_dz) + first_order_const * cos_dz2dx
+        derivatives[18] = third_order_const * cos_dz**2 * cos_dy + second_order_const * (cos_dz2 * cos_dy + 2 * cos_dydz * cos_dz) + first_order_const * cos_dz2dy
+        derivatives[19] = third_order_const * cos_dx * cos_dy * cos_dz + second_order_const * (cos_dx * cos_dydz + cos_dy * cos_dxdz + cos_dz * cos_dxdy) + first_order_const * cos_dxdydz
+
+    return derivatives
+
+
 class CircularPiston(PointSource):
     r"""Circular piston transducer model.
 
@@ -698,10 +1491,6 @@ class CircularPiston(PointSource):
     **kwargs
         See `TransducerModel`
 
-    Note
-    ----
-    This class has no implementation of analytic jacobians yet, and is much slower to use than other models.
-
     """
 
     _repr_fmt_spec = '{:%cls(freq=%freq, p0=%p0, effective_radius=%effective_radius, medium=%mediumfull)}'
@@ -717,7 +1506,7 @@ class CircularPiston(PointSource):
     def __eq__(self, other):
         return super().__eq__(other) and np.allclose(self.effective_radius, other.effective_radius)
 
-    def directivity(self, source_positions, source_normals, receiver_positions):
+    def directivity(self, source_positions, source_normals, receiver_positions, geometry=None):
         r"""Evaluate transducer directivity.
 
         Returns :math:`D(\theta) = 2 J_1(ka\sin\theta) / (ka\sin\theta)`
@@ -736,6 +1525,8 @@ class CircularPiston(PointSource):
         receiver_positions : numpy.ndarray
             The location(s) at which to evaluate the radiation, shape (3, ...).
             The first dimension must have length 3 and represent the coordinates of the points.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
 
         Returns
         -------
@@ -743,16 +1534,7 @@ class CircularPiston(PointSource):
             The amplitude (and phase) of the directivity, shape `source_positions.shape[1:] + receiver_positions.shape[1:]`.
 
         """
-        source_positions = np.asarray(source_positions)
-        source_normals = np.asarray(source_normals)
-        receiver_positions = np.asarray(receiver_positions)
-        source_normals = source_normals.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        diff = receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:]) - source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        dots = np.einsum('i...,i...', diff, source_normals)
-        norm1 = np.einsum('i...,i...', source_normals, source_normals)**0.5
-        norm2 = np.einsum('i...,i...', diff, diff)**0.5
-        cos_angle = np.clip(dots / norm2 / norm1, -1, 1)  # Clip needed because numrical precicion sometimes give a value slightly outside the reasonable range.
-        sin_angle = (1 - cos_angle**2)**0.5
+        sin_angle = _geometry(geometry, source_positions, source_normals, receiver_positions).sin_angle
         ka = self.k * self.effective_radius
 
         denom = ka * sin_angle
@@ -760,6 +1542,51 @@ class CircularPiston(PointSource):
         with np.errstate(invalid='ignore'):
             return np.where(denom == 0, 1, 2 * numer / denom)
 
+    def directivity_derivatives(self, source_positions, source_normals, receiver_positions, orders=3, geometry=None):
+        r"""Calculate the spatial derivatives of the directivity.
+
+        Explicit implementation of the derivatives of the directivity, based
+        on analytical differentiation. With :math:`\xi = ka\sin\theta`, the derivatives
+        of :math:`J_n(\xi) / \xi^n` with respect to :math:`\cos\theta` are
+        :math:`k^2a^2\cos\theta J_{n+1}(\xi) / \xi^{n+1}`, which gives
+        closed form expressions for all orders.
+
+        Parameters
+        ----------
+        source_positions : numpy.ndarray
+            The location of the transducer, as a (3, ...) shape array.
+        source_normals : numpy.ndarray
+            The look direction of the transducer, as a (3, ...) shape array.
+        receiver_positions : numpy.ndarray
+            The location(s) at which to evaluate the radiation, shape (3, ...).
+            The first dimension must have length 3 and represent the coordinates of the points.
+        orders : int
+            How many orders of derivatives to calculate. Currently three orders are supported.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
+
+        Returns
+        -------
+        derivatives : numpy.ndarray
+            Array with the calculated derivatives. Has the shape `(M,) + source_positions.shape[1:] + receiver_positions.shape[1:]`.
+            where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
+
+        """
+        return _axisymmetric_directivity_derivatives(source_positions, source_normals, receiver_positions, orders, self._cosine_derivatives, geometry=geometry)
+
+    def _cosine_derivatives(self, cos, sin, orders):
+        """Evaluate the directivity and its derivatives with respect to the cosine of the angle."""
+        ka = self.k * self.effective_radius
+        J1_xi, J2_xi2, J3_xi3, J4_xi4 = (_bessel_ratios(orders + 1, ka * sin) + [None] * 3)[1:5]
+        derivatives = [2 * J1_xi]
+        if orders > 0:
+            derivatives.append(2 * J2_xi2 * ka**2 * cos)
+        if orders > 1:
+            derivatives.append(2 * J3_xi3 * ka**4 * cos**2 + 2 * J2_xi2 * ka**2)
+        if orders > 2:
+            derivatives.append(2 * J4_xi4 * ka**6 * cos**3 + 6 * J3_xi3 * ka**4 * cos)
+        return derivatives
+
 
 class CircularRing(PointSource):
     r"""Circular ring transducer model.
@@ -788,7 +1615,7 @@ class CircularRing(PointSource):
     def __eq__(self, other):
         return super().__eq__(other) and np.allclose(self.effective_radius, other.effective_radius)
 
-    def directivity(self, source_positions, source_normals, receiver_positions):
+    def directivity(self, source_positions, source_normals, receiver_positions, geometry=None):
         r"""Evaluate transducer directivity.
 
         Returns :math:`D(\theta) = J_0(ka\sin\theta)` where
@@ -807,6 +1634,8 @@ class CircularRing(PointSource):
         receiver_positions : numpy.ndarray
             The location(s) at which to evaluate the radiation, shape (3, ...).
             The first dimension must have length 3 and represent the coordinates of the points.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
 
         Returns
         -------
@@ -814,20 +1643,11 @@ class CircularRing(PointSource):
             The amplitude (and phase) of the directivity, shape `source_positions.shape[1:] + receiver_positions.shape[1:]`.
 
         """
-        source_positions = np.asarray(source_positions)
-        source_normals = np.asarray(source_normals)
-        receiver_positions = np.asarray(receiver_positions)
-        source_normals = source_normals.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        diff = receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:]) - source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        dots = np.einsum('i...,i...', diff, source_normals)
-        norm1 = np.einsum('i...,i...', source_normals, source_normals)**0.5
-        norm2 = np.einsum('i...,i...', diff, diff)**0.5
-        cos_angle = np.clip(dots / norm2 / norm1, -1, 1)  # Clip needed because numrical precicion sometimes give a value slightly outside the reasonable range.
-        sin_angle = (1 - cos_angle**2)**0.5
+        sin_angle = _geometry(geometry, source_positions, source_normals, receiver_positions).sin_angle
         ka = self.k * self.effective_radius
         return j0(ka * sin_angle)
 
-    def directivity_derivatives(self, source_positions, source_normals, receiver_positions, orders=3):
+    def directivity_derivatives(self, source_positions, source_normals, receiver_positions, orders=3, geometry=None):
         """Calculate the spatial derivatives of the directivity.
 
         Explicit implementation of the derivatives of the directivity, based
@@ -844,6 +1664,8 @@ class CircularRing(PointSource):
             The first dimension must have length 3 and represent the coordinates of the points.
         orders : int
             How many orders of derivatives to calculate. Currently three orders are supported.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
 
         Returns
         -------
@@ -852,83 +1674,194 @@ class CircularRing(PointSource):
             where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
 
         """
-        source_positions = np.asarray(source_positions)
-        source_normals = np.asarray(source_normals)
-        receiver_positions = np.asarray(receiver_positions)
-        source_normals = source_normals.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        diff = receiver_positions.reshape((3,) + (1,) * (source_positions.ndim - 1) + receiver_positions.shape[1:]) - source_positions.reshape(source_positions.shape[:2] + (receiver_positions.ndim - 1) * (1,))
-        dot = np.einsum('i...,i...', diff, source_normals)
-        # r = np.einsum('...i,...i', diff, diff)**0.5
-        r = np.sum(diff**2, axis=0)**0.5
-        n = source_normals
-        norm = np.einsum('i...,i...', n, n)**0.5
-        cos = np.clip(dot / r / norm, -1, 1)  # Clip needed because numrical precicion sometimes give a value slightly outside the reasonable range.
-        sin = (1 - cos**2)**0.5
-        ka = self.k * self.effective_radius
-        ka_sin = ka * sin
+        return _axisymmetric_directivity_derivatives(source_positions, source_normals, receiver_positions, orders, self._cosine_derivatives, geometry=geometry)
 
-        derivatives = np.empty((_indexing.num_pressure_derivs[orders],) + source_positions.shape[1:2] + receiver_positions.shape[1:], dtype=np.complex128)
-        J0 = j0(ka_sin)
-        derivatives[0] = J0
+    def _cosine_derivatives(self, cos, sin, orders):
+        """Evaluate the directivity and its derivatives with respect to the cosine of the angle."""
+        ka = self.k * self.effective_radius
+        J0, J1_xi, J2_xi2, J3_xi3 = (_bessel_ratios(orders, ka * sin) + [None] * 3)[:4]
+        derivatives = [J0]
         if orders > 0:
-            r2 = r**2
-            r3 = r**3
-            cos_dx = (r2 * n[0] - diff[0] * dot) / r3 / norm
-            cos_dy = (r2 * n[1] - diff[1] * dot) / r3 / norm
-            cos_dz = (r2 * n[2] - diff[2] * dot) / r3 / norm
-
-            with np.errstate(invalid='ignore'):
-                J1_xi = np.where(sin == 0, 0.5, j1(ka_sin) / ka_sin)
-            first_order_const = J1_xi * ka**2 * cos
-            derivatives[1] = first_order_const * cos_dx
-            derivatives[2] = first_order_const * cos_dy
-            derivatives[3] = first_order_const * cos_dz
-
+            derivatives.append(J1_xi * ka**2 * cos)
         if orders > 1:
-            r5 = r2 * r3
-            cos_dx2 = (3 * diff[0]**2 * dot - 2 * diff[0] * n[0] * r2 - dot * r2) / r5 / norm
-            cos_dy2 = (3 * diff[1]**2 * dot - 2 * diff[1] * n[1] * r2 - dot * r2) / r5 / norm
-            cos_dz2 = (3 * diff[2]**2 * dot - 2 * diff[2] * n[2] * r2 - dot * r2) / r5 / norm
-            cos_dxdy = (3 * diff[0] * diff[1] * dot - r2 * (n[0] * diff[1] + n[1] * diff[0])) / r5 / norm
-            cos_dxdz = (3 * diff[0] * diff[2] * dot - r2 * (n[0] * diff[2] + n[2] * diff[0])) / r5 / norm
-            cos_dydz = (3 * diff[1] * diff[2] * dot - r2 * (n[1] * diff[2] + n[2] * diff[1])) / r5 / norm
-
-            with np.errstate(invalid='ignore'):
-                J2_xi2 = np.where(sin == 0, 0.125, (2 * J1_xi - J0) / ka_sin**2)
-            second_order_const = J2_xi2 * ka**4 * cos**2 + J1_xi * ka**2
-            derivatives[4] = second_order_const * cos_dx**2 + first_order_const * cos_dx2
-            derivatives[5] = second_order_const * cos_dy**2 + first_order_const * cos_dy2
-            derivatives[6] = second_order_const * cos_dz**2 + first_order_const * cos_dz2
-            derivatives[7] = second_order_const * cos_dx * cos_dy + first_order_const * cos_dxdy
-            derivatives[8] = second_order_const * cos_dx * cos_dz + first_order_const * cos_dxdz
-            derivatives[9] = second_order_const * cos_dy * cos_dz + first_order_const * cos_dydz
-
+            derivatives.append(J2_xi2 * ka**4 * cos**2 + J1_xi * ka**2)
         if orders > 2:
-            r4 = r2**2
-            r7 = r5 * r2
-            cos_dx3 = (-15 * diff[0]**3 * dot + 9 * r2 * (diff[0]**2 * n[0] + diff[0] * dot) - 3 * r4 * n[0]) / r7 / norm
-            cos_dy3 = (-15 * diff[1]**3 * dot + 9 * r2 * (diff[1]**2 * n[1] + diff[1] * dot) - 3 * r4 * n[1]) / r7 / norm
-            cos_dz3 = (-15 * diff[2]**3 * dot + 9 * r2 * (diff[2]**2 * n[2] + diff[2] * dot) - 3 * r4 * n[2]) / r7 / norm
-            cos_dx2dy = (-15 * diff[0]**2 * diff[1] * dot + 3 * r2 * (diff[0]**2 * n[1] + 2 * diff[0] * diff[1] * n[0] + diff[1] * dot) - r4 * n[1]) / r7 / norm
-            cos_dx2dz = (-15 * diff[0]**2 * diff[2] * dot + 3 * r2 * (diff[0]**2 * n[2] + 2 * diff[0] * diff[2] * n[0] + diff[2] * dot) - r4 * n[2]) / r7 / norm
-            cos_dy2dx = (-15 * diff[1]**2 * diff[0] * dot + 3 * r2 * (diff[1]**2 * n[0] + 2 * diff[1] * diff[0] * n[1] + diff[0] * dot) - r4 * n[0]) / r7 / norm
-            cos_dy2dz = (-15 * diff[1]**2 * diff[2] * dot + 3 * r2 * (diff[1]**2 * n[2] + 2 * diff[1] * diff[2] * n[1] + diff[2] * dot) - r4 * n[2]) / r7 / norm
-            cos_dz2dx = (-15 * diff[2]**2 * diff[0] * dot + 3 * r2 * (diff[2]**2 * n[0] + 2 * diff[2] * diff[0] * n[2] + diff[0] * dot) - r4 * n[0]) / r7 / norm
-            cos_dz2dy = (-15 * diff[2]**2 * diff[1] * dot + 3 * r2 * (diff[2]**2 * n[1] + 2 * diff[2] * diff[1] * n[2] + diff[1] * dot) - r4 * n[1]) / r7 / norm
-            cos_dxdydz = (-15 * diff[0] * diff[1] * diff[2] * dot + 3 * r2 * (n[0] * diff[1] * diff[2] + n[1] * diff[0] * diff[2] + n[2] * diff[0] * diff[1])) / r7 / norm
-
-            with np.errstate(invalid='ignore'):
-                J3_xi3 = np.where(sin == 0, 1 / 48, (4 * J2_xi2 - J1_xi) / ka_sin**2)
-            third_order_const = J3_xi3 * ka**6 * cos**3 + 3 * J2_xi2 * ka**4 * cos
-            derivatives[10] = third_order_const * cos_dx**3 + 3 * second_order_const * cos_dx2 * cos_dx + first_order_const * cos_dx3
-            derivatives[11] = third_order_const * cos_dy**3 + 3 * second_order_const * cos_dy2 * cos_dy + first_order_const * cos_dy3
-            derivatives[12] = third_order_const * cos_dz**3 + 3 * second_order_const * cos_dz2 * cos_dz + first_order_const * cos_dz3
-            derivatives[13] = third_order_const * cos_dx**2 * cos_dy + second_order_const * (cos_dx2 * cos_dy + 2 * cos_dxdy * cos_dx) + first_order_const * cos_dx2dy
-            derivatives[14] = third_order_const * cos_dx**2 * cos_dz + second_order_const * (cos_dx2 * cos_dz + 2 * cos_dxdz * cos_dx) + first_order_const * cos_dx2dz
-            derivatives[15] = third_order_const * cos_dy**2 * cos_dx + second_order_const * (cos_dy2 * cos_dx + 2 * cos_dxdy * cos_dy) + first_order_const * cos_dy2dx
-            derivatives[16] = third_order_const * cos_dy**2 * cos_dz + second_order_const * (cos_dy2 * cos_dz + 2 * cos_dydz * cos_dy) + first_order_const * cos_dy2dz
-            derivatives[17] = third_order_const * cos_dz**2 * cos_dx + second_order_const * (cos_dz2 * cos_dx + 2 * cos_dxdz * cos_dz) + first_order_const * cos_dz2dx
-            derivatives[18] = third_order_const * cos_dz**2 * cos_dy + second_order_const * (cos_dz2 * cos_dy + 2 * cos_dydz * cos_dz) + first_order_const * cos_dz2dy
-            derivatives[19] = third_order_const * cos_dx * cos_dy * cos_dz + second_order_const * (cos_dx * cos_dydz + cos_dy * cos_dxdz + cos_dz * cos_dxdy) + first_order_const * cos_dxdydz
+            derivatives.append(J3_xi3 * ka**6 * cos**3 + 3 * J2_xi2 * ka**4 * cos)
+        return derivatives
+
+
+class TabulatedTransducer(PointSource):
+    r"""Transducer model with a tabulated directivity.
+
+    The directivity is given as values for a number of angles between the
+    transducer normal and the vector from the transducer to the receiving point,
+    e.g. from measurements. The table is interpolated with a quintic spline
+    in :math:`\cos\theta`, which gives continuous analytic derivatives
+    up to third order, see `directivity_derivatives`. Tables with four or five
+    angles use a cubic spline, and tables with two or three angles use linear
+    interpolation, which have fewer nonzero derivatives.
+    Angles outside of the range of the table use the value at the closest
+    tabulated angle.
+    The same table is used for all wavenumbers, e.g. when evaluating
+    `pressure_derivs` with multiple `wavenumbers`.
+
+    Parameters
+    ----------
+    angles : array_like
+        The angles :math:`\theta` of the table, in radians between 0 and :math:`\pi`.
+    directivities : array_like
+        The (possibly complex) directivity at the angles, normalized to
+        one on the main axis to be consistent with `p0`.
+    **kwargs
+        See `TransducerModel`
+
+    """
+
+    _repr_fmt_spec = '{:%cls(freq=%freq, p0=%p0, num_angles=%num_angles, medium=%mediumfull)}'
+    _str_fmt_spec = '{:%cls(freq=%freq, p0=%p0, num_angles=%num_angles, medium=%medium)}'
+
+    def __init__(self, angles, directivities, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        angles = np.asarray(angles, dtype=float)
+        directivities = np.asarray(directivities)
+        if angles.ndim != 1 or angles.shape != directivities.shape:
+            raise ValueError('Angles and directivities should be one dimensional with the same length')
+        cosines, indices = np.unique(np.cos(angles), return_index=True)
+        if len(cosines) < 2:
+            raise ValueError('At least two different angles are needed for a tabulated directivity')
+        self.angles = angles[indices][::-1]
+        self.directivities = directivities[indices][::-1]
+        # The spline is converted to piecewise polynomials, which have fast evaluation of the derivatives.
+        degree = min(5, len(cosines) - 1)
+        if degree % 2 == 0:
+            # The interpolating splines only support odd degrees.
+            degree -= 1
+        self._spline = PPoly.from_spline(make_interp_spline(cosines, directivities[indices], k=degree))
+        self._cos_limits = (cosines[0], cosines[-1])
+
+    @classmethod
+    def from_model(cls, model, num_angles=181):
+        r"""Tabulate the directivity of another transducer model.
+
+        Useful to replace an expensive directivity, e.g. one involving
+        special functions, with the spline interpolation.
+
+        Parameters
+        ----------
+        model : TransducerModel
+            The model to tabulate. Should have a `directivity` method.
+        num_angles : int, default 181
+            The number of angles, evenly spaced between 0 and :math:`\pi`.
+
+        """
+        angles = np.linspace(0, np.pi, num_angles)
+        receivers = np.stack([np.sin(angles), np.zeros_like(angles), np.cos(angles)])
+        directivities = model.directivity(np.zeros(3), np.array([0., 0., 1.]), receivers)
+        return cls(angles, directivities, freq=model.freq, p0=model.p0, medium=model.medium,
+                   physical_size=model.physical_size, precision=model.precision)
+
+    def __format__(self, fmt_spec):
+        return super().__format__(fmt_spec).replace('%num_angles', str(len(self.angles)))
+
+    def __eq__(self, other):
+        return (
+            super().__eq__(other)
+            and self.angles.shape == other.angles.shape
+            and np.allclose(self.angles, other.angles)
+            and np.allclose(self.directivities, other.directivities)
+        )
+
+    def directivity(self, source_positions, source_normals, receiver_positions, geometry=None):
+        """Evaluate transducer directivity.
 
+        Interpolates the tabulated directivity at the angle between the transducer
+        normal and the vector from the transducer to the receiving point.
+
+        Parameters
+        ----------
+        source_positions : numpy.ndarray
+            The location of the transducer, as a (3, ...) shape array.
+        source_normals : numpy.ndarray
+            The look direction of the transducer, as a (3, ...) shape array.
+        receiver_positions : numpy.ndarray
+            The location(s) at which to evaluate the radiation, shape (3, ...).
+            The first dimension must have length 3 and represent the coordinates of the points.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The amplitude (and phase) of the directivity, shape `source_positions.shape[1:] + receiver_positions.shape[1:]`.
+
+        """
+        cos_angle = _geometry(geometry, source_positions, source_normals, receiver_positions).cos_angle
+        return self._evaluate_spline(cos_angle, 0)[0]
+
+    def directivity_derivatives(self, source_positions, source_normals, receiver_positions, orders=3, geometry=None):
+        """Calculate the spatial derivatives of the directivity.
+
+        Explicit implementation of the derivatives of the directivity, using
+        the derivatives of the interpolating spline.
+
+        Parameters
+        ----------
+        source_positions : numpy.ndarray
+            The location of the transducer, as a (3, ...) shape array.
+        source_normals : numpy.ndarray
+            The look direction of the transducer, as a (3, ...) shape array.
+        receiver_positions : numpy.ndarray
+            The location(s) at which to evaluate the radiation, shape (3, ...).
+            The first dimension must have length 3 and represent the coordinates of the points.
+        orders : int
+            How many orders of derivatives to calculate. Currently three orders are supported.
+        geometry : SourceReceiverGeometry, optional
+            Precalculated geometry for the sources and receivers.
+
+        Returns
+        -------
+        derivatives : numpy.ndarray
+            Array with the calculated derivatives. Has the shape `(M,) + source_positions.shape[1:] + receiver_positions.shape[1:]`.
+            where `M` is the number of spatial derivatives, see `num_spatial_derivatives` and `spatial_derivative_order`.
+
+        """
+        return _axisymmetric_directivity_derivatives(source_positions, source_normals, receiver_positions, orders, self._cosine_derivatives, geometry=geometry)
+
+    def _cosine_derivatives(self, cos, sin, orders):
+        """Evaluate the directivity and its derivatives with respect to the cosine of the angle."""
+        return self._evaluate_spline(cos, orders)
+
+    def _evaluate_spline(self, cos, orders):
+        """Evaluate the spline and its derivatives with respect to the cosine.
+
+        The interval lookup is done once for all orders, and the polynomials
+        and their derivatives are evaluated together with Horner's method.
+        Outside of the table the directivity is constant, so the derivatives are zero.
+        """
+        breaks, coefficients = self._spline.x, self._spline.c
+        outside = (cos < self._cos_limits[0]) | (cos > self._cos_limits[1])
+        cos = np.clip(cos, *self._cos_limits)
+        interval = np.clip(np.searchsorted(breaks, cos, side='right') - 1, 0, len(breaks) - 2)
+        offset = cos - breaks[interval]
+        coefficients = coefficients[:, interval]
+        # derivatives[n] is the n-th derivative divided by n!
+        derivatives = [coefficients[0]] + [np.zeros_like(coefficients[0]) for _ in range(orders)]
+        for coefficient in coefficients[1:]:
+            for order in range(orders, 0, -1):
+                derivatives[order] = derivatives[order] * offset + derivatives[order - 1]
+            derivatives[0] = derivatives[0] * offset + coefficient
+        derivatives = [derivative * factorial(order) for order, derivative in enumerate(derivatives)]
+        if orders > 0 and np.any(outside):
+            derivatives[1:] = [np.where(outside, 0, derivative) for derivative in derivatives[1:]]
         return derivatives
+
+
+# Models where `pressure_derivs` can use the compiled kernel.
+_compiled_models = (PointSource, CircularPiston, CircularRing, TabulatedTransducer)
+# Models where the field only depends on the difference between the receiver and source positions,
+# and on the normal, so the pressure derivatives can be tabulated over a lattice of differences.
+_translation_invariant_models = (PointSource, CircularPiston, CircularRing, TabulatedTransducer, PlaneWaveTransducer)
+# Models with a directivity which only depends on the angle from the normal, so the pressure
+# derivatives transform with the symmetries of an array, see `ArraySymmetry`. Point sources
+# also transform like this, but are faster to evaluate than to map between transducers.
+_axisymmetric_models = (CircularPiston, CircularRing, TabulatedTransducer)
@@ -281,3 +281,226 @@ def test_Array_calculations():
         [-5.094954128769e+01 - 2.904389528692e+01j, -1.140045085313e+01 + 5.677575520142e+01j, +1.490296577659e+01 + 5.804879605259e+01j, +5.070404281442e+01 - 3.078708333006e+01j],
         [-4.271062938279e-01 + 1.767003324465e+01j, +1.653992786475e+01 - 4.314652112229e+00j, +1.406441459177e+01 - 1.245188798563e+01j, -1.514361128043e+01 - 1.016477803538e+01j]])
     np.testing.assert_allclose(array.spherical_harmonics(pos, orders=3), expected_result)
+
+
+def test_request_cache(tmp_path):
+    array = levitate.arrays.RectangularArray(shape=2)
+    pos = np.array([[0.1, -0.2, 0.3], [-0.05, 0.01, 0.08]]).T
+    requests = {'pressure_derivs': 2, 'spherical_harmonics_gradient': 1}
+    expected = array.request(requests, pos)
+
+    array.request_cache = levitate.arrays.RequestCache(directory=str(tmp_path))
+    first = array.request(requests, pos)
+    second = array.request(requests, pos)
+    assert (array.request_cache.hits, array.request_cache.misses) == (1, 1)
+    for key in expected:
+        np.testing.assert_allclose(first[key], expected[key])
+        assert second[key] is first[key]
+        assert not second[key].flags.writeable
+
+    # A new session only has the files on disk.
+    array.request_cache = levitate.arrays.RequestCache(directory=str(tmp_path))
+    loaded = array.request(requests, pos)
+    assert array.request_cache.hits == 1
+    for key in expected:
+        np.testing.assert_allclose(loaded[key], expected[key])
+
+    # Changing the array state gives new keys
+    array.request_cache = levitate.arrays.RequestCache()
+    array.request(requests, pos)
+    array.freq = 41e3
+    array.request(requests, pos)
+    array.positions = array.positions + 1e-3
+    array.request(requests, pos)
+    array.request(requests, pos[:, 0])
+    assert (array.request_cache.hits, array.request_cache.misses) == (0, 4)
+
+    # The least recently used entries are discarded
+    nbytes = array.request_cache.nbytes // 4
+    array.request_cache.max_bytes = 2 * nbytes
+    array.request(requests, pos + 1)
+    assert len(array.request_cache) == 2
+    assert array.request_cache.nbytes <= 2 * nbytes
+
+
+def test_pressure_derivs_out():
+    array = levitate.arrays.RectangularArray(shape=2)
+    pos = np.array([[0.1, -0.2, 0.3], [-0.05, 0.01, 0.08]]).T
+    expected = array.pressure_derivs(pos, orders=2)
+    out = np.zeros_like(expected)
+    workspace = levitate.transducers.Workspace()
+    assert array.pressure_derivs(pos, orders=2, out=out, workspace=workspace) is out
+    np.testing.assert_allclose(out, expected)
+    allocations = workspace.allocations
+    array.pressure_derivs(pos, orders=2, out=out, workspace=workspace)
+    assert workspace.allocations == allocations
+
+
+def test_pressure_derivs_wavenumbers():
+    array = levitate.arrays.RectangularArray(shape=2, transducer=levitate.transducers.CircularPiston(effective_radius=3e-3))
+    pos = np.array([[0.1, -0.2, 0.3], [-0.05, 0.01, 0.08]]).T
+    freqs = np.array([20e3, 40e3, 60e3])
+    result = array.pressure_derivs(pos, orders=2, wavenumbers=2 * np.pi * freqs / array.transducer.medium.c)
+    assert result.shape == (3, 10, 4, 2)
+    for idx, freq in enumerate(freqs):
+        array.freq = freq
+        np.testing.assert_allclose(result[idx], array.pressure_derivs(pos, orders=2))
+    workspace = levitate.transducers.Workspace()
+    out = np.zeros_like(result)
+    array.pressure_derivs(pos, orders=2, out=out, workspace=workspace, wavenumbers=2 * np.pi * freqs / array.transducer.medium.c)
+    allocations = workspace.allocations
+    array.pressure_derivs(pos, orders=2, out=out, workspace=workspace, wavenumbers=2 * np.pi * freqs / array.transducer.medium.c)
+    assert workspace.allocations == allocations
+    np.testing.assert_allclose(out, result)
+
+
+def test_request_sparse():
+    array = levitate.arrays.RectangularArray(shape=(8, 8), transducer=levitate.transducers.CircularPiston(effective_radius=5e-3))
+    pos = np.random.uniform(-0.05, 0.05, size=(3, 4, 3)) + np.array([0, 0, 0.08]).reshape(3, 1, 1)
+    amps = levitate.complex(np.random.uniform(-np.pi, np.pi, array.num_transducers))
+    requests = {'pressure_derivs': 2, 'spherical_harmonics': 1}
+    dense = array.request(requests, pos)
+    lossless = array.request(requests, pos, sparse_threshold=0)
+    assert isinstance(lossless['pressure_derivs'], levitate.arrays.SparseRequest)
+    assert lossless['pressure_derivs'].shape == dense['pressure_derivs'].shape
+    assert lossless['pressure_derivs'].density == 1
+    np.testing.assert_allclose(lossless['pressure_derivs'].toarray(), dense['pressure_derivs'])
+    np.testing.assert_allclose(lossless['spherical_harmonics'], dense['spherical_harmonics'])
+    np.testing.assert_allclose(lossless['pressure_derivs'].summed(amps), np.einsum('i,ji...->j...', amps, dense['pressure_derivs']))
+    np.testing.assert_allclose(lossless['pressure_derivs'].individual(amps), np.einsum('i,ji...->ji...', amps, dense['pressure_derivs']))
+
+    array.sparse_threshold = 0.5
+    truncated = array.request(requests, pos)['pressure_derivs']
+    assert truncated.nnz < lossless['pressure_derivs'].nnz
+    assert truncated.truncation_error.shape == (10, 4, 3)
+    error = np.abs(truncated.summed(amps) - np.einsum('i,ji...->j...', amps, dense['pressure_derivs']))
+    assert np.all(error <= truncated.truncation_error * (1 + 1e-9))
+    # Chunked evaluation gives the same sparse request.
+    chunked = array._evaluate_sparse_requests({'pressure_derivs': 2}, pos, 0.5, memory_budget=1)['pressure_derivs']
+    np.testing.assert_allclose(chunked.toarray(), truncated.toarray())
+    np.testing.assert_allclose(chunked.truncation_error, truncated.truncation_error)
+
+
+def test_spatial_index():
+    array = levitate.arrays.RectangularArray(shape=(4, 3), spread=0.01)
+    array += levitate.arrays.RectangularArray(shape=2, spread=0.01, offset=(0, 0, 0.2), normal=(0, 0, -1))
+    distances = np.sum((array.positions - np.array([0.005, 0, 0]).reshape(3, 1))**2, axis=0)**0.5
+    np.testing.assert_array_equal(array.transducers_within((0.005, 0, 0), 0.012), np.nonzero(distances <= 0.012)[0])
+
+    pos = np.array([[0.005, 0, 0], [0, 0, 0.2], [0.1, 0.1, 0.1]]).T
+    indices, dists = array.nearest_transducers(pos, num=3)
+    assert indices.shape == dists.shape == (3, 3)
+    for idx in range(3):
+        all_distances = np.sum((array.positions - pos[:, idx:idx + 1])**2, axis=0)**0.5
+        np.testing.assert_allclose(dists[:, idx], np.sort(all_distances)[:3])
+        np.testing.assert_allclose(all_distances[indices[:, idx]], dists[:, idx])
+    indices, dists = array.nearest_transducers((0, 0, 0.2))
+    assert indices.shape == (1,)
+
+    np.testing.assert_array_equal(array.transducer_clusters(0.011), [0] * 12 + [1] * 4)
+    assert len(np.unique(array.transducer_clusters(0.005))) == 16
+    # The index follows the positions.
+    array.positions = array.positions[:, :12]
+    assert array.spatial_index.n == 12
+
+
+def test_symmetries():
+    assert len(levitate.arrays.RectangularArray(shape=(4, 4)).symmetries) == 8
+    assert len(levitate.arrays.RectangularArray(shape=(5, 3)).symmetries) == 4
+    xy = np.mgrid[-0.03:0.03:7j, -0.03:0.03:7j]
+
+    array = levitate.arrays.RectangularArray(shape=(12, 12), transducer=levitate.transducers.CircularPiston(effective_radius=3e-3))
+    array.transducer.use_compiled = False
+    array.use_lattice = False
+    pos = np.concatenate([np.broadcast_to(xy[..., None], (2, 7, 7, 10)), np.linspace(0.02, 0.05, 10)[None, None, None] + np.zeros((1, 7, 7, 1))])
+    direct = array.request({'pressure_derivs': 3}, pos)['pressure_derivs']
+    assert array._symmetric_pressure_derivs(pos, 3) is not None
+    array.use_symmetries = True
+    np.testing.assert_allclose(array.request({'pressure_derivs': 3}, pos)['pressure_derivs'], direct, rtol=1e-12, atol=1e-12 * np.max(np.abs(direct)))
+    # The transducer orbits are reused for the same symmetries.
+    assert len(array._symmetry_orbits) == 1
+    array.request({'pressure_derivs': 1}, pos)
+    assert len(array._symmetry_orbits) == 1
+    # Positions without symmetries, and small requests, are evaluated directly.
+    assert array._symmetric_pressure_derivs(pos + np.array([0.001, 0.0023, 0]).reshape(3, 1, 1, 1), 3) is None
+    assert array._symmetric_pressure_derivs(pos[:, :, :, :2], 3) is None
+    # Models which are evaluated with the compiled kernels are evaluated directly.
+    array.transducer.use_compiled = True
+    assert array._symmetric_pressure_derivs(pos, 3) is None or not levitate._kernels.available
+
+    array = levitate.arrays.DoublesidedArray(levitate.arrays.RectangularArray, separation=0.1, shape=(12, 12), transducer=levitate.transducers.CircularPiston(effective_radius=3e-3))
+    array.transducer.use_compiled = False
+    assert len(array.symmetries) == 16
+    pos = np.concatenate([np.broadcast_to(xy[..., None], (2, 7, 7, 5)), np.linspace(0.02, 0.08, 5)[None, None, None] + np.zeros((1, 7, 7, 1))])
+    direct = array.request({'pressure_derivs': 3}, pos)['pressure_derivs']
+    array.use_symmetries = True
+    assert array._symmetric_pressure_derivs(pos, 3) is not None
+    np.testing.assert_allclose(array.request({'pressure_derivs': 3}, pos)['pressure_derivs'], direct, rtol=1e-12, atol=1e-12 * np.max(np.abs(direct)))
+
+    # Models with directivities which are not symmetric around the normal are evaluated directly.
+    array = levitate.arrays.SphericalCapArray(radius=0.1, rings=3, transducer=levitate.transducers.PlaneWaveTransducer)
+    array.use_lattice = False
+    array.use_symmetries = True
+    pos = np.mgrid[-0.02:0.02:41j, -0.02:0.02:41j, 0.05:0.05:1j]
+    assert len(array.symmetries) > 1
+    assert array._symmetric_pressure_derivs(pos, 3) is None
+
+
+def test_lattice_lookup():
+    array = levitate.arrays.RectangularArray(shape=(6, 5), transducer=levitate.transducers.CircularPiston(effective_radius=3e-3))
+    grids = [
+        np.mgrid[-0.04:0.04:65j, 0:0:1j, 0.01:0.06:41j],
+        np.mgrid[-0.04:0.04:33j, -0.03:0.03:25j, 0.01:0.06:3j],
+        np.mgrid[-0.04:0.04:161j, -0.03:0.03:25j, 0.04:0.04:1j],
+    ]
+    for pos in grids:
+        assert array._lattice_pressure_derivs(pos, 2) is not None
+        direct = array.request({'pressure_derivs': 2}, pos)['pressure_derivs']
+        array.use_lattice = True
+        lattice = array.request({'pressure_derivs': 2}, pos)['pressure_derivs']
+        np.testing.assert_allclose(lattice, direct, rtol=1e-12, atol=1e-12 * np.max(np.abs(direct)))
+        array.use_lattice = False
+    # Irregular positions, small grids, grids which do not match the transducer lattice,
+    # and arrays with different normals are evaluated directly.
+    assert array._lattice_pressure_derivs(np.random.normal(scale=0.05, size=(3, 170, 110)), 2) is None
+    assert array._lattice_pressure_derivs(np.array([[0, 0.01], [0, 0], [0.05, 0.05]]), 2) is None
+    assert array._lattice_pressure_derivs(np.mgrid[-0.04:0.04:17j, 0:0:1j, 0.01:0.06:11j], 2) is None
+    assert array._lattice_pressure_derivs(np.mgrid[-0.0403:0.0397:2600j, 0:0:1j, 0.05:0.05:1j], 2) is None
+    doublesided = levitate.arrays.DoublesidedArray(levitate.arrays.RectangularArray, separation=0.1, shape=(6, 5))
+    assert doublesided._lattice_pressure_derivs(grids[0], 2) is None
+
+    # Other transducer models might depend on the absolute positions, and are evaluated directly.
+    class CustomSource(levitate.transducers.PointSource):
+        pass
+    custom = levitate.arrays.RectangularArray(shape=(6, 5), transducer=CustomSource)
+    custom.use_lattice = True
+    assert custom._lattice_pressure_derivs(grids[0], 2) is None
+    np.testing.assert_allclose(custom.request({'pressure_derivs': 2}, grids[0])['pressure_derivs'], custom.pressure_derivs(grids[0], orders=2))
+
+
+def test_request_num_workers():
+    array = levitate.arrays.RectangularArray(shape=2)
+    pos = np.random.normal(scale=0.05, size=(3, 5, 2)) + np.array([0, 0, 0.1]).reshape(3, 1, 1)
+    requests = {'pressure_derivs': 2, 'spherical_harmonics_gradient': 1}
+    expected = array.request(requests, pos)
+    parallel = array.request(requests, pos, num_workers=3)
+    array.num_workers = 16
+    from_attribute = array.request(requests, pos)
+    for key in expected:
+        assert parallel[key].shape == expected[key].shape
+        np.testing.assert_allclose(parallel[key], expected[key])
+        np.testing.assert_allclose(from_attribute[key], expected[key])
+    # Single positions are not split.
+    np.testing.assert_allclose(array.request(requests, pos[:, 0, 0])['pressure_derivs'], expected['pressure_derivs'][..., 0, 0])
+
+
+def test_spherical_harmonics_gradient():
+    array = levitate.arrays.RectangularArray(shape=2)
+    pos = np.array([0.01, -0.02, 0.05])
+    gradient = array.request({'spherical_harmonics_gradient': 4}, pos)['spherical_harmonics_gradient']
+    delta = 1e-7
+    for axis in range(3):
+        shift = np.zeros(3)
+        shift[axis] = delta
+        finite_difference = (array.spherical_harmonics(pos + shift, orders=4) - array.spherical_harmonics(pos - shift, orders=4)) / (2 * delta)
+        np.testing.assert_allclose(gradient[axis], finite_difference, rtol=1e-5, atol=1e-6 * np.max(np.abs(finite_difference)))
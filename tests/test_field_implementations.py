@@ -200,3 +200,24 @@ def test_field(field, kwargs, value_at_pos_1, jacobian_at_pos_1):
         jac_12 = field.jacobians(**{key: requirements[key] for key in field.jacobians_require})
         np.testing.assert_allclose(jac_1, jacobian_at_pos_1, atol=1e-20)
         np.testing.assert_allclose(jac_12, np.stack([jac_1, jac_2], -1))
+
+
+@pytest.mark.parametrize('field, kwargs', [
+    (levitate.fields.Pressure, {}),
+    (levitate.fields.Velocity, {}),
+    (levitate.fields.GorkovPotential, {}),
+    (levitate.fields.RadiationForceGradient, {}),
+    (levitate.fields.SphericalHarmonicsExpansion, {'orders': 4}),
+])
+def test_single_precision(field, kwargs):
+    positions = np.array([[-23, 12, 34.1], [4, -2, 51]]).T * 1e-3
+    results = []
+    for precision in ['double', 'single']:
+        field_point = field(levitate.arrays.RectangularArray(shape=(9, 8), precision=precision), **kwargs) @ positions
+        requests = field_point.array.request(field_point.values_require, positions)
+        requests.update(field_point.array.request(field_point.jacobians_require, positions))
+        results.append(field_point.values_jacobians(field_point.evaluate_requirements(amps_large, requests)))
+    (double_values, double_jacobians), (single_values, single_jacobians) = results
+    assert single_values.dtype in (np.float32, np.complex64)
+    np.testing.assert_allclose(single_values, double_values, rtol=0, atol=1e-5 * np.max(np.abs(double_values)))
+    np.testing.assert_allclose(single_jacobians, double_jacobians, rtol=0, atol=1e-5 * np.max(np.abs(double_jacobians)))
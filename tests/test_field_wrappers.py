@@ -60,6 +60,24 @@ def test_Field(func):
     np.testing.assert_allclose(val_both, np.stack([val_0, val_1], axis=field.ndim))
 
 
+@pytest.mark.parametrize("func", fields_to_test)
+def test_Field_chunked(func, tmp_path):
+    field = func(array)
+    grid = np.stack(np.meshgrid(np.linspace(-0.01, 0.01, 3), np.linspace(-0.01, 0.01, 4), [0.05, 0.06], indexing='ij'))
+    expected = field(amps, grid)
+    # The small budget gives one position per chunk.
+    chunks = list(field.iter_chunks(amps, grid, memory_budget=1))
+    assert len(chunks) == 24
+    np.testing.assert_allclose(np.concatenate([values for indices, values in chunks], axis=-1), expected.reshape(expected.shape[:field.ndim] + (-1,)))
+
+    np.testing.assert_allclose(field.evaluate_chunked(amps, grid, memory_budget=5000), expected)
+    out = np.lib.format.open_memmap(str(tmp_path / 'values.npy'), mode='w+', dtype=expected.dtype, shape=expected.shape)
+    assert field.evaluate_chunked(amps, grid, out=out, memory_budget=5000) is out
+    np.testing.assert_allclose(np.load(str(tmp_path / 'values.npy')), expected)
+    with pytest.raises(ValueError):
+        field.evaluate_chunked(amps, grid, out=np.empty(expected.shape[:-1] + (3,), expected.dtype))
+
+
 @pytest.mark.parametrize("pos", [pos_0, pos_1, pos_both])
 @pytest.mark.parametrize("func", fields_to_test)
 def test_FieldPoint(func, pos):
@@ -107,3 +125,173 @@ def test_MultiFieldMultiPoint(func0, func1, pos0, pos1):
 
     np.testing.assert_allclose(val0, val_both[0])
     np.testing.assert_allclose(val1, val_both[1])
+
+
+def test_evaluate_requirements():
+    requests = dict(array.request({'spherical_harmonics_gradient': 5}, pos_both), pressure_derivs=spat_ders)
+    requirements = levitate.fields.Pressure(array).evaluate_requirements(amps, requests)
+    # The individual requirements are only calculated when they are used.
+    for key in ['pressure_derivs', 'spherical_harmonics', 'spherical_harmonics_gradient']:
+        assert key + '_summed' in dict(requirements)
+        assert key + '_individual' in requirements
+        assert key + '_individual' not in dict(requirements)
+    for key, expected in requirements_both.items():
+        np.testing.assert_allclose(requirements[key], expected)
+    gradient_individual = np.einsum('i, jki...->jki...', amps, requests['spherical_harmonics_gradient'])
+    np.testing.assert_allclose(requirements['spherical_harmonics_gradient_individual'], gradient_individual)
+    np.testing.assert_allclose(requirements['spherical_harmonics_gradient_summed'], np.sum(gradient_individual, axis=2))
+    # Single positions without a trailing dimension.
+    requirements = levitate.fields.Pressure(array).evaluate_requirements(amps, {'pressure_derivs': spat_ders[..., 0]})
+    np.testing.assert_allclose(requirements['pressure_derivs_summed'], requirements_0['pressure_derivs_summed'])
+
+
+def test_stacked_states():
+    states = np.stack([amps, amps * np.exp(1j * np.linspace(0, np.pi, amps.size)), amps[::-1]])
+    fields = [
+        levitate.fields.GorkovGradient(array),
+        abs(levitate.fields.Velocity(array)) * np.array([1, 2, 3]) + np.array([3, 2, 1]),
+        levitate.fields.stack(levitate.fields.Pressure(array), levitate.fields.RadiationForceStiffness(array)),
+        levitate.fields.softplus(levitate.fields.GorkovGradient(array) * np.array([1e13, 1e10, 1e10])),
+    ]
+    for field in fields:
+        for values, expected in zip([field(states, pos_both), (field @ pos_0)(states)], [[field(state, pos_both) for state in states], [(field @ pos_0)(state) for state in states]]):
+            if isinstance(values, list):
+                for values, *expected in zip(values, *expected):
+                    np.testing.assert_allclose(values, np.stack(expected))
+            else:
+                np.testing.assert_allclose(values, np.stack(expected))
+
+    costs = [
+        (levitate.fields.GorkovPotential(array) @ pos_0 + abs(levitate.fields.Pressure(array) @ pos_1)**2).cost_function,
+        levitate.fields.sum(levitate.fields.softplus(levitate.fields.GorkovGradient(array) @ pos_0 * 1e10)).cost_function,
+        (levitate.fields.softplus(levitate.fields.GorkovPotential(array) * 1e12) @ pos_0).cost_function,
+    ]
+    for cost in costs:
+        for use_adjoint in [True, False]:
+            cost.use_adjoint = use_adjoint
+            values, jacobians = cost(states)
+            assert jacobians.shape == (len(states), array.num_transducers)
+            for state, state_values, state_jacobians in zip(states, values, jacobians):
+                expected_values, expected_jacobians = cost(state)
+                np.testing.assert_allclose(state_values, expected_values)
+                np.testing.assert_allclose(state_jacobians, expected_jacobians)
+
+
+@pytest.mark.parametrize('cost', [
+    lambda array: levitate.fields.GorkovPotential(array) @ pos_0 + (levitate.fields.GorkovGradient(array) @ pos_1 * (1, 1, 2))**2,
+    lambda array: levitate.fields.sum_of_eigenvalues(levitate.fields.RadiationForceGradient(array) @ pos_0),
+    lambda array: (levitate.fields.SphericalHarmonicsForce(array, orders=2, radius=1e-3) @ pos_both)**2,
+    lambda array: abs(levitate.fields.Pressure(array) @ pos_0) * (levitate.fields.RadiationForceStiffness(array) @ pos_1),
+    lambda array: levitate.fields.softplus(levitate.fields.GorkovPotential(array) @ pos_both * 1e13),
+])
+def test_adjoint_jacobians(cost):
+    local_array = levitate.arrays.RectangularArray(shape=(6, 6))
+    cost = levitate.fields.sum(cost(local_array)).cost_function
+    states = levitate.complex(np.linspace(0, 2 * np.pi, 2 * local_array.num_transducers)).reshape(2, -1)
+    for state in [states[0], states]:
+        cost.use_adjoint = False
+        expected_values, expected_jacobians = cost(state)
+        cost.use_adjoint = True
+        values, jacobians = cost(state)
+        np.testing.assert_allclose(values, expected_values)
+        assert jacobians.shape == expected_jacobians.shape
+        np.testing.assert_allclose(jacobians, expected_jacobians, atol=1e-12 * np.max(np.abs(expected_jacobians)))
+
+
+def test_compile():
+    local_array = levitate.arrays.RectangularArray(shape=(6, 6))
+    pressure = levitate.fields.Pressure(local_array) @ pos_0
+    cost = (
+        levitate.fields.GorkovPotential(local_array) @ pos_0 + abs(pressure) * abs(pressure)
+        + levitate.fields.sum_of_eigenvalues(levitate.fields.RadiationForceGradient(local_array) @ pos_1)
+    ).cost_function
+    compiled = levitate.fields.compile(cost)
+    # The repeated pressure is only evaluated once.
+    assert len(compiled.leaves) == 3
+    assert len(compiled.positions) == 2
+    states = levitate.complex(np.linspace(0, 2 * np.pi, 2 * local_array.num_transducers)).reshape(2, -1)
+    for use_adjoint in [True, False]:
+        cost.use_adjoint = compiled.use_adjoint = use_adjoint
+        for state in [states[0], states]:
+            for result, expected in zip(compiled(state), cost(state)):
+                np.testing.assert_allclose(result, expected, atol=1e-12 * np.max(np.abs(expected)))
+
+    stacked = levitate.fields.stack(levitate.fields.GorkovGradient(local_array) @ pos_0, abs(levitate.fields.Velocity(local_array) @ pos_both) * 2)
+    for result, expected in zip(levitate.fields.compile(stacked)(states[0]), stacked(states[0])):
+        np.testing.assert_allclose(result, expected)
+    with pytest.raises(TypeError):
+        levitate.fields.compile(levitate.fields.Pressure(local_array))
+
+
+def test_shared_implementations(monkeypatch):
+    local_array = levitate.arrays.RectangularArray(shape=(6, 6))
+    pressure = levitate.fields.Pressure(local_array)
+    gorkov = levitate.fields.GorkovPotential(local_array) @ pos_0
+    cost = (
+        abs(pressure @ pos_0) + abs(levitate.fields.Pressure(local_array) @ pos_0)**2
+        + 2 * gorkov + gorkov + abs(pressure @ pos_1)
+    ).cost_function
+    # One pressure and one Gor'kov potential at the first position, one pressure at the second position.
+    assert [len(implementations) for implementations in cost._implementations] == [2, 1]
+
+    counts = {'values': 0, 'jacobians': 0}
+    for method in counts:
+        def counted(self, *args, _method=getattr(levitate.fields.Pressure, method), _name=method, **kwargs):
+            counts[_name] += 1
+            return _method(self, *args, **kwargs)
+        monkeypatch.setattr(levitate.fields.Pressure, method, counted)
+
+    states = levitate.complex(np.linspace(0, 2 * np.pi, 2 * local_array.num_transducers)).reshape(2, -1)
+    for state in [states[0], states]:
+        expected_values = (
+            np.abs(pressure(state, pos_0)) + np.abs(pressure(state, pos_0))**2
+            + 3 * levitate.fields.GorkovPotential(local_array)(state, pos_0) + np.abs(pressure(state, pos_1))
+        )
+        expected = levitate.fields.compile(cost)(state)
+        for use_adjoint in [True, False]:
+            cost.use_adjoint = use_adjoint
+            counts.update(values=0, jacobians=0)
+            values, jacobians = cost(state)
+            assert counts == {'values': 2, 'jacobians': 2}
+            np.testing.assert_allclose(values, expected_values)
+            np.testing.assert_allclose(values, expected[0])
+            np.testing.assert_allclose(jacobians, expected[1], atol=1e-12 * np.max(np.abs(expected[1])))
+
+
+def test_sparse_requests():
+    local_array = levitate.arrays.RectangularArray(shape=(4, 5))
+    field = levitate.fields.GorkovGradient(local_array)
+    cost = (levitate.fields.GorkovPotential(local_array) @ pos_0).cost_function
+    expected_values, expected_cost = field(amps, pos_both), cost(amps)
+    local_array.sparse_threshold = 0
+    requirements = field.evaluate_requirements(amps, local_array.request({'pressure_derivs': 1}, pos_both))
+    assert 'pressure_derivs_individual' in requirements
+    assert 'pressure_derivs_individual' not in dict(requirements)
+    np.testing.assert_allclose(field(amps, pos_both), expected_values)
+    cost = (levitate.fields.GorkovPotential(local_array) @ pos_0).cost_function
+    for result, expected in zip(cost(amps), expected_cost):
+        np.testing.assert_allclose(result, expected)
+
+
+def test_bound_fields_medium_update():
+    local_array = levitate.arrays.RectangularArray(shape=(4, 5))
+    field = levitate.fields.GorkovGradient(local_array)
+    other = levitate.fields.Pressure(local_array)
+    bound = field @ pos_both
+    multi = levitate.fields.stack(field @ pos_0, other @ pos_1)
+    potential = levitate.fields.GorkovPotential(local_array)
+    cost = (potential @ pos_0).cost_function
+    bound(amps), multi(amps), cost(amps)
+    geometry = bound._cached_geometry
+    try:
+        air.update_properties(temperature=35)
+        # The cached requests are updated for the new wavenumber, reusing the geometry.
+        np.testing.assert_allclose(bound(amps), field(amps, pos_both))
+        assert bound._cached_geometry is geometry
+        np.testing.assert_allclose(multi(amps)[0], field(amps, pos_0))
+        np.testing.assert_allclose(multi(amps)[1], other(amps, pos_1))
+        np.testing.assert_allclose(cost(amps)[0], potential(amps, pos_0))
+    finally:
+        air.c = 343
+        air.rho = 1.2
+    np.testing.assert_allclose(bound(amps), field(amps, pos_both))
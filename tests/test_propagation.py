@@ -0,0 +1,87 @@
+import levitate
+import levitate.propagation
+import numpy as np
+import pytest
+
+# Tests created with these air properties
+from levitate.materials import air
+air.c = 343
+air.rho = 1.2
+
+array = levitate.arrays.RectangularArray(shape=(6, 5))
+amps = levitate.complex(np.linspace(-np.pi, np.pi, array.num_transducers))
+pos = np.mgrid[-0.03:0.03:9j, -0.03:0.03:7j, 0.02:0.08:8j]
+
+
+@pytest.mark.parametrize('orders', [0, 1, 2])
+def test_TreeCode_pressure_derivs(orders):
+    direct = np.einsum('i,ji...->j...', amps, array.pressure_derivs(pos, orders=orders))
+    magnitudes = np.einsum('i,ji...->j...', np.abs(amps), np.abs(array.pressure_derivs(pos, orders=orders)))
+    tree_code = levitate.propagation.TreeCode(array, box_size=5e-3, tolerance=1e-6)
+    result = tree_code.pressure_derivs(amps, pos, orders=orders)
+    assert result.shape == direct.shape
+    assert np.all(np.abs(result - direct) <= 1e-6 * magnitudes)
+    # Most of the transducers should use the expansions.
+    assert np.mean(tree_code._directivity_polynomials(pos.reshape(3, -1)[:, ::50], 0.5 * 3**0.5 * 5e-3)[0]) > 0.5
+
+
+def test_TreeCode_directivity():
+    piston_array = levitate.arrays.RectangularArray(shape=(6, 5), transducer=levitate.transducers.CircularPiston(effective_radius=3e-3))
+    direct = np.einsum('i,ji...->j...', amps, piston_array.pressure_derivs(pos, orders=1))
+    magnitudes = np.einsum('i,ji...->j...', np.abs(amps), np.abs(piston_array.pressure_derivs(pos, orders=1)))
+    for tolerance in [1e-2, 1e-4]:
+        tree_code = levitate.propagation.TreeCode(piston_array, box_size=5e-3, tolerance=tolerance)
+        result = tree_code.pressure_derivs(amps, pos, orders=1)
+        assert np.all(np.abs(result - direct) <= tolerance * magnitudes)
+
+
+def test_TreeCode_evaluate():
+    tree_code = levitate.propagation.TreeCode(array, box_size=5e-3, tolerance=1e-8)
+    for field in [levitate.fields.Pressure(array), levitate.fields.Velocity(array), levitate.fields.GorkovPotential(array)]:
+        np.testing.assert_allclose(tree_code.evaluate(field, amps, pos), field(amps, pos), rtol=1e-6, atol=1e-12)
+    with pytest.raises(ValueError):
+        tree_code.evaluate(levitate.fields.SphericalHarmonicsForce(array, orders=2, radius=1e-3), amps, pos)
+    stacked = levitate.fields.stack(levitate.fields.Pressure(array), levitate.fields.Velocity(array))
+    for values, expected in zip(tree_code.evaluate(stacked, amps, pos), stacked(amps, pos)):
+        np.testing.assert_allclose(values, expected, rtol=1e-6, atol=1e-12)
+    with pytest.raises(NotImplementedError):
+        levitate.propagation.TreeCode(levitate.arrays.RectangularArray(shape=2, transducer=levitate.transducers.TransducerReflector(levitate.transducers.PointSource))).pressure_derivs(amps[:4], pos)
+
+
+def test_TreeCode_expansion_order():
+    tree_code = levitate.propagation.TreeCode(array, tolerance=1e-3)
+    low = tree_code.expansion_order(5e-3)
+    tree_code.tolerance = 1e-9
+    assert tree_code.expansion_order(5e-3) > low
+    tree_code.separation = 1
+    with pytest.raises(ValueError):
+        tree_code.expansion_order(5e-3)
+
+
+@pytest.mark.parametrize('grid', [
+    np.mgrid[-0.03:0.03:13j, -0.03:0.03:11j, 0.04:0.04:1j],
+    np.mgrid[-0.03:0.03:25j, 0:0:1j, 0.01:0.05:9j],
+    np.mgrid[-0.03:0.03:7j, -0.02:0.02:5j, 0.02:0.05:4j],
+])
+def test_AngularSpectrum_pressure_derivs(grid):
+    piston_array = levitate.arrays.RectangularArray(shape=(6, 5), transducer=levitate.transducers.CircularPiston(effective_radius=3e-3))
+    direct = np.einsum('i,ji...->j...', amps, piston_array.pressure_derivs(grid, orders=2))
+    result = levitate.propagation.AngularSpectrum(piston_array).pressure_derivs(amps, grid, orders=2)
+    assert result.shape == direct.shape
+    np.testing.assert_allclose(result, direct, rtol=1e-9, atol=1e-12 * np.max(np.abs(direct)))
+
+
+def test_AngularSpectrum_evaluate():
+    grid = np.mgrid[-0.03:0.03:13j, -0.03:0.03:11j, 0.04:0.04:1j]
+    angular_spectrum = levitate.propagation.AngularSpectrum(array)
+    for field in [levitate.fields.Pressure(array), levitate.fields.Velocity(array)]:
+        np.testing.assert_allclose(angular_spectrum.evaluate(field, amps, grid), field(amps, grid), rtol=1e-9, atol=1e-12)
+    with pytest.raises(ValueError):
+        angular_spectrum.evaluate(levitate.fields.SphericalHarmonicsForce(array, orders=2, radius=1e-3), amps, grid)
+    with pytest.raises(ValueError):
+        angular_spectrum.pressure_derivs(amps, pos + np.random.uniform(-1e-3, 1e-3, pos.shape))
+    with pytest.raises(ValueError):
+        levitate.propagation.AngularSpectrum(levitate.arrays.DoublesidedArray(levitate.arrays.RectangularArray, separation=0.1, shape=2)).pressure_derivs(amps[:8], grid)
+    angular_spectrum.tolerance = -1
+    with pytest.raises(RuntimeError):
+        angular_spectrum.pressure_derivs(amps, grid)
@@ -16,8 +16,9 @@ receiver_pos = np.stack(([0.1, 0.2, 0.3], [-0.15, 1.27, 0.001]), axis=1)
 @pytest.mark.parametrize("t_model, args, atol, rtol", [
     (levitate.transducers.PointSource, {}, 0, 1e-7),
     (levitate.transducers.PlaneWaveTransducer, {}, 0, 1e-7),
-    (levitate.transducers.CircularPiston, {'effective_radius': 3e-3}, 0, 1e-4),
+    (levitate.transducers.CircularPiston, {'effective_radius': 3e-3}, 0, 1e-7),
     (levitate.transducers.CircularRing, {'effective_radius': 3e-3}, 0, 1e-7),
+    (levitate.transducers.TabulatedTransducer, {'angles': np.linspace(0, np.pi, 91), 'directivities': np.cos(np.linspace(0, np.pi, 91) / 2)**2 * np.exp(0.3j * np.linspace(0, np.pi, 91))}, 0, 1e-7),
 ])
 def test_pressure_derivs(t_model, args, atol, rtol):
     idx = levitate._indexing.pressure_derivs_order.index
@@ -207,6 +208,49 @@ def test_ReflectingTransducer():
     np.testing.assert_allclose(transducer.spherical_harmonics(source_pos, source_normal, receiver_pos, orders=3), expected_result)
 
 
+def test_ImageSourceReflector():
+    plane_distance = 0.5
+    plane_normal = (3, -1, 9)
+    norm = sum([n**2 for n in plane_normal])**0.5
+    plane_intersect = [plane_distance * n / norm for n in plane_normal]
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+
+    # A single plane with first order reflections is the same as the simple reflector.
+    single = levitate.transducers.ImageSourceReflector(levitate.transducers.CircularPiston, planes=[(plane_intersect, plane_normal, np.exp(1j))], effective_radius=3e-3)
+    reference = levitate.transducers.TransducerReflector(levitate.transducers.CircularPiston, plane_intersect=plane_intersect, plane_normal=plane_normal, reflection_coefficient=np.exp(1j), effective_radius=3e-3)
+    assert single.num_images == 1
+    np.testing.assert_allclose(single.pressure_derivs(source_pos, source_normal, receiver_pos), reference.pressure_derivs(source_pos, source_normal, receiver_pos))
+    np.testing.assert_allclose(single.pressure_derivs(sources, normals, receiver_pos), reference.pressure_derivs(sources, normals, receiver_pos))
+    np.testing.assert_allclose(single.spherical_harmonics(sources, normals, receiver_pos, orders=2), reference.spherical_harmonics(sources, normals, receiver_pos, orders=2))
+
+    # Two perpendicular planes have three images, same as nested reflectors.
+    floor = ((0, 0, -0.1), (0, 0, 1), 0.9)
+    wall = ((0.3, 0, 0), (-1, 0, 0), 0.5j)
+    corner = levitate.transducers.ImageSourceReflector(levitate.transducers.PointSource, planes=[floor, wall], max_order=2)
+    nested = levitate.transducers.TransducerReflector(
+        levitate.transducers.TransducerReflector(levitate.transducers.PointSource, plane_intersect=floor[0], plane_normal=floor[1], reflection_coefficient=floor[2]),
+        plane_intersect=wall[0], plane_normal=wall[1], reflection_coefficient=wall[2])
+    assert corner.num_images == 3
+    np.testing.assert_allclose(corner.pressure_derivs(sources, normals, receiver_pos), nested.pressure_derivs(sources, normals, receiver_pos))
+
+    # Parallel planes give new images for each order.
+    ceiling = ((0, 0, 1.5), (0, 0, -1))
+    assert levitate.transducers.ImageSourceReflector(levitate.transducers.PointSource, planes=[floor, ceiling], max_order=3).num_images == 6
+
+    workspace = levitate.transducers.Workspace()
+    expected_result = corner.pressure_derivs(sources, normals, receiver_pos)
+    out = np.zeros_like(expected_result)
+    corner.pressure_derivs(sources, normals, receiver_pos, out=out, workspace=workspace)
+    np.testing.assert_allclose(out, expected_result)
+    nbytes = workspace.nbytes
+    corner.pressure_derivs(sources, normals, receiver_pos, out=out, workspace=workspace)
+    assert workspace.nbytes == nbytes
+    assert corner == levitate.transducers.ImageSourceReflector(levitate.transducers.PointSource, planes=[floor, wall], max_order=2)
+    assert corner != levitate.transducers.ImageSourceReflector(levitate.transducers.PointSource, planes=[floor, wall], max_order=1)
+    assert 'max_order=2' in repr(corner)
+
+
 def test_PlaneWaveTransducer():
     transducer = levitate.transducers.PlaneWaveTransducer()
     expected_result = np.array([0.10009402 + 5.99916504j, 5.8662305 + 1.2598967j])
@@ -241,28 +285,265 @@ def test_CircularPiston():
     np.testing.assert_allclose(transducer.pressure(source_pos, source_normal, receiver_pos), expected_result)
     expected_result = np.array([
         [-1.37684664e+01+7.71395542e+00j, -2.94292484e+00+1.24028496e+00j],
-        [-1.46345035e+03-2.62213599e+03j,  1.24020677e+02+2.97579665e+02j],
-        [-1.31120087e+03-2.32498540e+03j, -8.97477518e+02-2.13629191e+03j],
-        [-5.25737863e+03-9.48412135e+03j, -2.16665257e+01-4.77189774e+01j],
-        [ 4.84382213e+05-3.04903352e+05j,  2.93243277e+04-1.42224002e+04j],
-        [ 3.77388146e+05-2.50552438e+05j,  1.55073129e+06-6.49449802e+05j],
-        [ 6.53069266e+06-3.58626397e+06j, -7.42767086e+00-2.23335601e+03j],
-        [ 4.43752707e+05-2.47008880e+05j, -2.16119628e+05+8.94854997e+04j],
-        [ 1.81008550e+06-9.90242571e+05j, -4.82923089e+03+2.16269160e+03j],
-        [ 1.60504101e+06-8.87366311e+05j,  3.46591766e+04-1.56403155e+04j],
-        [ 6.82828158e+07+8.66331965e+07j, -1.79275397e+06-2.81350794e+06j],
-        [ 5.19358860e+07+5.85916458e+07j,  4.69989068e+08+1.12565967e+09j],
-        [ 2.44856151e+09+4.49550825e+09j,  9.68920897e+04-2.82922526e+04j],
-        [ 5.11404315e+07+8.21611475e+07j,  1.02443418e+07+2.13108604e+07j],
-        [ 2.05309319e+08+3.35303612e+08j,  2.45407452e+05+4.75368579e+05j],
-        [ 4.69742337e+07+7.22314736e+07j, -6.45682263e+07-1.56955705e+08j],
-        [ 1.68880510e+08+2.61333135e+08j,  1.12904036e+07+2.51731080e+07j],
-        [ 6.70487884e+08+1.24899315e+09j, -2.25374325e+05-4.85350052e+02j],
-        [ 6.00924515e+08+1.10756082e+09j,  1.61978412e+06-1.32990931e+03j],
-        [ 1.65922945e+08+3.06976755e+08j, -1.55693915e+06-3.50934304e+06j]])
+        [-1.46345031e+03-2.62213601e+03j,  1.24020676e+02+2.97579665e+02j],
+        [-1.31120105e+03-2.32498530e+03j, -8.97477518e+02-2.13629191e+03j],
+        [-5.25737864e+03-9.48412135e+03j, -2.16665274e+01-4.77189767e+01j],
+        [ 4.84382223e+05-3.04903337e+05j,  2.93243278e+04-1.42224000e+04j],
+        [ 3.77388115e+05-2.50552499e+05j,  1.55073129e+06-6.49449802e+05j],
+        [ 6.53069265e+06-3.58626397e+06j, -7.42769619e+00-2.23335607e+03j],
+        [ 4.43752692e+05-2.47008907e+05j, -2.16119628e+05+8.94854989e+04j],
+        [ 1.81008552e+06-9.90242544e+05j, -4.82923083e+03+2.16269175e+03j],
+        [ 1.60504095e+06-8.87366435e+05j,  3.46591761e+04-1.56403167e+04j],
+        [ 6.82828120e+07+8.66332004e+07j, -1.79275394e+06-2.81350796e+06j],
+        [ 5.19359014e+07+5.85916374e+07j,  4.69989068e+08+1.12565967e+09j],
+        [ 2.44856152e+09+4.49550825e+09j,  9.68920897e+04-2.82922565e+04j],
+        [ 5.11404353e+07+8.21611455e+07j,  1.02443416e+07+2.13108605e+07j],
+        [ 2.05309309e+08+3.35303619e+08j,  2.45407465e+05+4.75368573e+05j],
+        [ 4.69742442e+07+7.22314686e+07j, -6.45682257e+07-1.56955705e+08j],
+        [ 1.68880553e+08+2.61333114e+08j,  1.12904045e+07+2.51731076e+07j],
+        [ 6.70487865e+08+1.24899316e+09j, -2.25374330e+05-4.85348521e+02j],
+        [ 6.00924601e+08+1.10756078e+09j,  1.61978416e+06-1.32992740e+03j],
+        [ 1.65922964e+08+3.06976746e+08j, -1.55693926e+06-3.50934300e+06j]])
     np.testing.assert_allclose(transducer.pressure_derivs(source_pos, source_normal, receiver_pos), expected_result)
 
 
+@pytest.mark.parametrize("transducer", [
+    levitate.transducers.PointSource(),
+    levitate.transducers.PlaneWaveTransducer(),
+    levitate.transducers.CircularPiston(effective_radius=3e-3),
+    levitate.transducers.CircularRing(effective_radius=3e-3),
+    levitate.transducers.TransducerReflector(levitate.transducers.PointSource(), plane_intersect=(0, 0, -0.1)),
+])
+def test_pressure_derivs_out(transducer):
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+    expected_result = transducer.pressure_derivs(sources, normals, receiver_pos)
+    workspace = levitate.transducers.Workspace()
+    out = np.zeros_like(expected_result)
+    result = transducer.pressure_derivs(sources, normals, receiver_pos, out=out, workspace=workspace)
+    assert result is out
+    np.testing.assert_allclose(out, expected_result)
+
+    # Repeated calls should reuse the memory in the workspace.
+    nbytes = workspace.nbytes
+    out[:] = 0
+    transducer.pressure_derivs(sources, normals, receiver_pos, out=out, workspace=workspace)
+    np.testing.assert_allclose(out, expected_result)
+    assert workspace.nbytes == nbytes
+
+    with pytest.raises(ValueError):
+        transducer.pressure_derivs(sources, normals, receiver_pos, out=out[:4], workspace=workspace)
+
+
+@pytest.mark.parametrize("t_model, args", [
+    (levitate.transducers.PointSource, {}),
+    (levitate.transducers.PlaneWaveTransducer, {}),
+    (levitate.transducers.CircularPiston, {'effective_radius': 3e-3}),
+    (levitate.transducers.CircularRing, {'effective_radius': 3e-3}),
+])
+def test_single_precision(t_model, args):
+    double = t_model(**args)
+    single = t_model(precision='single', **args)
+    assert single.dtype == np.complex64
+    assert single != double
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+    for method in ['pressure_derivs', 'spherical_harmonics']:
+        if not hasattr(double, method):
+            continue
+        expected_result = getattr(double, method)(sources, normals, receiver_pos)
+        result = getattr(single, method)(sources, normals, receiver_pos)
+        assert result.dtype == np.complex64
+        # Compare each derivative to its largest value, since some components are close to zero.
+        # The phase error grows with kr, which is almost 1000 for the receivers used here.
+        scale = np.max(np.abs(expected_result), axis=(1, 2), keepdims=True)
+        np.testing.assert_allclose(result / scale, expected_result / scale, rtol=0, atol=1e-4)
+    with pytest.raises(ValueError):
+        single.precision = 'half'
+
+
+@pytest.mark.parametrize("transducer", [
+    levitate.transducers.PointSource(),
+    levitate.transducers.PlaneWaveTransducer(),
+    levitate.transducers.CircularPiston(effective_radius=3e-3),
+    levitate.transducers.CircularRing(effective_radius=3e-3),
+    levitate.transducers.TransducerReflector(levitate.transducers.CircularPiston(effective_radius=3e-3), plane_intersect=(0, 0, -0.1)),
+])
+def test_geometry(transducer):
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+    geometry = levitate.transducers.SourceReceiverGeometry(sources, normals, receiver_pos)
+    np.testing.assert_allclose(geometry.distance, np.sum((receiver_pos[:, None] - sources[:, :, None])**2, axis=0)**0.5)
+    for method in ['pressure_derivs', 'spherical_harmonics']:
+        if not hasattr(transducer, method):
+            continue
+        expected_result = getattr(transducer, method)(sources, normals, receiver_pos)
+        np.testing.assert_allclose(getattr(transducer, method)(sources, normals, receiver_pos, geometry=geometry), expected_result)
+        # A geometry for other positions should not be used.
+        other = levitate.transducers.SourceReceiverGeometry(sources, normals, receiver_pos * 2)
+        np.testing.assert_allclose(getattr(transducer, method)(sources, normals, receiver_pos, geometry=other), expected_result)
+
+
+@pytest.mark.parametrize("transducer", [
+    levitate.transducers.PointSource(),
+    levitate.transducers.PlaneWaveTransducer(),
+    levitate.transducers.CircularPiston(effective_radius=3e-3),
+    levitate.transducers.TransducerReflector(levitate.transducers.CircularRing(effective_radius=3e-3), plane_intersect=(0, 0, -0.1)),
+    levitate.transducers.ImageSourceReflector(levitate.transducers.PointSource(), planes=[((0, 0, -0.1), (0, 0, 1)), ((0.5, 0, 0), (-1, 0, 0))]),
+])
+def test_pressure_derivs_wavenumbers(transducer):
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+    wavenumbers = transducer.k * np.array([0.5, 1, 1.5])
+    result = transducer.pressure_derivs(sources, normals, receiver_pos, orders=2, wavenumbers=wavenumbers)
+    assert result.shape == (3, 10, 2, 2)
+    k = transducer.k
+    for idx, wavenumber in enumerate(wavenumbers):
+        transducer.k = wavenumber
+        expected_result = transducer.pressure_derivs(sources, normals, receiver_pos, orders=2)
+        transducer.k = k
+        np.testing.assert_allclose(result[idx], expected_result)
+    assert transducer.k == k
+
+    out = np.zeros_like(result)
+    assert transducer.pressure_derivs(sources, normals, receiver_pos, orders=2, wavenumbers=wavenumbers, out=out) is out
+    np.testing.assert_allclose(out, result)
+
+
+def test_geometry_custom_model():
+    # Models without a geometry argument should still work in arrays.
+    class Custom(levitate.transducers.CircularPiston):
+        def directivity(self, source_positions, source_normals, receiver_positions):
+            return super().directivity(source_positions, source_normals, receiver_positions) * 0.5
+
+        def directivity_derivatives(self, source_positions, source_normals, receiver_positions, orders=3):
+            return super().directivity_derivatives(source_positions, source_normals, receiver_positions, orders) * 0.5
+
+    piston = levitate.transducers.CircularPiston(effective_radius=3e-3)
+    custom = Custom(effective_radius=3e-3)
+    array = levitate.arrays.RectangularArray(shape=2, transducer=custom)
+    reference = levitate.arrays.RectangularArray(shape=2, transducer=piston)
+    requests = array.request({'pressure_derivs': 2, 'spherical_harmonics': 1}, receiver_pos)
+    expected = reference.request({'pressure_derivs': 2, 'spherical_harmonics': 1}, receiver_pos)
+    for key in expected:
+        np.testing.assert_allclose(requests[key], expected[key] * 0.5)
+
+
+def test_spherical_harmonics_recurrence():
+    from scipy.special import spherical_jn, spherical_yn, sph_harm
+    transducer = levitate.transducers.PointSource()
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+    # The last receiver is straight above the first source, where the azimuth is undefined.
+    receivers = np.concatenate([receiver_pos, source_pos.reshape(3, 1) + [[0], [0], [0.05]]], axis=1)
+    orders = 12
+    result = transducer.spherical_harmonics(sources, normals, receivers, orders=orders)
+
+    diff = sources[:, :, None] - receivers[:, None, :]
+    r = np.sum(diff**2, axis=0)**0.5
+    kr = transducer.k * r
+    colatitude = np.arccos(diff[2] / r)
+    azimuth = np.arctan2(diff[1], diff[0])
+    sph_idx = levitate._indexing.SphericalHarmonicsIndexer(orders)
+    expected_result = np.zeros_like(result)
+    for n, m in sph_idx:
+        hankel = spherical_jn(n, kr) + 1j * spherical_yn(n, kr)
+        expected_result[sph_idx(n, m)] = hankel * np.conj(sph_harm(m, n, azimuth, colatitude))
+    expected_result *= transducer.p0 * 4 * np.pi * 1j * transducer.k
+    np.testing.assert_allclose(result, expected_result, rtol=1e-10, atol=1e-12 * np.max(np.abs(expected_result)))
+
+
+@pytest.mark.parametrize('offset', [0, 1e-9, 1e-7, 2.4e-5, 2.5e-5, 1e-3])
+def test_CircularPiston_main_axis(offset):
+    # The analytic derivatives switch to small argument expansions close to the main axis.
+    transducer = levitate.transducers.CircularPiston(effective_radius=3e-3)
+    spos = np.array([0, 0, 0])
+    n = np.array([0, 0, 1])
+    rpos = np.array([offset, offset * 0.5, 60e-3])
+    implemented = transducer.directivity_derivatives(spos, n, rpos)
+    stencil = levitate.transducers.PointSource.directivity_derivatives(transducer, spos, n, rpos)
+    for order in range(4):
+        start, stop = ([0] + levitate._indexing.num_pressure_derivs)[order:order + 2]
+        atol = np.max(np.abs(stencil[start:stop])) * 1e-2
+        np.testing.assert_allclose(implemented[start:stop], stencil[start:stop], rtol=1e-2, atol=atol)
+
+
+@pytest.mark.skipif(not levitate._kernels.available, reason='Compiled kernels need numba')
+@pytest.mark.parametrize("transducer", [
+    levitate.transducers.PointSource(),
+    levitate.transducers.CircularPiston(effective_radius=3e-3),
+    levitate.transducers.CircularRing(effective_radius=3e-3),
+    levitate.transducers.TabulatedTransducer(angles=np.linspace(0, np.pi, 19), directivities=np.exp(1j * np.linspace(0, np.pi, 19)) * np.cos(np.linspace(0, np.pi / 2, 19))),
+    levitate.transducers.CircularPiston(effective_radius=3e-3, precision='single'),
+])
+def test_compiled_pressure_derivs(transducer):
+    sources = np.stack([source_pos, -source_pos, 2 * source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal, -source_normal], axis=1)
+    receivers = np.stack([receiver_pos, 2 * receiver_pos, receiver_pos + 0.01], axis=1)
+    transducer.use_compiled = False
+    expected_results = [transducer.pressure_derivs(sources, normals, receivers, orders=orders) for orders in range(4)]
+    transducer.use_compiled = True
+    for orders, expected_result in enumerate(expected_results):
+        result = transducer.pressure_derivs(sources, normals, receivers, orders=orders)
+        assert result.dtype == transducer.dtype
+        scale = np.max(np.abs(expected_result), axis=(1, 2, 3), keepdims=True)
+        # The NumPy implementation has phase errors in single precision, see `test_single_precision`.
+        tolerance = 1e-12 if transducer.precision == 'double' else 1e-4
+        np.testing.assert_allclose(result / scale, expected_result / scale, rtol=0, atol=tolerance)
+
+    # Non-contiguous outputs are also supported.
+    out = np.zeros(expected_result.shape[:-1] + (2 * expected_result.shape[-1],), dtype=transducer.dtype)[..., ::2]
+    assert transducer.pressure_derivs(sources, normals, receivers, orders=3, out=out) is out
+    np.testing.assert_allclose(out / scale, expected_result / scale, rtol=0, atol=tolerance)
+
+
+def test_TabulatedTransducer():
+    piston = levitate.transducers.CircularPiston(effective_radius=3e-3)
+    transducer = levitate.transducers.TabulatedTransducer.from_model(piston)
+    assert len(transducer.angles) == 181
+    sources = np.stack([source_pos, -source_pos], axis=1)
+    normals = np.stack([source_normal, source_normal], axis=1)
+    expected_result = piston.pressure_derivs(sources, normals, receiver_pos)
+    scale = np.max(np.abs(expected_result), axis=(1, 2), keepdims=True)
+    np.testing.assert_allclose(transducer.pressure_derivs(sources, normals, receiver_pos) / scale, expected_result / scale, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(transducer.spherical_harmonics(sources, normals, receiver_pos, orders=2), piston.spherical_harmonics(sources, normals, receiver_pos, orders=2), rtol=1e-6)
+
+    # Angles outside the table use the closest value.
+    partial = levitate.transducers.TabulatedTransducer(angles=[0, 0.5, 1, 1.5], directivities=[1, 0.8, 0.5, 0.2])
+    np.testing.assert_allclose(partial.directivity(np.zeros(3), np.array([0, 0, 1]), np.array([0, 0, -1])), 0.2)
+    # The directivity is constant outside the table, so the derivatives only come from the spreading.
+    narrow = levitate.transducers.TabulatedTransducer(angles=np.linspace(0, np.pi / 3, 7), directivities=np.cos(np.linspace(0, np.pi / 3, 7)))
+    receiver = 0.1 * np.array([np.sin(np.radians(75)), 0, np.cos(np.radians(75))])
+    derivatives = narrow.directivity_derivatives(np.zeros(3), np.array([0., 0., 1.]), receiver, orders=3)
+    np.testing.assert_allclose(derivatives[0], 0.5)
+    np.testing.assert_allclose(derivatives[1:], 0)
+    delta = 1e-6
+    for axis in range(3):
+        step = delta * np.eye(3)[axis]
+        finite_difference = (narrow.directivity(np.zeros(3), np.array([0., 0., 1.]), receiver + step) - narrow.directivity(np.zeros(3), np.array([0., 0., 1.]), receiver - step)) / (2 * delta)
+        np.testing.assert_allclose(derivatives[1 + axis], finite_difference, atol=1e-9)
+    narrow.use_compiled = False
+    direct = narrow.pressure_derivs(np.zeros(3), np.array([0., 0., 1.]), receiver, orders=3)
+    narrow.use_compiled = True
+    np.testing.assert_allclose(narrow.pressure_derivs(np.zeros(3), np.array([0., 0., 1.]), receiver, orders=3), direct)
+    np.testing.assert_allclose(direct, 0.5 * levitate.transducers.PointSource().pressure_derivs(np.zeros(3), np.array([0., 0., 1.]), receiver, orders=3))
+    assert partial == levitate.transducers.TabulatedTransducer(angles=[1.5, 1, 0.5, 0], directivities=[0.2, 0.5, 0.8, 1])
+    assert partial != transducer
+    assert 'num_angles=4' in repr(partial)
+    with pytest.raises(ValueError):
+        levitate.transducers.TabulatedTransducer(angles=[0, 1], directivities=[1, 0.5, 0.2])
+
+    # Short tables use lower odd spline degrees.
+    for num_angles, degree in zip(range(2, 7), [1, 1, 3, 3, 5]):
+        angles = np.linspace(0, np.pi / 2, num_angles)
+        short = levitate.transducers.TabulatedTransducer(angles=angles, directivities=np.cos(angles)**2)
+        assert short._spline.c.shape[0] == degree + 1
+        receivers = 0.1 * np.stack([np.sin(angles), np.zeros_like(angles), np.cos(angles)])
+        np.testing.assert_allclose(short.directivity(np.zeros(3), np.array([0., 0., 1.]), receivers), np.cos(angles)**2, atol=1e-12)
+        cosine_derivatives = short._evaluate_spline(np.cos(angles[:-1] + 0.1), 3)
+        assert np.all([np.any(derivative != 0) for derivative in cosine_derivatives[1:degree + 1]])
+
+
 def test_CircularRing():
     transducer = levitate.transducers.CircularRing(effective_radius=3e-3)
     expected_result = np.array([-12.47473964 + 6.98912884j, -1.39288579 + 0.58702665j])